@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+洗练记录（SQLite）
+每次洗练一行：时间戳、命中的主词条模板、主词条/T阶得分、各阶段耗时、判定结果。
+写入在后台线程中按批次合并为一个事务（executemany），洗练循环只做一次 queue.put，不会卡在磁盘上。
+
+查询：
+    python attempt_journal.py stats                 # 各模板命中率 + 成功所需次数分布
+    python attempt_journal.py stats --db other.sqlite3
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+from frame_corpus import DECISION_MAIN_ONLY, DECISION_SUCCESS
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "attempt_journal.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      TEXT PRIMARY KEY,
+    source      TEXT,
+    started     REAL,
+    ended       REAL,
+    result      TEXT,
+    attempts    INTEGER,
+    config      TEXT
+);
+CREATE TABLE IF NOT EXISTS attempts (
+    run_id      TEXT,
+    attempt     INTEGER,
+    ts          REAL,
+    template    TEXT,
+    main_score  REAL,
+    tier_score  REAL,
+    decision    INTEGER,   -- 与 frame_corpus 相同：0 未匹配 / 1 仅主词条 / 2 成功
+    latency_ms  REAL,      -- 整次洗练耗时
+    stages      TEXT       -- 各阶段耗时 JSON {阶段: 毫秒}
+);
+CREATE INDEX IF NOT EXISTS idx_attempts_run ON attempts(run_id);
+CREATE INDEX IF NOT EXISTS idx_attempts_template ON attempts(template);
+"""
+
+_STOP = object()
+
+
+class AttemptJournal:
+    def __init__(self, db_path=DEFAULT_DB, batch_size=200, flush_interval=0.5):
+        """
+        :param batch_size: 每个事务最多写入的行数
+        :param flush_interval: 没攒够一批时最多等待的秒数
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+
+        # 建表在调用线程完成，保证之后的查询可用
+        conn = sqlite3.connect(db_path)
+        conn.executescript(_SCHEMA)
+        conn.close()
+
+        self._thread = threading.Thread(target=self._writer, name="attempt-journal", daemon=True)
+        self._thread.start()
+
+    # ---------- 写入（调用方线程，只入队） ----------
+    def start_run(self, config=None, source="live"):
+        run_id = uuid.uuid4().hex
+        cfg = json.dumps(config or {}, ensure_ascii=False, default=str)
+        self._queue.put(("run", (run_id, source, time.time(), cfg)))
+        return run_id
+
+    def record_attempt(self, run_id, attempt, template, main_score, tier_score, decision,
+                       latency_ms=None, stages=None, ts=None):
+        self._queue.put(("attempt", (
+            run_id, attempt, time.time() if ts is None else ts, template,
+            float(main_score), float(tier_score), int(decision), latency_ms,
+            json.dumps(stages, separators=(",", ":")) if stages else None,
+        )))
+
+    def end_run(self, run_id, result, attempts):
+        self._queue.put(("end", (time.time(), result, attempts, run_id)))
+
+    def close(self, timeout=5.0):
+        """写完队列中剩余的记录后关闭"""
+        if self._thread.is_alive():
+            self._queue.put((_STOP, None))
+            self._thread.join(timeout)
+
+    # ---------- 后台写入线程 ----------
+    def _writer(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        stop = False
+        while not stop:
+            kind, row = self._queue.get()
+            batch = [(kind, row)]
+            deadline = time.monotonic() + self.flush_interval
+            # 攒一批：直到够数、超时或收到停止信号
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            if any(k is _STOP for k, _ in batch):
+                stop = True
+            self._flush(conn, [(k, r) for k, r in batch if k is not _STOP])
+        conn.close()
+
+    def _flush(self, conn, batch):
+        if not batch:
+            return
+        runs = [r for k, r in batch if k == "run"]
+        attempts = [r for k, r in batch if k == "attempt"]
+        ends = [r for k, r in batch if k == "end"]
+        try:
+            with conn:
+                if runs:
+                    conn.executemany("INSERT INTO runs (run_id, source, started, config) VALUES (?, ?, ?, ?)", runs)
+                if attempts:
+                    conn.executemany("INSERT INTO attempts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", attempts)
+                if ends:
+                    conn.executemany("UPDATE runs SET ended = ?, result = ?, attempts = ? WHERE run_id = ?", ends)
+            self.written += len(attempts)
+            self.batches += 1
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"⚠️ 洗练记录写入失败: {e}")
+
+
+# ==================== 查询 ====================
+def template_hit_rates(db_path=DEFAULT_DB, source=None):
+    """
+    各模板命中情况：[(模板, 主词条命中次数, 成功次数, 主词条命中率, 命中后T阶成功率)]
+    主词条命中率 = 该模板命中次数 / 全部洗练次数
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        where, args = "", ()
+        if source:
+            where, args = "WHERE run_id IN (SELECT run_id FROM runs WHERE source = ?)", (source,)
+        total = conn.execute(f"SELECT COUNT(*) FROM attempts {where}", args).fetchone()[0]
+        rows = conn.execute(f"""
+            SELECT template,
+                   COUNT(*),
+                   SUM(decision = {DECISION_SUCCESS})
+            FROM attempts
+            {where + ' AND' if where else 'WHERE'} decision IN ({DECISION_MAIN_ONLY}, {DECISION_SUCCESS})
+            GROUP BY template ORDER BY COUNT(*) DESC
+        """, args).fetchall()
+    finally:
+        conn.close()
+    return [(tpl, hits, succ, hits / total if total else 0.0, succ / hits if hits else 0.0)
+            for tpl, hits, succ in rows]
+
+
+def attempts_to_success(db_path=DEFAULT_DB, source=None):
+    """成功的各次运行所用的洗练次数列表（按运行开始时间排序）"""
+    conn = sqlite3.connect(db_path)
+    try:
+        sql = "SELECT attempts FROM runs WHERE result = '成功' AND attempts IS NOT NULL"
+        args = ()
+        if source:
+            sql += " AND source = ?"
+            args = (source,)
+        return [r[0] for r in conn.execute(sql + " ORDER BY started", args)]
+    finally:
+        conn.close()
+
+
+def run_outcomes(db_path=DEFAULT_DB):
+    """[(结果, 运行次数, 平均洗练次数)]"""
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COALESCE(result, '未结束'), COUNT(*), AVG(attempts) FROM runs GROUP BY result").fetchall()
+    finally:
+        conn.close()
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0
+    k = min(len(sorted_values) - 1, max(0, int(round(q / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+
+def print_stats(db_path=DEFAULT_DB, source=None):
+    print(f"📒 {db_path}")
+    for result, n, avg in run_outcomes(db_path):
+        print(f"  运行 {result}: {n} 次，平均洗练 {avg or 0:.1f} 次")
+    print("🎯 各模板命中率:")
+    for tpl, hits, succ, rate, tier_rate in template_hit_rates(db_path, source):
+        print(f"  {tpl}: 命中 {hits} 次 ({rate * 100:.2f}%) | T阶成功 {succ} 次 ({tier_rate * 100:.1f}%)")
+    values = sorted(attempts_to_success(db_path, source))
+    if values:
+        print(f"🏁 成功所需洗练次数（{len(values)} 次运行）: 最少 {values[0]} | p50 {_percentile(values, 50)}"
+              f" | p90 {_percentile(values, 90)} | 最多 {values[-1]}")
+        # 简单直方图（按 2 的幂分桶）
+        buckets = {}
+        for v in values:
+            b = 1
+            while b < v:
+                b *= 2
+            buckets[b] = buckets.get(b, 0) + 1
+        for b in sorted(buckets):
+            print(f"  ≤{b:>6}: {'█' * buckets[b]} {buckets[b]}")
+    else:
+        print("🏁 暂无成功的运行记录")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="洗练记录查询")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_stats = sub.add_parser("stats", help="命中率与成功次数分布")
+    p_stats.add_argument("--db", default=DEFAULT_DB)
+    p_stats.add_argument("--source", help="只统计某个来源（live / replay）")
+    args = parser.parse_args()
+    print_stats(args.db, args.source)
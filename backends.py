@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+"""
+输入 / 截图后端
+洗练循环只通过这两个接口操作游戏，便于替换为离线回放用的假游戏（见 replay_harness.py）。
+
+输入后端接口：move_to(x, y, duration=0.0), click(), right_click(), key_down(key), key_up(key), press(key)
+截图后端接口：grab(region) -> RGB numpy 数组，region 为 (x, y, w, h)
+
+固定的操作序列（如“移到装备 → 左键”）可用 compile_sequence() 预编译一次，之后每次 play() 按精确的事件间隔重放。
+XTestInput 直接通过 X11 XTest 扩展注入事件（Linux / Xvfb，需要 python-xlib），没有 PyAutoGUI 的逐次调用开销和 PAUSE。
+
+    python backends.py timing            # 用记录假后端检查序列重放的间隔误差（无需显示器）
+    python backends.py bench --n 200     # 在 X11 / Xvfb 下对比 PyAutoGUI 与 XTest 的点击往返延迟
+"""
+
+import functools
+import time
+
+import numpy as np
+
+from deadline_timer import DEFAULT_TIMER
+
+try:
+    import pyautogui
+except ImportError:
+    pyautogui = None
+
+try:
+    from Xlib import X, XK, display as xdisplay
+    from Xlib.ext import xtest
+except ImportError:
+    xdisplay = None
+
+
+class CompiledSequence:
+    """预编译的输入序列：[(相对起点的偏移 ns, 无参可调用对象)]"""
+
+    def __init__(self, actions):
+        self.actions = actions
+        self.last_offsets_ns = []   # 最近一次 play() 中每个动作的实际发出时间（相对起点）
+
+    def play(self, timer=None):
+        """
+        按编译时的间隔依次发出（粗睡眠 + 自旋到每个绝对时刻），返回起点时间（perf_counter_ns）
+        :param timer: deadline_timer.DeadlineTimer，None 使用默认实例
+        """
+        timer = DEFAULT_TIMER if timer is None else timer
+        offsets = []
+        t0 = time.perf_counter_ns()
+        for offset, action in self.actions:
+            if offset:
+                timer.wait_until(t0 + offset)
+            offsets.append(time.perf_counter_ns() - t0)
+            action()
+        self.last_offsets_ns = offsets
+        return t0
+
+    def __len__(self):
+        return len(self.actions)
+
+
+def _step_offsets(steps):
+    """steps: [(与上一步的间隔秒, 方法名, *参数)] → [(偏移 ns, 方法名, 参数元组)]"""
+    out = []
+    offset = 0
+    for step in steps:
+        delay, op, args = step[0], step[1], tuple(step[2:])
+        offset += int(round(delay * 1e9))
+        out.append((offset, op, args))
+    return out
+
+
+def compile_sequence(backend, steps):
+    """
+    把操作序列编译为 CompiledSequence。后端自带 compile() 时（XTestInput）使用其预解析的底层事件，
+    否则绑定后端方法（PyAutoGUIInput、FakeGame、RecordingInput 等）。
+    :param steps: 例如 [(0, "move_to", x, y), (0, "click"), (0.1, "key_down", "alt")]
+    """
+    if hasattr(backend, "compile"):
+        return backend.compile(steps)
+    return CompiledSequence([(offset, functools.partial(getattr(backend, op), *args))
+                             for offset, op, args in _step_offsets(steps)])
+
+
+class PyAutoGUIInput:
+    """基于 PyAutoGUI 的输入后端（默认）"""
+
+    def __init__(self):
+        if pyautogui is None:
+            raise RuntimeError("请安装 pyautogui: pip install pyautogui")
+
+    def move_to(self, x, y, duration=0.0):
+        pyautogui.moveTo(x, y, duration=duration)
+
+    def click(self):
+        pyautogui.click()
+
+    def right_click(self):
+        pyautogui.rightClick()
+
+    def key_down(self, key):
+        pyautogui.keyDown(key)
+
+    def key_up(self, key):
+        pyautogui.keyUp(key)
+
+    def press(self, key):
+        pyautogui.press(key)
+
+
+class XTestInput:
+    """
+    直接通过 XTest 扩展注入输入事件（Linux / X11，含 Xvfb）。
+    move_to 为瞬移；每次调用只 flush 一次，不做 PyAutoGUI 的安全检查和 PAUSE 等待。
+    """
+
+    KEY_ALIASES = {
+        "alt": "Alt_L", "shift": "Shift_L", "ctrl": "Control_L", "enter": "Return",
+        "esc": "Escape", "space": "space", "tab": "Tab", "backspace": "BackSpace",
+    }
+
+    def __init__(self, display_name=None):
+        if xdisplay is None:
+            raise RuntimeError("XTest 后端需要 python-xlib: pip install python-xlib")
+        self.display = xdisplay.Display(display_name)
+        if not self.display.has_extension("XTEST"):
+            raise RuntimeError("X 服务器不支持 XTEST 扩展")
+        self._keycodes = {}
+
+    def keycode(self, key):
+        code = self._keycodes.get(key)
+        if code is None:
+            name = self.KEY_ALIASES.get(key.lower(), key)
+            if len(name) > 1 and name[0] in "fF" and name[1:].isdigit():
+                name = name.upper()
+            keysym = XK.string_to_keysym(name)
+            code = self.display.keysym_to_keycode(keysym) if keysym else 0
+            if not code:
+                raise ValueError(f"无法映射按键: {key}")
+            self._keycodes[key] = code
+        return code
+
+    def _events(self, op, args):
+        """把一个操作展开为底层事件 [(事件类型, detail, x, y)]"""
+        if op == "move_to":
+            return [(X.MotionNotify, 0, int(args[0]), int(args[1]))]
+        if op in ("click", "right_click"):
+            button = 1 if op == "click" else 3
+            return [(X.ButtonPress, button, 0, 0), (X.ButtonRelease, button, 0, 0)]
+        if op == "key_down":
+            return [(X.KeyPress, self.keycode(args[0]), 0, 0)]
+        if op == "key_up":
+            return [(X.KeyRelease, self.keycode(args[0]), 0, 0)]
+        if op == "press":
+            code = self.keycode(args[0])
+            return [(X.KeyPress, code, 0, 0), (X.KeyRelease, code, 0, 0)]
+        raise ValueError(f"未知操作: {op}")
+
+    def _send(self, events):
+        for event_type, detail, x, y in events:
+            if event_type == X.MotionNotify:
+                xtest.fake_input(self.display, event_type, x=x, y=y)
+            else:
+                xtest.fake_input(self.display, event_type, detail)
+        self.display.flush()
+
+    def compile(self, steps):
+        """同一时刻的步骤合并为一组，整组注入后只 flush 一次"""
+        groups = []
+        for offset, op, args in _step_offsets(steps):
+            if groups and groups[-1][0] == offset:
+                groups[-1][1].extend(self._events(op, args))
+            else:
+                groups.append((offset, self._events(op, args)))
+        return CompiledSequence([(offset, functools.partial(self._send, events)) for offset, events in groups])
+
+    def move_to(self, x, y, duration=0.0):
+        self._send(self._events("move_to", (x, y)))
+
+    def click(self):
+        self._send(self._events("click", ()))
+
+    def right_click(self):
+        self._send(self._events("right_click", ()))
+
+    def key_down(self, key):
+        self._send(self._events("key_down", (key,)))
+
+    def key_up(self, key):
+        self._send(self._events("key_up", (key,)))
+
+    def press(self, key):
+        self._send(self._events("press", (key,)))
+
+
+class RecordingInput:
+    """记录每次调用及其时间的假输入后端；可包装另一个后端并透传"""
+
+    def __init__(self, inner=None):
+        self.inner = inner
+        self.events = []    # [(perf_counter_ns, 方法名, 参数元组)]
+
+    def _record(self, op, *args):
+        self.events.append((time.perf_counter_ns(), op, args))
+        if self.inner is not None:
+            getattr(self.inner, op)(*args)
+
+    def move_to(self, x, y, duration=0.0):
+        self._record("move_to", x, y)
+
+    def click(self):
+        self._record("click")
+
+    def right_click(self):
+        self._record("right_click")
+
+    def key_down(self, key):
+        self._record("key_down", key)
+
+    def key_up(self, key):
+        self._record("key_up", key)
+
+    def press(self, key):
+        self._record("press", key)
+
+    def ops(self):
+        return [(op,) + args for _, op, args in self.events]
+
+    def intervals_ms(self):
+        ts = [t for t, _, _ in self.events]
+        return [(b - a) / 1e6 for a, b in zip(ts, ts[1:])]
+
+    def clear(self):
+        self.events.clear()
+
+
+def make_input(name="pyautogui"):
+    """按名称创建输入后端：pyautogui / xtest"""
+    if name == "xtest":
+        return XTestInput()
+    if name == "pyautogui":
+        return PyAutoGUIInput()
+    raise ValueError(f"未知输入后端: {name}")
+
+
+class PyAutoGUICapture:
+    """基于 pyautogui.screenshot 的区域截图后端（默认）"""
+
+    def __init__(self):
+        if pyautogui is None:
+            raise RuntimeError("请安装 pyautogui: pip install pyautogui")
+
+    def grab(self, region):
+        return np.array(pyautogui.screenshot(region=tuple(region)))
+
+
+# ==================== 基准 ====================
+def timing_check(repeats=200, gaps=(0.0, 0.0005, 0.002, 0.01)):
+    """用 RecordingInput 重放带间隔的序列，返回每个间隔的实际误差统计（微秒）"""
+    rec = RecordingInput()
+    steps = [(0, "move_to", 10, 10), (0, "click")]
+    steps += [(gap, "key_down" if i % 2 == 0 else "key_up", "alt") for i, gap in enumerate(gaps)]
+    seq = compile_sequence(rec, steps)
+    expected = np.cumsum([s[0] for s in steps]) * 1e6
+    errors = []
+    for _ in range(repeats):
+        rec.clear()
+        seq.play()
+        errors.append(np.asarray(seq.last_offsets_ns) / 1e3 - expected)
+    err = np.abs(np.vstack(errors))
+    return {f"{s[1]}@{s[0] * 1000:g}ms": (float(np.median(e)), float(np.percentile(e, 99)))
+            for s, e in zip(steps, err.T)}
+
+
+def bench_click_roundtrip(n=200):
+    """
+    在当前 X 显示（真实 X11 或 Xvfb）上创建一个探测窗口，
+    测量从注入“移动 + 左键”到窗口收到 ButtonRelease 的往返时间。
+    """
+    if xdisplay is None:
+        raise RuntimeError("需要 python-xlib")
+    probe = xdisplay.Display()
+    screen = probe.screen()
+    win = screen.root.create_window(
+        0, 0, 400, 400, 0, screen.root_depth,
+        override_redirect=True,
+        event_mask=X.ButtonPressMask | X.ButtonReleaseMask | X.StructureNotifyMask,
+    )
+    win.map()
+    probe.sync()
+    while probe.next_event().type != X.MapNotify:
+        pass
+
+    def roundtrip(backend_click, count):
+        samples = []
+        for i in range(count):
+            x, y = 50 + (i % 10) * 30, 50 + (i // 10 % 10) * 30
+            t0 = time.perf_counter_ns()
+            backend_click(x, y)
+            while True:
+                ev = probe.next_event()
+                if ev.type == X.ButtonRelease:
+                    break
+            samples.append((time.perf_counter_ns() - t0) / 1e6)
+        return np.asarray(samples)
+
+    results = {}
+    saved_pause = pyautogui.PAUSE
+    try:
+        gui = PyAutoGUIInput()
+        for pause in (0.1, 0.0):    # 0.1 为 script.py 中的设置
+            pyautogui.PAUSE = pause
+            count = max(5, n // 10) if pause else n
+            results[f"pyautogui PAUSE={pause}"] = roundtrip(lambda x, y: (gui.move_to(x, y), gui.click()), count)
+    finally:
+        pyautogui.PAUSE = saved_pause
+
+    xt = XTestInput()
+    results["xtest"] = roundtrip(lambda x, y: (xt.move_to(x, y), xt.click()), n)
+    compiled = {}
+
+    def play_compiled(x, y):
+        seq = compiled.get((x, y))
+        if seq is None:
+            seq = compiled[(x, y)] = compile_sequence(xt, [(0, "move_to", x, y), (0, "click")])
+        seq.play()
+    for i in range(100):  # 预编译，不计入耗时
+        play_compiled(50 + (i % 10) * 30, 50 + (i // 10 % 10) * 30)
+        while probe.next_event().type != X.ButtonRelease:
+            pass
+    results["xtest compiled"] = roundtrip(play_compiled, n)
+
+    win.destroy()
+    probe.close()
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="输入后端基准")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_timing = sub.add_parser("timing", help="序列重放的间隔误差（无需显示器）")
+    p_timing.add_argument("--repeats", type=int, default=200)
+    p_bench = sub.add_parser("bench", help="点击往返延迟（需要 X11 / Xvfb）")
+    p_bench.add_argument("--n", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.cmd == "timing":
+        print(f"{'步骤':<22}{'误差p50us':>12}{'误差p99us':>12}")
+        for name, (p50, p99) in timing_check(args.repeats).items():
+            print(f"{name:<22}{p50:>12.1f}{p99:>12.1f}")
+    else:
+        print(f"{'后端':<24}{'次数':>6}{'平均ms':>10}{'p50ms':>10}{'p95ms':>10}")
+        for name, ms in bench_click_roundtrip(args.n).items():
+            print(f"{name:<24}{len(ms):>6}{ms.mean():>10.3f}{np.median(ms):>10.3f}{np.percentile(ms, 95):>10.3f}")
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+装备截图缓存管理（equipment_cache）
+功能：
+1. 启动时扫描一次缓存目录，建立内存索引（每个前缀一个 deque），之后不再 listdir / getmtime。
+2. 按数量和总字节数双重上限淘汰最旧的缓存。
+3. 可选编码器：快速 PNG、默认 PNG、原始 .npy、JPEG（仅用于预览）。
+4. 保留按前缀区分的命名空间（如 equip_mods_xxx.png）。
+每次保存只有一次写文件操作，加上被淘汰文件的删除操作。
+"""
+
+import os
+import re
+import datetime
+import threading
+from collections import deque
+
+import cv2
+import numpy as np
+
+# 编码器：名称 -> (扩展名, cv2.imwrite 参数)；npy 直接写原始数组
+ENCODERS = {
+    "png_fast": (".png", [cv2.IMWRITE_PNG_COMPRESSION, 1]),
+    "png": (".png", [cv2.IMWRITE_PNG_COMPRESSION, 3]),
+    "npy": (".npy", None),
+    "jpg": (".jpg", [cv2.IMWRITE_JPEG_QUALITY, 80]),
+}
+
+# 文件名格式：{prefix}_{YYYYmmdd_HHMMSS_ffffff}{ext}
+_CACHE_NAME_RE = re.compile(r"^(?P<prefix>.+)_(?P<ts>\d{8}_\d{6}_\d{6})(?P<ext>\.png|\.npy|\.jpg)$")
+
+
+def load_cached_image(path):
+    """读取缓存文件（PNG/JPG/NPY），返回 BGR 或灰度 numpy 数组，失败返回 None"""
+    if path.endswith(".npy"):
+        try:
+            return np.load(path)
+        except Exception:
+            return None
+    return cv2.imread(path, cv2.IMREAD_UNCHANGED)
+
+
+class CacheManager:
+    def __init__(self, cache_dir, max_entries=10, max_bytes=50 * 1024 * 1024, encoder="png_fast"):
+        """
+        :param cache_dir: 缓存目录
+        :param max_entries: 每个前缀最多保留的文件数
+        :param max_bytes: 每个前缀最多占用的字节数
+        :param encoder: 默认编码器名称，见 ENCODERS
+        """
+        if encoder not in ENCODERS:
+            raise ValueError(f"未知的缓存编码器: {encoder}")
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.encoder = encoder
+
+        # 前缀 -> deque[(文件名, 字节数)]，按时间从旧到新
+        self._index = {}
+        self._bytes = {}
+        self._lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._build_index()
+
+    def _build_index(self):
+        """启动时扫描一次目录，按文件名中的时间戳排序建立索引"""
+        found = {}
+        for name in os.listdir(self.cache_dir):
+            m = _CACHE_NAME_RE.match(name)
+            if not m:
+                continue
+            try:
+                size = os.path.getsize(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            found.setdefault(m.group("prefix"), []).append((m.group("ts"), name, size))
+
+        for prefix, items in found.items():
+            items.sort()
+            self._index[prefix] = deque((name, size) for _, name, size in items)
+            self._bytes[prefix] = sum(size for _, _, size in items)
+            self._evict(prefix)
+
+    def _evict(self, prefix):
+        """
+        淘汰最旧的文件，直到数量和字节数都不超过上限（调用方持有锁）。
+        最新的一个（save 刚写入的）始终保留，即使它本身就超过 max_bytes，保证 save 返回的路径存在。
+        """
+        entries = self._index[prefix]
+        while len(entries) > 1 and (len(entries) > self.max_entries or self._bytes[prefix] > self.max_bytes):
+            oldest_name, oldest_size = entries.popleft()
+            self._bytes[prefix] -= oldest_size
+            try:
+                os.remove(os.path.join(self.cache_dir, oldest_name))
+                print(f"🗑️ 已删除旧缓存: {oldest_name}")
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"⚠️ 删除缓存文件失败: {e}")
+
+    def save(self, image, prefix="equip", encoder=None):
+        """保存图片到缓存并按上限淘汰，返回文件路径；编码失败返回 None"""
+        encoder = encoder or self.encoder
+        ext, params = ENCODERS[encoder]
+
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        filename = f"{prefix}_{timestamp}{ext}"
+        filepath = os.path.join(self.cache_dir, filename)
+
+        if params is None:
+            with open(filepath, "wb") as f:
+                np.save(f, np.ascontiguousarray(image))
+                size = f.tell()
+        else:
+            ok, buf = cv2.imencode(ext, image, params)
+            if not ok:
+                return None
+            with open(filepath, "wb") as f:
+                f.write(buf.tobytes())
+            size = len(buf)
+
+        with self._lock:
+            if prefix not in self._index:
+                self._index[prefix] = deque()
+                self._bytes[prefix] = 0
+            self._index[prefix].append((filename, size))
+            self._bytes[prefix] += size
+            self._evict(prefix)
+
+        return filepath
+
+    def entries(self, prefix):
+        """返回某个前缀下的缓存文件路径（从旧到新）"""
+        with self._lock:
+            return [os.path.join(self.cache_dir, name) for name, _ in self._index.get(prefix, ())]
+
+    def prefixes(self):
+        with self._lock:
+            return list(self._index.keys())
+
+    def stats(self):
+        """返回 {前缀: (文件数, 字节数)}"""
+        with self._lock:
+            return {p: (len(e), self._bytes[p]) for p, e in self._index.items()}
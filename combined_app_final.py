@@ -2,56 +2,50 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, filedialog
 import threading
+import queue
 import time
 import cv2
-import numpy as np
 import pyautogui
 from PIL import ImageGrab, Image, ImageTk
 import json
 import os
 import sys
-import datetime
+
+from cache_manager import CacheManager
+from backends import PyAutoGUICapture, make_input
+from reforge_engine import ReforgeEngine, preprocess_image, load_and_preprocess_template
+from frame_corpus import DECISION_MISS
+from latency_trace import SpanTracer, export_trace
+from monitor_process import MonitorProcess
+from attempt_journal import AttemptJournal
 
 # 缓存相关常量
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 CACHE_DIR = os.path.join(SCRIPT_DIR, "equipment_cache")
-MAX_CACHE_SIZE = 10  # 最多保留10次缓存
-
-def save_to_cache(image, prefix="equip"):
-    """保存图片到缓存文件夹，并维护最近10次缓存"""
-    print(f"[DEBUG] save_to_cache called with prefix={prefix}, image shape={image.shape if hasattr(image, 'shape') else 'N/A'}")
-    
-    # 确保缓存目录存在
-    os.makedirs(CACHE_DIR, exist_ok=True)
-    print(f"[DEBUG] Cache directory: {CACHE_DIR}")
-    
-    # 生成带时间戳的文件名
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-    filename = f"{prefix}_{timestamp}.png"
-    filepath = os.path.join(CACHE_DIR, filename)
-    print(f"[DEBUG] Saving to: {filepath}")
-    
-    # 保存图片
-    result = cv2.imwrite(filepath, image)
-    print(f"[DEBUG] cv2.imwrite result: {result}")
-    
-    # 获取缓存目录中的所有文件
-    cache_files = sorted(
-        [f for f in os.listdir(CACHE_DIR) if f.startswith(prefix) and f.endswith(".png")],
-        key=lambda x: os.path.getmtime(os.path.join(CACHE_DIR, x))
-    )
-    
-    # 如果超过最大缓存数量，删除最旧的文件
-    while len(cache_files) > MAX_CACHE_SIZE:
-        oldest_file = cache_files.pop(0)
-        oldest_path = os.path.join(CACHE_DIR, oldest_file)
-        try:
-            os.remove(oldest_path)
-            print(f"🗑️ 已删除旧缓存: {oldest_file}")
-        except Exception as e:
-            print(f"⚠️ 删除缓存文件失败: {e}")
-    
-    return filepath
+MAX_CACHE_SIZE = 10  # 每个前缀最多保留10次缓存
+MAX_CACHE_BYTES = 50 * 1024 * 1024  # 每个前缀最多占用 50MB
+CACHE_ENCODER = "png_fast"  # 可选: png_fast / png / npy / jpg
+CORPUS_ROOT = os.path.join(SCRIPT_DIR, "reforge_corpus")  # 录制语料目录，按属性区域尺寸分子目录
+TRACE_DIR = os.path.join(SCRIPT_DIR, "traces")  # 耗时追踪导出目录
+JOURNAL_DB = os.path.join(SCRIPT_DIR, "attempt_journal.sqlite3")  # 洗练记录数据库
+MONITOR_POLL_MS = 100  # 界面读取监控进程读数 / 事件的间隔
+INPUT_BACKEND = "pyautogui"  # 可选: pyautogui / xtest（Linux X11，需要 python-xlib，无逐次调用的 PAUSE）
+
+_cache_manager = None
+
+
+def get_cache_manager():
+    """获取全局缓存管理器（首次调用时扫描一次缓存目录建立索引）"""
+    global _cache_manager
+    if _cache_manager is None:
+        _cache_manager = CacheManager(CACHE_DIR, max_entries=MAX_CACHE_SIZE,
+                                      max_bytes=MAX_CACHE_BYTES, encoder=CACHE_ENCODER)
+    return _cache_manager
+
+
+def save_to_cache(image, prefix="equip", encoder=None):
+    """保存图片到缓存文件夹，并按数量/字节上限维护最近的缓存"""
+    return get_cache_manager().save(image, prefix=prefix, encoder=encoder)
 
 # 导入keyboard和pynput库，如果不存在则提示安装
 try:
@@ -109,6 +103,7 @@ class CombinedApp:
 
         # HP 设置
         self.hp_key = tk.StringVar(value=config.get("hp_key", "1"))
+        self.hp_fallback_key = tk.StringVar(value=config.get("hp_fallback_key", ""))
         self.hp_threshold = tk.DoubleVar(value=float(config.get("hp_threshold", 35.0)))
         self.disable_hp = tk.BooleanVar(value=config.get("disable_hp", False))
         self.enable_hp_timer = tk.BooleanVar(value=config.get("enable_hp_timer", False))
@@ -117,6 +112,7 @@ class CombinedApp:
 
         # MP 设置
         self.mp_key = tk.StringVar(value=config.get("mp_key", "2"))
+        self.mp_fallback_key = tk.StringVar(value=config.get("mp_fallback_key", ""))
         self.mp_threshold = tk.DoubleVar(value=float(config.get("mp_threshold", 35.0)))
         self.disable_mp = tk.BooleanVar(value=config.get("disable_mp", False))
         self.enable_mp_timer = tk.BooleanVar(value=config.get("enable_mp_timer", False))
@@ -125,11 +121,25 @@ class CombinedApp:
 
         # 全局设置
         self.check_interval = tk.DoubleVar(value=float(config.get("check_interval", 0.3)))
+        self.trace_monitor = tk.BooleanVar(value=bool(config.get("trace_monitor", False)))
+        # 无有效血条 / 满血不变多少秒后降为探测频率（0 关闭）
+        self.idle_after = tk.DoubleVar(value=float(config.get("idle_after", 5.0)))
+        self.idle_interval = tk.DoubleVar(value=float(config.get("idle_interval", 1.0)))
+        # HP / MP 各自的采样间隔（0 表示与检测间隔相同）
+        self.hp_interval = tk.DoubleVar(value=float(config.get("hp_interval") or 0.0))
+        self.mp_interval = tk.DoubleVar(value=float(config.get("mp_interval") or 0.0))
         self.is_monitoring = False
-        self.monitor_thread = None
+        self.monitor_proc = None
+        self.config_error = None        # 上一次配置下发失败的信息（同一错误只记一次日志）
 
         self.current_hp = tk.StringVar(value="--%")
         self.current_mp = tk.StringVar(value="--%")
+        self.current_regions = tk.StringVar(value="")
+
+        # 额外监控区域（能量护盾、药瓶充能、增益图标等），只在配置文件中编辑，见 flask_monitor.py
+        self.extra_regions = config.get("regions", []) or []
+        # 药瓶槽（空瓶 / 药效生效中时跳过按键），同样只在配置文件中编辑
+        self.flask_slots = config.get("flasks", []) or []
 
         # 手动区域（直接存储为 (x, y, w, h)）
         hp_region_data = config.get("hp_region", None)
@@ -172,6 +182,30 @@ class CombinedApp:
             "alt_screenshot_delay": tk.DoubleVar(value=float(config.get("alt_screenshot_delay", 0.0))),
             "loop_random_max": tk.DoubleVar(value=float(config.get("loop_random_max", 0.02))),
         }
+        self.record_corpus = tk.BooleanVar(value=bool(config.get("record_corpus", False)))
+        self.trace_reforge = tk.BooleanVar(value=bool(config.get("trace_reforge", False)))
+        self.journal_reforge = tk.BooleanVar(value=bool(config.get("journal_reforge", True)))
+
+        # 洗练工作线程：取消事件由 F12 全局热键和停止按钮置位，进度/日志经队列回到界面线程
+        self.reforge_thread = None
+        self.reforge_cancel = threading.Event()
+        self.reforge_queue = queue.Queue()
+        self.reforge_hotkey = None
+        self.reforge_main_hits = 0
+        self.reforge_progress = tk.StringVar(value="")
+
+        # 启动时建立一次缓存索引，洗练过程中保存缓存不再扫描目录
+        try:
+            get_cache_manager()
+        except Exception as e:
+            print(f"⚠️ 缓存索引建立失败: {e}")
+
+        # 洗练记录（后台线程批量写入 SQLite）
+        self.attempt_journal = None
+        try:
+            self.attempt_journal = AttemptJournal(JOURNAL_DB)
+        except Exception as e:
+            print(f"⚠️ 洗练记录数据库打开失败: {e}")
 
         # weizhi相关变量
         self.screenshot_path = None
@@ -222,24 +256,36 @@ class CombinedApp:
         ttk.Label(pct_frame, textvariable=self.current_hp, font=("Arial", 10, "bold"), foreground="red").pack(side=tk.LEFT, padx=5)
         ttk.Label(pct_frame, text="蓝量:").pack(side=tk.LEFT, padx=(20, 0))
         ttk.Label(pct_frame, textvariable=self.current_mp, font=("Arial", 10, "bold"), foreground="blue").pack(side=tk.LEFT, padx=5)
+        ttk.Label(flask_frame, textvariable=self.current_regions, foreground="gray").pack(anchor=tk.W)
 
         # HP 配置
         hp_frame = ttk.LabelFrame(flask_frame, text="🩸 生命药水", padding=8)
         hp_frame.pack(fill=tk.X, pady=5)
         self.create_potion_ui(hp_frame, self.hp_key, self.hp_threshold,
-                              self.disable_hp, self.enable_hp_timer, self.hp_timer_interval)
+                              self.disable_hp, self.enable_hp_timer, self.hp_timer_interval, self.hp_fallback_key)
 
         # MP 配置
         mp_frame = ttk.LabelFrame(flask_frame, text="💧 魔法药水", padding=8)
         mp_frame.pack(fill=tk.X, pady=5)
         self.create_potion_ui(mp_frame, self.mp_key, self.mp_threshold,
-                              self.disable_mp, self.enable_mp_timer, self.mp_timer_interval)
+                              self.disable_mp, self.enable_mp_timer, self.mp_timer_interval, self.mp_fallback_key)
 
         # 全局选项
         opt_frame = ttk.Frame(flask_frame)
         opt_frame.pack(fill=tk.X, pady=10)
         ttk.Label(opt_frame, text="检测间隔(秒):").pack(side=tk.LEFT)
         ttk.Spinbox(opt_frame, from_=0.1, to=1.0, increment=0.1, textvariable=self.check_interval, width=6).pack(side=tk.LEFT, padx=5)
+        ttk.Label(opt_frame, text="空闲降频(秒):").pack(side=tk.LEFT, padx=(20, 0))
+        ttk.Spinbox(opt_frame, from_=0, to=60, increment=1, textvariable=self.idle_after, width=5).pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(opt_frame, text="⏱️ 记录耗时追踪", variable=self.trace_monitor).pack(side=tk.LEFT, padx=(20, 0))
+
+        rate_frame = ttk.Frame(flask_frame)
+        rate_frame.pack(fill=tk.X, pady=(0, 10))
+        ttk.Label(rate_frame, text="HP 采样间隔(秒):").pack(side=tk.LEFT)
+        ttk.Spinbox(rate_frame, from_=0, to=2.0, increment=0.05, textvariable=self.hp_interval, width=6).pack(side=tk.LEFT, padx=5)
+        ttk.Label(rate_frame, text="MP 采样间隔(秒):").pack(side=tk.LEFT, padx=(20, 0))
+        ttk.Spinbox(rate_frame, from_=0, to=2.0, increment=0.05, textvariable=self.mp_interval, width=6).pack(side=tk.LEFT, padx=5)
+        ttk.Label(rate_frame, text="（0 = 同检测间隔）", foreground="gray").pack(side=tk.LEFT)
 
         io_frame = ttk.Frame(flask_frame)
         io_frame.pack(fill=tk.X, pady=5)
@@ -353,12 +399,34 @@ class CombinedApp:
             ttk.Entry(frame, textvariable=self.delay_vars[key], width=8).grid(row=row, column=1, sticky=tk.W)
             row += 1
 
-        self.start_btn = ttk.Button(
-            frame,
+        ttk.Checkbutton(frame, text="📼 录制属性区域截图语料（用于离线分析/回放）",
+                        variable=self.record_corpus).grid(row=row, column=0, columnspan=3, sticky=tk.W, pady=(5, 0))
+        row += 1
+        ttk.Checkbutton(frame, text="⏱️ 记录每次洗练的阶段耗时（导出 Chrome trace / CSV）",
+                        variable=self.trace_reforge).grid(row=row, column=0, columnspan=3, sticky=tk.W)
+        row += 1
+        ttk.Checkbutton(frame, text="📒 写入洗练记录（python attempt_journal.py stats 查看命中率）",
+                        variable=self.journal_reforge).grid(row=row, column=0, columnspan=3, sticky=tk.W)
+        row += 1
+
+        reforge_btn_frame = ttk.Frame(frame)
+        reforge_btn_frame.grid(row=row, column=0, columnspan=3, pady=10)
+        self.reforge_start_btn = ttk.Button(
+            reforge_btn_frame,
             text="🚀 开始极速洗练（主词条+T阶图标匹配）",
             command=self.start_reforge
         )
-        self.start_btn.grid(row=row, column=0, columnspan=3, pady=10, ipadx=15, ipady=6)
+        self.reforge_start_btn.pack(side=tk.LEFT, padx=5, ipadx=15, ipady=6)
+        self.reforge_stop_btn = ttk.Button(
+            reforge_btn_frame,
+            text="⏹ 停止（F12）",
+            command=self.stop_reforge,
+            state=tk.DISABLED
+        )
+        self.reforge_stop_btn.pack(side=tk.LEFT, padx=5, ipady=6)
+
+        row += 1
+        ttk.Label(frame, textvariable=self.reforge_progress).grid(row=row, column=0, columnspan=3, sticky=tk.W)
 
         # 添加洗练日志区域
         row += 1
@@ -436,11 +504,13 @@ class CombinedApp:
         self.canvas_result.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
 
     # === Flask功能相关方法 ===
-    def create_potion_ui(self, parent, key_var, thresh_var, disable_var, timer_var, timer_interval_var):
+    def create_potion_ui(self, parent, key_var, thresh_var, disable_var, timer_var, timer_interval_var, fallback_var):
         row1 = ttk.Frame(parent)
         row1.pack(fill=tk.X, pady=2)
         ttk.Label(row1, text="按键:").pack(side=tk.LEFT)
         ttk.Entry(row1, textvariable=key_var, width=6).pack(side=tk.LEFT, padx=5)
+        ttk.Label(row1, text="备用键:").pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Entry(row1, textvariable=fallback_var, width=6).pack(side=tk.LEFT, padx=5)
         ttk.Label(row1, text="阈值(%):").pack(side=tk.LEFT, padx=(10, 0))
         ttk.Spinbox(row1, from_=1, to=100, textvariable=thresh_var, width=6).pack(side=tk.LEFT, padx=5)
 
@@ -525,180 +595,70 @@ class CombinedApp:
             self.mp_region_label.config(text=f"({r[0]},{r[1]}) {r[2]}x{r[3]}")
             self.log("✅ 蓝条区域已设")
 
-    def calculate_percentage_from_strip(self, img):
-        """
-        自动检测红色或绿色血条，返回最高填充百分比。
-        img: RGB 格式的 numpy 数组 (H, W, 3)
-        """
-        if img.size == 0 or img.shape[0] < 10 or img.shape[1] < 3:
-            return None
-
-        hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV)
-
-        # 红色掩码
-        lower_red1 = np.array([0, 70, 60])
-        upper_red1 = np.array([20, 255, 255])
-        lower_red2 = np.array([160, 70, 60])
-        upper_red2 = np.array([180, 255, 255])
-        mask_red = cv2.bitwise_or(
-            cv2.inRange(hsv, lower_red1, upper_red1),
-            cv2.inRange(hsv, lower_red2, upper_red2)
-        )
-
-        # 绿色掩码
-        lower_green = np.array([40, 70, 60])
-        upper_green = np.array([80, 255, 255])
-        mask_green = cv2.inRange(hsv, lower_green, upper_green)
-
-        # 合并掩码（用于去噪）
-        combined_mask = cv2.bitwise_or(mask_red, mask_green)
-
-        kernel = np.ones((2, 2), np.uint8)
-        combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_CLOSE, kernel)
-        combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_OPEN, kernel)
-
-        h, w = combined_mask.shape
-        colored_rows = np.where(np.any(combined_mask > 0, axis=1))[0]
-
-        if len(colored_rows) == 0:
-            return 0.0
-
-        top_most_colored_row = np.min(colored_rows)
-        filled_height = h - top_most_colored_row
-        percentage = (filled_height / h) * 100
-        return max(0.0, min(100.0, percentage))
-
-    def is_valid_bar(self, img):
-        """判断图像是否包含有效的红或绿血条"""
-        hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV)
-
-        mask_red1 = cv2.inRange(hsv, np.array([0, 50, 40]), np.array([25, 255, 255]))
-        mask_red2 = cv2.inRange(hsv, np.array([150, 50, 40]), np.array([180, 255, 255]))
-        mask_red = cv2.bitwise_or(mask_red1, mask_red2)
-
-        mask_green = cv2.inRange(hsv, np.array([40, 50, 40]), np.array([80, 255, 255]))
-
-        combined = cv2.bitwise_or(mask_red, mask_green)
-        total = combined.size
-        colored = cv2.countNonZero(combined)
-        return (colored / total) > 0.1
-
-    def calculate_percentage_from_strip_blue(self, img):
-        """计算蓝条百分比"""
-        if img.size == 0 or img.shape[0] < 10 or img.shape[1] < 3:
-            return None
-        hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV)
-        lower = np.array([90, 70, 60])
-        upper = np.array([140, 255, 255])
-        mask = cv2.inRange(hsv, lower, upper)
-        kernel = np.ones((2, 2), np.uint8)
-        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
-        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
-        h, w = mask.shape
-        colored_rows = np.where(np.any(mask > 0, axis=1))[0]
-        if len(colored_rows) == 0:
-            return 0.0
-        top_most = np.min(colored_rows)
-        filled = h - top_most
-        return max(0.0, min(100.0, (filled / h) * 100))
-
-    def is_valid_bar_blue(self, img):
-        """判断蓝条是否有效"""
-        hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV)
-        mask = cv2.inRange(hsv, np.array([80, 50, 40]), np.array([150, 255, 255]))
-        total = mask.size
-        colored = cv2.countNonZero(mask)
-        return (colored / total) > 0.1
-
-    def monitor_loop(self):
-        """监控循环"""
-        while self.is_monitoring:
-            try:
-                current_hp_val = None
-                current_mp_val = None
-                now = time.time()
-
-                screen = np.array(ImageGrab.grab())
-
-                # HP（自动支持红/绿）
-                if self.hp_region:
-                    x, y, w, h = self.hp_region
-                    if x + w <= screen.shape[1] and y + h <= screen.shape[0]:
-                        hp_img = screen[y:y + h, x:x + w]
-                        if self.is_valid_bar(hp_img):
-                            current_hp_val = self.calculate_percentage_from_strip(hp_img)
-                            self.current_hp.set(f"{current_hp_val:.1f}%")
-                        else:
-                            self.current_hp.set("--%")
-                            current_hp_val = None
-                    else:
-                        self.current_hp.set("--%")
-                else:
-                    self.current_hp.set("--%")
-
-                # MP（仅蓝色）
-                if self.mp_region:
-                    x, y, w, h = self.mp_region
-                    if x + w <= screen.shape[1] and y + h <= screen.shape[0]:
-                        mp_img = screen[y:y + h, x:x + w]
-                        if self.is_valid_bar_blue(mp_img):
-                            current_mp_val = self.calculate_percentage_from_strip_blue(mp_img)
-                            self.current_mp.set(f"{current_mp_val:.1f}%")
-                        else:
-                            self.current_mp.set("--%")
-                            current_mp_val = None
-                    else:
-                        self.current_mp.set("--%")
-                else:
-                    self.current_mp.set("--%")
-
-                # 喝药逻辑
-                if current_hp_val is not None and not self.disable_hp.get() and current_hp_val < self.hp_threshold.get():
-                    pyautogui.press(self.hp_key.get())
-                    self.log(f"🩸 HP {current_hp_val:.1f}% → 按 '{self.hp_key.get()}'")
-
-                if current_mp_val is not None and not self.disable_mp.get() and current_mp_val < self.mp_threshold.get():
-                    pyautogui.press(self.mp_key.get())
-                    self.log(f"💧 MP {current_mp_val:.1f}% → 按 '{self.mp_key.get()}'")
-
-                # 定时喝药
-                if current_hp_val is not None and not self.disable_hp.get() and self.enable_hp_timer.get():
-                    if now - self.last_hp_timer >= self.hp_timer_interval.get():
-                        pyautogui.press(self.hp_key.get())
-                        self.log(f"⏱️ 定时喝 HP（每 {self.hp_timer_interval.get()}s）")
-                        self.last_hp_timer = now
-
-                if current_mp_val is not None and not self.disable_mp.get() and self.enable_mp_timer.get():
-                    if now - self.last_mp_timer >= self.mp_timer_interval.get():
-                        pyautogui.press(self.mp_key.get())
-                        self.log(f"⏱️ 定时喝 MP（每 {self.mp_timer_interval.get()}s）")
-                        self.last_mp_timer = now
-
-                time.sleep(self.check_interval.get())
-
-            except Exception as e:
-                self.log(f"⚠️ 异常: {e}")
-                time.sleep(1)
-
     def start_monitoring(self):
-        """开始监控"""
-        if not self.hp_region and not self.mp_region:
+        """开始监控（独立进程截图、按键，界面只下发配置和显示读数）"""
+        if not self.hp_region and not self.mp_region and not self.extra_regions:
             messagebox.showwarning("警告", "请先设置血条或蓝条区域！")
             return
+        try:
+            self.monitor_proc = MonitorProcess(self.get_config(), input_backend=INPUT_BACKEND,
+                                               trace=self.trace_monitor.get(), trace_dir=TRACE_DIR)
+            self.monitor_proc.start()
+        except Exception as e:
+            self.monitor_proc = None
+            messagebox.showerror("错误", f"监控进程启动失败: {e}")
+            return
         self.is_monitoring = True
         self.start_btn.config(state=tk.DISABLED)
         self.stop_btn.config(state=tk.NORMAL)
-        self.log("▶ 开始监控")
-        self.monitor_thread = threading.Thread(target=self.monitor_loop, daemon=True)
-        self.monitor_thread.start()
+        self.log("▶ 开始监控（独立进程）")
+        self.root.after(MONITOR_POLL_MS, self.poll_monitor)
+
+    def poll_monitor(self):
+        """界面线程定时：下发配置变更，读取读数和事件"""
+        proc = self.monitor_proc
+        if not self.is_monitoring or proc is None:
+            return
+        try:
+            config = self.get_config()
+        except tk.TclError:
+            config = None       # 数值输入框正在编辑、暂时为空，本轮不下发
+        if config is not None:
+            try:
+                proc.update_config(config)
+                self.config_error = None
+            except Exception as e:
+                if str(e) != self.config_error:
+                    self.config_error = str(e)
+                    self.log(f"⚠️ 配置下发失败: {e}")
+        readings = proc.readings()
+        if readings is not None and readings["tick"]:
+            self.current_hp.set("--%" if readings["hp"] is None else f"{readings['hp']:.1f}%")
+            self.current_mp.set("--%" if readings["mp"] is None else f"{readings['mp']:.1f}%")
+            if self.extra_regions:
+                self.current_regions.set(" | ".join(
+                    f"{r.get('name', '?')}: {'--' if v is None else f'{v:.2f}'}"
+                    for r, v in zip(self.extra_regions, readings["regions"])))
+        for _, _, _, _, msg in proc.events():
+            self.log(msg)
+        if not proc.is_alive():
+            self.log("❌ 监控进程已退出")
+            self.stop_monitoring()
+            return
+        self.root.after(MONITOR_POLL_MS, self.poll_monitor)
 
     def stop_monitoring(self):
         """停止监控"""
         self.is_monitoring = False
+        if self.monitor_proc is not None:
+            for _, _, _, _, msg in self.monitor_proc.stop():
+                self.log(msg)
+            self.monitor_proc = None
         self.start_btn.config(state=tk.NORMAL)
         self.stop_btn.config(state=tk.DISABLED)
         self.current_hp.set("--%")
         self.current_mp.set("--%")
+        self.current_regions.set("")
         self.log("⏹ 已停止")
 
     def get_config(self):
@@ -707,18 +667,26 @@ class CombinedApp:
             "hp_region": self.hp_region,
             "mp_region": self.mp_region,
             "hp_key": self.hp_key.get(),
+            "hp_fallback_key": self.hp_fallback_key.get(),
             "hp_threshold": self.hp_threshold.get(),
             "disable_hp": self.disable_hp.get(),
             "enable_hp_timer": self.enable_hp_timer.get(),
             "hp_timer_interval": self.hp_timer_interval.get(),
 
             "mp_key": self.mp_key.get(),
+            "mp_fallback_key": self.mp_fallback_key.get(),
             "mp_threshold": self.mp_threshold.get(),
             "disable_mp": self.disable_mp.get(),
             "enable_mp_timer": self.enable_mp_timer.get(),
             "mp_timer_interval": self.mp_timer_interval.get(),
 
             "check_interval": self.check_interval.get(),
+            "idle_after": self.idle_after.get(),
+            "idle_interval": self.idle_interval.get(),
+            "hp_interval": self.hp_interval.get() or None,
+            "mp_interval": self.mp_interval.get() or None,
+            "regions": self.extra_regions,
+            "flasks": self.flask_slots,
         }
 
     def set_config(self, cfg):
@@ -726,18 +694,26 @@ class CombinedApp:
         self.hp_region = cfg.get("hp_region")
         self.mp_region = cfg.get("mp_region")
         self.hp_key.set(cfg.get("hp_key", "1"))
+        self.hp_fallback_key.set(cfg.get("hp_fallback_key", ""))
         self.hp_threshold.set(cfg.get("hp_threshold", 35.0))
         self.disable_hp.set(cfg.get("disable_hp", False))
         self.enable_hp_timer.set(cfg.get("enable_hp_timer", False))
         self.hp_timer_interval.set(cfg.get("hp_timer_interval", 5.0))
 
         self.mp_key.set(cfg.get("mp_key", "2"))
+        self.mp_fallback_key.set(cfg.get("mp_fallback_key", ""))
         self.mp_threshold.set(cfg.get("mp_threshold", 35.0))
         self.disable_mp.set(cfg.get("disable_mp", False))
         self.enable_mp_timer.set(cfg.get("enable_mp_timer", False))
         self.mp_timer_interval.set(cfg.get("mp_timer_interval", 8.0))
 
         self.check_interval.set(cfg.get("check_interval", 0.3))
+        self.idle_after.set(cfg.get("idle_after", 5.0))
+        self.idle_interval.set(cfg.get("idle_interval", 1.0))
+        self.hp_interval.set(cfg.get("hp_interval") or 0.0)
+        self.mp_interval.set(cfg.get("mp_interval") or 0.0)
+        self.extra_regions = cfg.get("regions", []) or []
+        self.flask_slots = cfg.get("flasks", []) or []
 
         # 更新 UI 显示
         if self.hp_region:
@@ -878,49 +854,16 @@ class CombinedApp:
 
     def preprocess_image(self, img):
         """预处理图像"""
-        if len(img.shape) == 3:
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        else:
-            gray = img.copy()
-        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        return binary
+        return preprocess_image(img)
 
     def load_and_preprocess_template(self, path):
         """加载并预处理模板"""
-        template = cv2.imread(path, cv2.IMREAD_COLOR)
-        if template is None:
-            raise ValueError(f"无法加载模板: {path}")
-        return self.preprocess_image(template)
-
-    def match_main_and_get_template(self, screen_gray, templates_with_path, threshold, attempt_num):
-        """匹配主词条并获取最佳模板"""
-        self.reforge_log(f"\n🔄 第 {attempt_num} 次洗练 - 主词条匹配:")
-        best_score = -1
-        best_template = None
-        best_path = None
-        best_loc = None
-        for path, template in templates_with_path:
-            h_tpl, w_tpl = template.shape[:2]
-            h_scr, w_scr = screen_gray.shape
-            if h_tpl > h_scr or w_tpl > w_scr:
-                self.reforge_log(f" ❌ 模板 {os.path.basename(path)}: 尺寸过大（跳过）")
-                continue
-            res = cv2.matchTemplate(screen_gray, template, cv2.TM_CCOEFF_NORMED)
-            _, max_val, _, max_loc = cv2.minMaxLoc(res)
-            status = "✅" if max_val >= threshold else "❌"
-            self.reforge_log(f" 🔍 {os.path.basename(path)}: 得分={max_val:.4f} → {status}")
-            if max_val >= threshold and max_val > best_score:
-                best_score = max_val
-                best_template = template
-                best_path = path
-                best_loc = max_loc
-        if best_template is not None:
-            self.reforge_log(f" 🎯 主词条匹配成功！模板: {os.path.basename(best_path)} | 得分={best_score:.4f} | 位置={best_loc}")
-            return True, best_template, best_path, best_loc, best_score
-        return False, None, None, None, -1
+        return load_and_preprocess_template(path)
 
     def start_reforge(self):
         """开始洗练"""
+        if self.reforge_thread is not None and self.reforge_thread.is_alive():
+            return
         if not self.main_template_paths:
             messagebox.showwarning("错误", "请添加主词条模板！", parent=self.root)
             return
@@ -948,6 +891,10 @@ class CombinedApp:
                 "LOOP_RANDOM_MAX": self.delay_vars["loop_random_max"].get(),
                 "MAIN_TEMPLATE_PATHS": self.main_template_paths.copy(),
                 "TIER_TEMPLATE_PATH": self.tier_template_path,
+                "RECORD_CORPUS": self.record_corpus.get(),
+                "CORPUS_DIR": os.path.join(CORPUS_ROOT, f"{mod_region[2]}x{mod_region[3]}"),
+                "TRACE": self.trace_reforge.get(),
+                "JOURNAL": self.journal_reforge.get(),
             }
 
             # 保存配置
@@ -961,6 +908,9 @@ class CombinedApp:
                 **{k: v.get() for k, v in self.delay_vars.items()},
                 "main_template_paths": self.main_template_paths,
                 "tier_template_path": self.tier_template_path,
+                "record_corpus": self.record_corpus.get(),
+                "trace_reforge": self.trace_reforge.get(),
+                "journal_reforge": self.journal_reforge.get(),
             }
             try:
                 with open(EQUIPMENT_CONFIG_FILE, 'w', encoding='utf-8') as f:
@@ -968,9 +918,7 @@ class CombinedApp:
             except Exception as e:
                 print(f"⚠️ 配置保存失败: {e}")
 
-            self.root.withdraw()
-            self.run_reforge(config)
-            self.root.deiconify()
+            self.launch_reforge(config)
 
         except Exception as e:
             if self.root.winfo_exists():
@@ -978,175 +926,102 @@ class CombinedApp:
             else:
                 print(f"\n❌ 启动失败: {e}")
 
-    def run_reforge(self, config):
-        """运行洗练"""
-        self.reforge_log("\n" + "="*70)
-        self.reforge_log("⚡ 极速洗练启动（主词条 + 右侧T阶图标匹配 | 整行搜索）")
-        self.reforge_log("🛑 按 F12 可随时中断洗练（返回主界面）")
-        self.reforge_log("="*70)
-        time.sleep(0.1)  # 减少初始延迟
-
-        # 加载主词条模板
-        main_templates_with_path = [
-            (path, self.load_and_preprocess_template(path))
-            for path in config["MAIN_TEMPLATE_PATHS"]
-        ]
-
-        # 加载T阶模板
-        tier_template = self.load_and_preprocess_template(config["TIER_TEMPLATE_PATH"])
-        h_tier, w_tier = tier_template.shape
-
-        orb_x, orb_y = config["REFORGE_ORB_POS"]
-        equip_x, equip_y = config["TARGET_EQUIP_POS"]
-        x, y, w, h = config["MOD_DISPLAY_REGION"]
-        main_thresh = config["MAIN_THRESHOLD"]
-        tier_thresh = config["TIER_THRESHOLD"]
-        max_attempts = config["MAX_ATTEMPTS"]
-        equip_click_delay = config["EQUIP_CLICK_DELAY"]
-        orb_delay = config["ORB_DELAY"]
-
-        pyautogui.moveTo(orb_x, orb_y, duration=0.03)
-        pyautogui.rightClick()
-        time.sleep(orb_delay)
-        pyautogui.keyDown('shift')
-
-        success = False
-        attempt = 0
+    def launch_reforge(self, config):
+        """在工作线程中启动洗练，界面线程只负责轮询队列"""
+        self.reforge_cancel.clear()
+        self.reforge_main_hits = 0
+        self.reforge_progress.set("")
+        if keyboard is not None:
+            try:
+                self.reforge_hotkey = keyboard.add_hotkey('f12', self.reforge_cancel.set)
+            except Exception as e:
+                self.reforge_hotkey = None
+                self.reforge_log(f"⚠️ F12 热键注册失败，只能用停止按钮中断: {e}")
+        self.reforge_start_btn.config(state=tk.DISABLED)
+        self.reforge_stop_btn.config(state=tk.NORMAL)
+        self.reforge_thread = threading.Thread(target=self.run_reforge, args=(config,),
+                                               name="reforge", daemon=True)
+        self.reforge_thread.start()
+        self.root.after(50, self.poll_reforge_queue)
+
+    def stop_reforge(self):
+        """停止按钮：置位取消事件，工作线程在当前阶段结束时退出"""
+        self.reforge_cancel.set()
+        self.reforge_stop_btn.config(state=tk.DISABLED)
 
+    def run_reforge(self, config):
+        """运行洗练（工作线程）"""
+        post = self.reforge_queue.put
+        log = lambda msg: post(("log", msg))
+        tracer = SpanTracer("reforge") if config.get("TRACE") else None
         try:
-            print(f"[DEBUG] 开始洗练循环，最大尝试次数: {max_attempts}")
-            while attempt < max_attempts:
-                if keyboard and keyboard.is_pressed('f12'):
-                    self.reforge_log("\n⏸️ 用户按下 F12，洗练已中断。")
-                    break
-
-                attempt += 1
-                print(f"[DEBUG] 第 {attempt} 次尝试")
-                # 减少鼠标移动时间，提高速度
-                pyautogui.moveTo(equip_x, equip_y, duration=0.01)
-                pyautogui.click()
-                # 减少点击后延迟，但保留最小值以确保游戏响应
-                time.sleep(max(equip_click_delay * 0.7, 0.1))
-
-                pyautogui.keyDown('alt')
-                raw_screenshot = pyautogui.screenshot(region=(x, y, w, h))
-                pyautogui.keyUp('alt')
-
-                # 保存原始截图为numpy数组（BGR格式）
-                raw_img_bgr = cv2.cvtColor(np.array(raw_screenshot), cv2.COLOR_RGB2BGR)
-                # 直接转换为灰度图像，跳过BGR转换步骤
-                raw_img_gray = cv2.cvtColor(np.array(raw_screenshot), cv2.COLOR_RGB2GRAY)
-                screen_gray = self.preprocess_image(raw_img_gray)
-
-                # === 第1步：主词条匹配 ===
-                main_matched, matched_main_tpl, matched_main_path, match_loc, score = self.match_main_and_get_template(
-                    screen_gray, main_templates_with_path, main_thresh, attempt
-                )
-
-                print(f"[DEBUG] 主词条匹配结果: {main_matched}")
-                if not main_matched:
-                    # 初始化变量，避免后续代码出错
-                    matched_main_tpl = None
-                    match_loc = (0, 0)
-                    score = 0.0
-                
-                # === 第2步：在右侧整行区域匹配T阶图标 ===
-                # 只有主词条匹配成功才进行T阶匹配
-                tier_matched = False
-                max_val_tier = 0.0
-                search_x_start = 0
-                search_y_start = 0
-
-                # 初始化屏幕尺寸变量，避免后续引用未定义变量
-                h_scr, w_scr = screen_gray.shape
-
-                # 初始化主词条相关变量，避免后续引用未定义变量
-                h_main, w_main = 0, 0
-                x_main, y_main = 0, 0
-
-                if main_matched:
-                    print(f"[DEBUG] 主词条匹配成功，准备进行T阶匹配")
-                    h_main, w_main = matched_main_tpl.shape
-                    x_main, y_main = match_loc
-                else:
-                    print(f"[DEBUG] 主词条未匹配，跳过T阶匹配")
-
-                if main_matched:
-                    search_x_start = x_main + w_main
-                search_x_end = w_scr
-                search_y_start = y_main
-                search_y_end = y_main + h_main
-
-                print(f"[DEBUG] T阶匹配区域: search_x_start={search_x_start}, search_x_end={search_x_end}, search_y_start={search_y_start}, search_y_end={search_y_end}")
-                print(f"[DEBUG] T阶模板尺寸: h_tier={h_tier}, w_tier={w_tier}")
-                
-                tier_matched = False
-                if search_x_start < search_x_end and search_y_end <= h_scr:
-                    if h_tier <= (search_y_end - search_y_start) and w_tier <= (search_x_end - search_x_start):
-                        search_region = screen_gray[search_y_start:search_y_end, search_x_start:search_x_end]
-                        res_tier = cv2.matchTemplate(search_region, tier_template, cv2.TM_CCOEFF_NORMED)
-                        _, max_val_tier, _, _ = cv2.minMaxLoc(res_tier)
-                        self.reforge_log(f" 🔍 T阶图标匹配得分: {max_val_tier:.4f} | 阈值: {tier_thresh:.2f}")
-                        print(f"[DEBUG] T阶匹配得分: {max_val_tier:.4f}, 阈值: {tier_thresh:.2f}")
-                        tier_matched = max_val_tier >= tier_thresh
-                        print(f"[DEBUG] T阶匹配结果: {tier_matched}")
-                    else:
-                        self.reforge_log(" ⚠️ T阶模板大于右侧可用区域")
-                        print(f"[DEBUG] T阶模板大于右侧可用区域")
-                else:
-                    self.reforge_log(" ⚠️ 主词条右侧无有效搜索区域")
-                    print(f"[DEBUG] 主词条右侧无有效搜索区域")
+            engine = ReforgeEngine(
+                config,
+                inputs=make_input(INPUT_BACKEND),
+                capture=PyAutoGUICapture(),
+                log=log,
+                cancel=self.reforge_cancel,
+                progress=lambda attempt, total, decision: post(("progress", attempt, total, decision)),
+                save_cache=save_to_cache,
+                debug=True,
+                tracer=tracer,
+                journal=self.attempt_journal if config.get("JOURNAL") else None,
+            )
+            result, attempts = engine.run()
+            log(engine.timer.format_stats())
+            if tracer is not None and len(tracer):
+                self.export_tracer(tracer, "reforge", log)
+            post(("done", result, attempts))
+        except Exception as e:
+            post(("error", str(e)))
 
-                # 在图片上标记识别结果
-                result_img = raw_img_bgr.copy()
-                
-                # 标记主词条匹配结果
-                if main_matched:
-                    # 在主词条位置画绿色矩形框
-                    cv2.rectangle(result_img, match_loc, 
-                                 (match_loc[0] + matched_main_tpl.shape[1], match_loc[1] + matched_main_tpl.shape[0]),
-                                 (0, 255, 0), 2)
-                    # 添加主词条得分文本
-                    cv2.putText(result_img, f"Main: {score:.2f}", 
-                              (match_loc[0], match_loc[1] - 10),
-                              cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-                
-                # 标记T阶匹配结果（不管成功还是失败都显示）
-                if main_matched:  # 只有主词条匹配成功才显示T阶结果
-                    # 根据匹配结果选择颜色：成功用绿色，失败用红色
-                    color = (0, 255, 0) if tier_matched else (0, 0, 255)
-                    # 在T阶位置画矩形框
-                    cv2.rectangle(result_img, (search_x_start, search_y_start),
-                                 (search_x_start + w_tier, search_y_start + h_tier),
-                                 color, 2)
-                    # 添加T阶得分文本
-                    cv2.putText(result_img, f"Tier: {max_val_tier:.2f}",
-                              (search_x_start, search_y_start - 10),
-                              cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
-                
-                # 保存带识别结果的图片
-                try:
-                    cache_path = save_to_cache(result_img, prefix="equip_mods")
-                    print(f"[DEBUG] 装备词条已缓存到: {cache_path}")
-                except Exception as e:
-                    print(f"[DEBUG] 缓存保存失败: {e}")
-                
-                if tier_matched:
-                    self.reforge_log(" ✅ 主词条 + T阶图标均匹配成功！洗练成功！")
-                    success = True
-                    break
+    def poll_reforge_queue(self):
+        """界面线程：取出工作线程的日志和进度，合并为一次刷新"""
+        lines = []
+        finished = None
+        try:
+            while True:
+                item = self.reforge_queue.get_nowait()
+                kind = item[0]
+                if kind == "log":
+                    lines.append(item[1])
+                elif kind == "progress":
+                    _, attempt, total, decision = item
+                    if decision != DECISION_MISS:
+                        self.reforge_main_hits += 1
+                    self.reforge_progress.set(f"进度: {attempt} / {total} | 主词条命中 {self.reforge_main_hits} 次")
                 else:
-                    self.reforge_log(" ⚠️ T阶图标未匹配，跳过本次结果")
-
-                time.sleep(0.001)  # 大幅减少循环延迟
+                    finished = item
+        except queue.Empty:
+            pass
+        if lines:
+            self.reforge_log(*lines)
+
+        if finished is None:
+            self.root.after(50, self.poll_reforge_queue)
+            return
 
-        finally:
-            pyautogui.keyUp('shift')
+        if self.reforge_hotkey is not None:
+            try:
+                keyboard.remove_hotkey(self.reforge_hotkey)
+            except Exception:
+                pass
+            self.reforge_hotkey = None
+        self.reforge_start_btn.config(state=tk.NORMAL)
+        self.reforge_stop_btn.config(state=tk.DISABLED)
+        if finished[0] == "done":
+            messagebox.showinfo("洗练结束", f"{finished[1]}！共 {finished[2]} 次。", parent=self.root)
+        else:
+            messagebox.showerror("洗练失败", finished[1], parent=self.root)
 
-        result = "成功" if success else "已中断" if (keyboard and keyboard.is_pressed('f12')) else "已达上限"
-        msg = f"{result}！共 {attempt} 次。"
-        self.reforge_log(f"\n🏁 {msg}")
-        messagebox.showinfo("洗练结束", msg)
+    def export_tracer(self, tracer, prefix, log):
+        """输出各阶段 p50/p95/p99 并导出 Chrome trace / CSV"""
+        log("⏱️ 阶段耗时统计:\n" + tracer.format_summary())
+        try:
+            path = export_trace(tracer, TRACE_DIR, prefix)
+            log(f"💾 耗时追踪已导出: {path}（及同名 .csv）")
+        except Exception as e:
+            log(f"⚠️ 耗时追踪导出失败: {e}")
 
     # === weizhi功能相关方法 ===
     def weizhi_log(self, msg):
@@ -1342,21 +1217,30 @@ class CombinedApp:
             # 保存flask配置
             flask_config = {
                 "hp_key": self.hp_key.get(),
+                "hp_fallback_key": self.hp_fallback_key.get(),
                 "hp_threshold": self.hp_threshold.get(),
                 "disable_hp": self.disable_hp.get(),
                 "enable_hp_timer": self.enable_hp_timer.get(),
                 "hp_timer_interval": self.hp_timer_interval.get(),
 
                 "mp_key": self.mp_key.get(),
+                "mp_fallback_key": self.mp_fallback_key.get(),
                 "mp_threshold": self.mp_threshold.get(),
                 "disable_mp": self.disable_mp.get(),
                 "enable_mp_timer": self.enable_mp_timer.get(),
                 "mp_timer_interval": self.mp_timer_interval.get(),
 
                 "check_interval": self.check_interval.get(),
+                "trace_monitor": self.trace_monitor.get(),
+                "idle_after": self.idle_after.get(),
+                "idle_interval": self.idle_interval.get(),
+                "hp_interval": self.hp_interval.get() or None,
+                "mp_interval": self.mp_interval.get() or None,
 
                 "hp_region": list(self.hp_region) if self.hp_region else None,
-                "mp_region": list(self.mp_region) if self.mp_region else None
+                "mp_region": list(self.mp_region) if self.mp_region else None,
+                "regions": self.extra_regions,
+                "flasks": self.flask_slots
             }
 
             with open(FLASK_CONFIG_FILE, 'w', encoding='utf-8') as f:
@@ -1384,7 +1268,10 @@ class CombinedApp:
                 
                 # 模板路径
                 "main_template_paths": self.main_template_paths,
-                "tier_template_path": self.tier_template_path
+                "tier_template_path": self.tier_template_path,
+                "record_corpus": self.record_corpus.get(),
+                "trace_reforge": self.trace_reforge.get(),
+                "journal_reforge": self.journal_reforge.get(),
             }
             
             with open(EQUIPMENT_CONFIG_FILE, 'w', encoding='utf-8') as f:
@@ -1394,16 +1281,29 @@ class CombinedApp:
         except Exception as e:
             print(f"⚠️ 洗练配置保存失败: {e}")
 
+        if self.monitor_proc is not None:
+            self.monitor_proc.stop()
+            self.monitor_proc = None
+
+        # 先停止洗练线程（松开按键），再写完剩余的洗练记录
+        if self.reforge_thread is not None and self.reforge_thread.is_alive():
+            self.reforge_cancel.set()
+            self.reforge_thread.join(2.0)
+        if self.attempt_journal is not None:
+            self.attempt_journal.close()
+
         # 关闭窗口
         self.root.destroy()
 
-    def reforge_log(self, msg):
-        """添加洗练日志消息"""
+    def reforge_log(self, *msgs):
+        """添加洗练日志消息（只能在界面线程调用；可一次传入多条，合并为一次插入）"""
         # 同时输出到控制台和UI
-        print(msg)
+        for msg in msgs:
+            print(msg)
         if hasattr(self, 'reforge_log_text') and self.reforge_log_text.winfo_exists():
+            stamp = time.strftime('%H:%M:%S')
             self.reforge_log_text.config(state=tk.NORMAL)
-            self.reforge_log_text.insert(tk.END, f"[{time.strftime('%H:%M:%S')}] {msg}\n")
+            self.reforge_log_text.insert(tk.END, "".join(f"[{stamp}] {msg}\n" for msg in msgs))
             self.reforge_log_text.see(tk.END)
             self.reforge_log_text.config(state=tk.DISABLED)
 
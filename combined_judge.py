@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+图文一次判断：截图和预期描述一起发给多模态模型，一次往返同时拿回判断结果和识别出的文字
+原流程每次尝试两次网络往返：MultiModalConversation 识别文字，再 Generation 判断。
+这里的回复格式：
+    第一行：满足 / 不满足（llm_verdict.parse_verdict 解析）
+    其余行：图片中的全部文字（写入 OCR 缓存、供本地预筛学习词缀行）
+预期描述能编译为规则时本地判断已经只有一次往返（OCR），不需要这个模式。
+
+    messages = build_messages(image_uri, "有投射物技能等级加成，而且至少 +3")
+    verdict, text = parse_reply(reply)
+
+用一组录制的截图（同名 .txt 为参考文本，可选）比较两种流程的单次尝试延迟和判断一致率：
+    python combined_judge.py bench --pairs recorded/ --expect "至少 +3 投射物技能等级"
+不填 --url 时在本进程启动 mock_dashscope 替身服务。
+"""
+
+import os
+import time
+
+import numpy as np
+
+import glyph_ocr
+import llm_verdict
+import ocr_payload
+
+OCR_PROMPT = "请精确识别图片中的所有中文和英文文字，包括数字和符号。只输出识别出的文字内容，不要添加任何额外的说明或格式。"
+
+
+def build_prompt(expected_description):
+    return (f"图片是《流放之路》装备的属性面板。用户预期：{expected_description}\n"
+            f"第一行只写“满足”或“不满足”：装备完全满足预期的所有要求才算满足，量化要求必须严格遵守。\n"
+            f"从第二行起逐行写出图片中的全部文字（含数字和符号），不要添加任何其他说明或格式。")
+
+
+def build_messages(image_uri, expected_description):
+    return [{"role": "user", "content": [{"image": image_uri}, {"text": build_prompt(expected_description)}]}]
+
+
+def reply_text(response):
+    """多模态响应 → 文本（content 为列表时拼接各 text 部分）"""
+    content = response.output.choices[0]["message"]["content"]
+    if isinstance(content, list):
+        return "".join(item["text"] + "\n" for item in content if item.get("text"))
+    return content
+
+
+def parse_reply(text):
+    """
+    :return: (判断 True / False / None, 识别出的文字)
+    判断行最多 8 个字（允许“判断：满足”这类写法）；第一行不是判断时（模型把顺序写反）再看最后一行
+    """
+    lines = [line for line in (text or "").strip().splitlines() if line.strip()]
+    if not lines:
+        return None, ""
+    verdict = llm_verdict.parse_verdict(lines[0].strip("*#：: "))
+    if verdict is not None and len(lines[0].strip("*#：: ")) <= 8:
+        return verdict, "\n".join(lines[1:])
+    verdict = llm_verdict.parse_verdict(lines[-1].strip("*#：: "))
+    if verdict is not None and len(lines[-1].strip("*#：: ")) <= 8:
+        return verdict, "\n".join(lines[:-1])
+    return None, "\n".join(lines)
+
+
+# ==================== 压测 ====================
+def bench(items, expectations, url, ocr_model="qwen-vl-plus", judge_model="qwen-turbo", variant="binary"):
+    """
+    每张截图 × 每条预期描述：
+    - 两次调用：OCR（ocr_model）→ 流式判断（judge_model，与 script.py 的 LLM_STREAM 相同）
+    - 一次调用：图文一次判断（ocr_model）
+    :param items: [(名称, RGB 数组, 参考文本或 None)]
+    :return: 输出行列表
+    """
+    import dashscope_client
+
+    client = dashscope_client.PooledClient(base_url=url, hedge=False)
+    two, one = [], []
+    agree = unparsed = compared = 0
+    text_acc = []
+    try:
+        for name, image, reference in items:
+            uri, _ = ocr_payload.data_uri(image, variant)
+            for expectation in expectations:
+                t0 = time.perf_counter()
+                resp = client.multimodal(ocr_model, [{"role": "user", "content": [{"image": uri}, {"text": OCR_PROMPT}]}])
+                ocr_text = reply_text(resp) if resp.status_code == 200 else ""
+                prompt = f"装备属性文本:\n{ocr_text}\n用户预期描述:\n{expectation}\n{llm_verdict.ANSWER_RULE}"
+                expected, _, _ = llm_verdict.stream_verdict(client.generation_stream(
+                    judge_model, prompt, max_tokens=llm_verdict.VERDICT_MAX_TOKENS, temperature=0.0))
+                two.append(time.perf_counter() - t0)
+
+                t0 = time.perf_counter()
+                resp = client.multimodal(ocr_model, build_messages(uri, expectation))
+                verdict, text = parse_reply(reply_text(resp)) if resp.status_code == 200 else (None, "")
+                one.append(time.perf_counter() - t0)
+
+                compared += 1
+                agree += verdict is not None and verdict == expected
+                unparsed += verdict is None
+                target = reference if reference is not None else ocr_text
+                if target:
+                    text_acc.append(glyph_ocr.char_accuracy(text, target))
+    finally:
+        client.close()
+    lines = [f"{len(items)} 张截图 × {len(expectations)} 条预期 = {compared} 次尝试"]
+    for label, lat in (("两次调用（OCR → 流式判断）", two), ("一次调用（图文一次判断）", one)):
+        ms = np.asarray(lat) * 1000
+        p50, p95 = np.percentile(ms, [50, 95])
+        lines.append(f"{label}: 单次尝试 p50 {p50:.0f}ms p95 {p95:.0f}ms 平均 {ms.mean():.0f}ms")
+    lines.append(f"判断一致 {agree}/{compared}，一次调用无法解析 {unparsed} 次")
+    if text_acc:
+        lines.append(f"一次调用识别文字的字符准确率 {np.mean(text_acc):.2%}"
+                     f"（对照{'参考文本' if any(r is not None for _, _, r in items) else '两次调用的 OCR 结果'}）")
+    return lines
+
+
+def main():
+    import argparse
+
+    import mock_dashscope
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="图文一次判断")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_bench = sub.add_parser("bench", help="两次调用 vs 一次调用：延迟和判断一致率")
+    p_bench.add_argument("--image", action="append", help="截图（同名 .txt 为参考文本，可选）")
+    p_bench.add_argument("--pairs", help="录制的截图 + 参考文本目录")
+    p_bench.add_argument("--expect", action="append", help="预期描述，可多次指定")
+    p_bench.add_argument("--url", default=None, help="服务地址，不填则在本进程启动替身服务")
+    p_bench.add_argument("--ocr-model", default="qwen-vl-plus")
+    p_bench.add_argument("--judge-model", default="qwen-turbo")
+    p_bench.add_argument("--variant", default="binary", choices=ocr_payload.VARIANTS)
+    p_bench.add_argument("--latency", type=float, default=0.3, help="替身服务首 token 延迟（秒）")
+    p_bench.add_argument("--token-interval", type=float, default=0.005, help="替身服务每个 token 的间隔（秒）")
+    args = parser.parse_args()
+
+    images = args.image
+    if not images and not args.pairs:
+        images = [os.path.join(here, "debug_stats_region.png")]
+    items = ocr_payload._load_pairs(images, args.pairs)
+    if not args.pairs and not args.image:
+        # 示例截图的参考文本
+        with open(os.path.join(here, "output_raw.txt"), encoding="utf-8") as f:
+            items = [(name, image, f.read()) for name, image, _ in items]
+    expectations = args.expect or ["有投射物技能等级加成，而且至少 +3", "力量至少 +25，并且有闪电伤害词缀"]
+
+    server = None
+    url = args.url
+    if url is None:
+        cfg = mock_dashscope.MockConfig(args.latency, sigma=0.1, seed=1, token_interval=args.token_interval)
+        server = mock_dashscope.MockServer(cfg).start()
+        url = server.base_url
+    try:
+        for line in bench(items, expectations, url, args.ocr_model, args.judge_model, args.variant):
+            print(line)
+        if server is not None:
+            print(server.format_stats())
+    finally:
+        if server is not None:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,568 @@
+# -*- coding: utf-8 -*-
+"""
+DashScope 连接池异步客户端（OCR / LLM 调用）
+- 长连接：装了 aiohttp 时用 ClientSession + TCPConnector（连接池）；否则用标准库 http.client，
+  每个工作线程保持一条 keep-alive 连接，服务端断开后自动重连一次
+- 每次调用一个截止时间：重试、对冲都在截止时间内完成，到点返回超时响应
+- 对冲重试：第一次请求超过最近成功延迟的 p90（不低于 hedge_min）仍未返回时，再发一个相同请求，取先成功的
+- 重试：429 / 5xx / 连接错误按指数退避重试（加随机抖动），4xx 直接返回
+- 并发上限：asyncio.Semaphore，对冲请求同样占用名额；没有空闲名额时不对冲（排队的对冲只会更晚）
+返回的 ApiResponse 与 dashscope SDK 的响应字段一致（status_code / code / message / output），
+script.py 可直接替换 MultiModalConversation.call / Generation.call。
+流式（SSE）：PooledClient.generation_stream 在调用方线程里逐个返回事件，相当于
+Generation.call(stream=True, incremental_output=True)；调用方提前结束迭代时断开连接，服务端随之停止生成。
+流式调用不重试、不对冲。
+
+    client = PooledClient(base_url="http://127.0.0.1:8765/api/v1")   # 同步调用方：后台线程跑事件循环
+    resp = client.generation("qwen-turbo", prompt, max_tokens=100)
+    print(resp.output.text, client.format_stats())
+
+压测（默认自动启动 mock_dashscope 替身服务）：
+    python dashscope_client.py bench --requests 200 --concurrency 1 --tail 0.05 --error-rate 0.05
+"""
+
+import asyncio
+import http.client
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import numpy as np
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+DEFAULT_BASE_URL = "https://dashscope.aliyuncs.com/api/v1"
+GENERATION_PATH = "/services/aigc/text-generation/generation"
+MULTIMODAL_PATH = "/services/aigc/multimodal-generation/generation"
+
+STATUS_TRANSPORT = -1     # 连接错误 / 读超时
+STATUS_TIMEOUT = 408      # 整次调用超过截止时间
+
+
+class _Output(dict):
+    """output 字段：既可 output.text 也可 output["text"]，与 SDK 一致"""
+
+    def __getattr__(self, name):
+        return self.get(name)
+
+
+class ApiResponse:
+    def __init__(self, status_code, body, latency=0.0, attempts=0, hedged=False):
+        self.status_code = status_code
+        self.code = body.get("code", "")
+        self.message = body.get("message", "")
+        self.request_id = body.get("request_id", "")
+        self.output = _Output(body.get("output") or {})
+        self.usage = body.get("usage") or {}
+        self.latency = latency
+        self.attempts = attempts
+        self.hedged = hedged
+
+    def __repr__(self):
+        return f"ApiResponse(status_code={self.status_code}, code={self.code!r}, latency={self.latency:.3f})"
+
+
+def _retryable(status):
+    return status == STATUS_TRANSPORT or status == 429 or status >= 500
+
+
+class _StdlibTransport:
+    """线程池 + 每线程一条 http.client 长连接"""
+
+    def __init__(self, base_url, workers):
+        parts = urlsplit(base_url)
+        self.https = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip("/")
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="dashscope-http")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.connections = 0
+
+    def _connection(self, timeout):
+        conn = getattr(self._local, "conn", None)
+        reused = conn is not None
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = cls(self.host, self.port, timeout=timeout)
+            self._local.conn = conn
+            with self._lock:
+                self.connections += 1
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, reused
+
+    def _drop(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+        self._local.conn = None
+
+    def _post_blocking(self, path, body, headers, timeout):
+        for _ in range(2):
+            conn, reused = self._connection(timeout)
+            try:
+                conn.request("POST", self.prefix + path, body, headers)
+                resp = conn.getresponse()
+                return resp.status, resp.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                self._drop()
+                # 空闲长连接被服务端关闭：重连一次；新连接也失败则交给上层重试
+                if not reused:
+                    raise
+            except Exception:
+                self._drop()
+                raise
+        raise ConnectionError("连接被重置")
+
+    def stream(self, path, body, headers, timeout):
+        """
+        在调用方线程里发送 SSE 请求，逐个产出 (状态码, 事件 JSON)。
+        读完整个流后连接留作复用；提前结束（生成器被关闭）或出错时断开。
+        """
+        conn, _ = self._connection(timeout)
+        finished = False
+        try:
+            conn.request("POST", self.prefix + path, body, headers)
+            resp = conn.getresponse()
+            if resp.status != 200 and "event-stream" not in (resp.getheader("Content-Type") or ""):
+                data = resp.read()
+                finished = True
+                try:
+                    yield resp.status, json.loads(data or b"{}")
+                except ValueError:
+                    yield resp.status, {"code": "BadResponse", "message": data[:200].decode("utf-8", "replace")}
+                return
+            status = resp.status
+            while True:
+                line = resp.readline()
+                if not line:
+                    break
+                line = line.decode("utf-8").rstrip("\r\n")
+                if line.startswith(":HTTP_STATUS/"):
+                    status = int(line[len(":HTTP_STATUS/"):])
+                elif line.startswith("data:"):
+                    try:
+                        event = json.loads(line[5:])
+                    except ValueError:
+                        event = {"code": "BadResponse", "message": line[5:205]}
+                    yield status, event
+            finished = True
+        finally:
+            if not finished:
+                self._drop()
+
+    async def post(self, path, body, headers, timeout):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._post_blocking, path, body, headers, timeout)
+
+    async def close(self):
+        self.executor.shutdown(wait=False)
+
+
+class _AiohttpTransport:
+    def __init__(self, base_url, limit):
+        self.base_url = base_url.rstrip("/")
+        self.limit = limit
+        self.session = None
+        self.connections = 0      # aiohttp 连接池内部管理，这里不统计
+
+    async def post(self, path, body, headers, timeout):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.limit, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector)
+        async with self.session.post(self.base_url + path, data=body, headers=headers,
+                                     timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+            return resp.status, await resp.read()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+class AsyncClient:
+    def __init__(self, api_key=None, base_url=None, concurrency=4, timeout=15.0, retries=2,
+                 hedge=True, hedge_min=0.2, hedge_quantile=0.9, backend=None):
+        """
+        :param base_url: None 表示官方地址；指向 mock_dashscope 时可离线压测
+        :param concurrency: 同时在途的请求数上限（含对冲请求）
+        :param timeout: 默认每次调用的截止时间（秒）
+        :param retries: 可重试错误的最多重试次数
+        :param hedge_min: 对冲等待的下限（秒）；最近成功延迟不足 20 个时不对冲
+        :param backend: "aiohttp" / "stdlib"，None 表示有 aiohttp 就用
+        """
+        self.api_key = api_key if api_key is not None else os.environ.get("DASHSCOPE_API_KEY", "")
+        self.base_url = base_url or DEFAULT_BASE_URL
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.hedge = hedge
+        self.hedge_min = hedge_min
+        self.hedge_quantile = hedge_quantile
+        if backend is None:
+            backend = "aiohttp" if aiohttp is not None else "stdlib"
+        if backend == "aiohttp" and aiohttp is None:
+            raise ValueError("未安装 aiohttp")
+        self.backend = backend
+        if backend == "aiohttp":
+            self.transport = _AiohttpTransport(self.base_url, concurrency)
+        else:
+            # 被取消的对冲请求在线程里仍会跑完，多留一倍线程
+            self.transport = _StdlibTransport(self.base_url, concurrency * 2)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.latencies = deque(maxlen=200)       # 最近成功请求的单次延迟
+        self.call_latencies = []                 # 每次调用（含重试 / 对冲）的总延迟
+        self.calls = 0
+        self.requests = 0
+        self.retried = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.hedge_skipped = 0
+        self.timeouts = 0
+        self.failures = 0
+
+    def hedge_delay(self):
+        if not self.hedge or len(self.latencies) < 20:
+            return None
+        return max(self.hedge_min, float(np.quantile(self.latencies, self.hedge_quantile)))
+
+    async def generation(self, model, prompt, deadline=None, messages=None, **parameters):
+        """:param messages: 对话消息（含 system），给出时代替 prompt"""
+        inp = {"messages": messages} if messages is not None else {"prompt": prompt}
+        payload = {"model": model, "input": inp, "parameters": parameters}
+        return await self.call(GENERATION_PATH, payload, deadline)
+
+    async def multimodal(self, model, messages, deadline=None, **parameters):
+        payload = {"model": model, "input": {"messages": messages}, "parameters": parameters}
+        return await self.call(MULTIMODAL_PATH, payload, deadline)
+
+    async def call(self, path, payload, deadline=None):
+        """
+        :param deadline: time.monotonic() 的绝对截止时间，None 表示 timeout 秒后
+        :return: ApiResponse（不抛异常；超时为 STATUS_TIMEOUT）
+        """
+        t0 = time.monotonic()
+        deadline = t0 + self.timeout if deadline is None else deadline
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        self.calls += 1
+        status, data, hedged = STATUS_TIMEOUT, {"code": "Timeout", "message": "超过截止时间"}, False
+        attempts = 0
+        while attempts <= self.retries:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if attempts:
+                self.retried += 1
+            attempts += 1
+            status, data, was_hedged = await self._hedged(path, body, headers, remaining)
+            hedged = hedged or was_hedged
+            if not _retryable(status):
+                break
+            # 指数退避 + 抖动，不超过截止时间
+            backoff = min(0.1 * 2 ** (attempts - 1) * (0.5 + random.random()), deadline - time.monotonic())
+            if attempts <= self.retries and backoff > 0:
+                await asyncio.sleep(backoff)
+        if _retryable(status) and time.monotonic() >= deadline:
+            status, data = STATUS_TIMEOUT, {"code": "Timeout", "message": f"超过截止时间（{data.get('code', '')}）"}
+        if status == STATUS_TIMEOUT:
+            self.timeouts += 1
+        elif status != 200:
+            self.failures += 1
+        latency = time.monotonic() - t0
+        self.call_latencies.append(latency)
+        return ApiResponse(status, data, latency, attempts, hedged)
+
+    async def _attempt(self, path, body, headers, timeout):
+        async with self._semaphore:
+            self.requests += 1
+            t0 = time.monotonic()
+            try:
+                status, raw = await asyncio.wait_for(self.transport.post(path, body, headers, timeout), timeout)
+            except asyncio.TimeoutError:
+                return STATUS_TRANSPORT, {"code": "Timeout", "message": "请求超时"}
+            except (OSError, http.client.HTTPException) as e:
+                return STATUS_TRANSPORT, {"code": "Transport", "message": str(e)}
+            except Exception as e:
+                if aiohttp is not None and isinstance(e, aiohttp.ClientError):
+                    return STATUS_TRANSPORT, {"code": "Transport", "message": str(e)}
+                raise
+            try:
+                data = json.loads(raw or b"{}")
+            except ValueError:
+                data = {"code": "BadResponse", "message": raw[:200].decode("utf-8", "replace")}
+            if status == 200:
+                self.latencies.append(time.monotonic() - t0)
+            return status, data
+
+    async def _hedged(self, path, body, headers, timeout):
+        """:return: (状态码, 响应体, 是否发出了对冲请求)"""
+        t0 = time.monotonic()
+        first = asyncio.ensure_future(self._attempt(path, body, headers, timeout))
+        delay = self.hedge_delay()
+        if delay is None or delay >= timeout:
+            return (*await first, False)
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return (*first.result(), False)
+        if self._semaphore.locked():
+            self.hedge_skipped += 1
+            return (*await first, False)
+
+        self.hedges += 1
+        second = asyncio.ensure_future(self._attempt(path, body, headers, timeout - delay))
+        pending = {first, second}
+        last = (STATUS_TRANSPORT, {"code": "Timeout", "message": "请求超时"})
+        while pending:
+            remaining = timeout - (time.monotonic() - t0)
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                status, data = task.result()
+                if status == 200:
+                    if task is second:
+                        self.hedge_wins += 1
+                    for p in pending:
+                        p.cancel()
+                    return status, data, True
+                last = (status, data)
+        for p in pending:
+            p.cancel()
+        return (*last, True)
+
+    async def close(self):
+        await self.transport.close()
+
+    def stats(self):
+        lat = np.asarray(self.call_latencies[-10000:], dtype=np.float64) * 1000
+        pct = np.percentile(lat, [50, 95, 99]) if len(lat) else (0.0, 0.0, 0.0)
+        return {
+            "calls": self.calls,
+            "requests": self.requests,
+            "retried": self.retried,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_skipped": self.hedge_skipped,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "p50_ms": float(pct[0]),
+            "p95_ms": float(pct[1]),
+            "p99_ms": float(pct[2]),
+            "connections": self.transport.connections,
+        }
+
+    def format_stats(self):
+        st = self.stats()
+        text = (f"🌐 DashScope 客户端（{self.backend}）: 调用 {st['calls']} 次 / 请求 {st['requests']} 次，"
+                f"重试 {st['retried']}，对冲 {st['hedges']}（胜 {st['hedge_wins']}，无空位跳过 {st['hedge_skipped']}），"
+                f"超时 {st['timeouts']}，失败 {st['failures']}，"
+                f"p50 {st['p50_ms']:.0f}ms p95 {st['p95_ms']:.0f}ms p99 {st['p99_ms']:.0f}ms")
+        if self.backend == "stdlib":
+            text += f"，新建连接 {st['connections']}"
+        return text
+
+
+class PooledClient:
+    """给同步代码用：后台线程跑事件循环，调用阻塞到结果返回"""
+
+    def __init__(self, **kwargs):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="dashscope-loop", daemon=True)
+        self.thread.start()
+        self.client = self._run(self._create(kwargs))
+        self._streamer = None       # 流式调用用的标准库连接（调用方线程）
+
+    @staticmethod
+    async def _create(kwargs):
+        # Semaphore 等在事件循环线程里创建
+        return AsyncClient(**kwargs)
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def generation(self, model, prompt, timeout=None, messages=None, **parameters):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        return self._run(self.client.generation(model, prompt, deadline, messages, **parameters))
+
+    def multimodal(self, model, messages, timeout=None, **parameters):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        return self._run(self.client.multimodal(model, messages, deadline, **parameters))
+
+    def generation_stream(self, model, prompt, timeout=None, messages=None, **parameters):
+        """
+        流式文本生成（incremental_output），逐个产出 ApiResponse，output.text 为新增部分。
+        在调用方线程里执行（长连接每个调用线程一条）；连接错误产出一个 STATUS_TRANSPORT 响应后结束。
+        """
+        client = self.client
+        if self._streamer is None:
+            self._streamer = _StdlibTransport(client.base_url, 1)
+        timeout = client.timeout if timeout is None else timeout
+        inp = {"messages": messages} if messages is not None else {"prompt": prompt}
+        payload = {"model": model, "input": inp, "parameters": dict(parameters, incremental_output=True)}
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = {"Authorization": f"Bearer {client.api_key}", "Content-Type": "application/json",
+                   "Accept": "text/event-stream", "X-DashScope-SSE": "enable"}
+        client.calls += 1
+        client.requests += 1
+        t0 = time.monotonic()
+        events = self._streamer.stream(GENERATION_PATH, body, headers, timeout)
+        try:
+            for status, event in events:
+                resp = ApiResponse(status, event, time.monotonic() - t0, 1)
+                if status != 200:
+                    client.failures += 1
+                yield resp
+        except (OSError, http.client.HTTPException) as e:
+            client.failures += 1
+            yield ApiResponse(STATUS_TRANSPORT, {"code": "Transport", "message": str(e)}, time.monotonic() - t0, 1)
+        finally:
+            events.close()
+            client.call_latencies.append(time.monotonic() - t0)
+
+    def format_stats(self):
+        return self.client.format_stats()
+
+    def close(self):
+        if self._streamer is not None:
+            self._streamer._drop()
+            self._streamer.executor.shutdown(wait=False)
+        self._run(self.client.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(2.0)
+
+
+# ==================== 压测 ====================
+def _baseline_call(base_url, path, payload, timeout):
+    """对照组：每次新建连接、不重试、不对冲（相当于默认的同步调用）"""
+    parts = urlsplit(base_url)
+    cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+    t0 = time.monotonic()
+    conn = cls(parts.hostname, parts.port, timeout=timeout)
+    try:
+        conn.request("POST", parts.path.rstrip("/") + path, json.dumps(payload).encode("utf-8"),
+                     {"Content-Type": "application/json"})
+        status = conn.getresponse().status
+    except Exception:
+        status = STATUS_TRANSPORT
+    finally:
+        conn.close()
+    return status, time.monotonic() - t0
+
+
+def _pipeline_payloads(i):
+    """与 script.py 一次尝试相同的两次调用：截图 OCR，然后文本判断"""
+    ocr = {"model": "qwen-vl-plus", "input": {"messages": [{"role": "user", "content": [
+        {"image": "data:image/png;base64,iVBORw0KGgo="}, {"text": "请精确识别图片中的所有中文和英文文字"}]}]},
+        "parameters": {}}
+    judge = {"model": "qwen-turbo", "input": {"prompt": f"第 {i} 次：+3 所有投射物技能石等級\n是否满足？"},
+             "parameters": {"max_tokens": 100}}
+    return [(MULTIMODAL_PATH, ocr), (GENERATION_PATH, judge)]
+
+
+def _summary(name, latencies, errors, wall):
+    lat = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(lat, [50, 95, 99])
+    return (f"{name}: {len(lat)} 次尝试用时 {wall:.1f}s（{len(lat) / wall:.1f} 次/s），"
+            f"单次 p50 {p50:.0f}ms p95 {p95:.0f}ms p99 {p99:.0f}ms 最大 {lat.max():.0f}ms，失败 {errors}")
+
+
+def bench(base_url, attempts, concurrency, timeout, limit=None, backend=None):
+    """
+    对照组顺序执行，新连接、不重试；连接池组 concurrency 个尝试并发，长连接 + 重试 + 对冲。
+    每次“尝试”= OCR + 判断两次调用，延迟按整次尝试统计。
+    :param limit: 客户端并发上限，默认 concurrency 的两倍（留出对冲的名额）
+    """
+    limit = concurrency * 2 if limit is None else limit
+    lines = []
+    latencies, errors = [], 0
+    t0 = time.monotonic()
+    for i in range(attempts):
+        total = 0.0
+        for path, payload in _pipeline_payloads(i):
+            status, latency = _baseline_call(base_url, path, payload, timeout)
+            total += latency
+            errors += status != 200
+        latencies.append(total)
+    lines.append(_summary("对照（新连接 / 顺序 / 不重试）", latencies, errors, time.monotonic() - t0))
+
+    async def run():
+        client = AsyncClient(base_url=base_url, concurrency=limit, timeout=timeout, backend=backend)
+        gate = asyncio.Semaphore(concurrency)
+
+        async def one(i):
+            async with gate:
+                start = time.monotonic()
+                ok = True
+                for path, payload in _pipeline_payloads(i):
+                    resp = await client.call(path, payload)
+                    ok = ok and resp.status_code == 200
+                return time.monotonic() - start, ok
+
+        # 先热身，让对冲阈值有足够的延迟样本
+        await asyncio.gather(*(one(i) for i in range(min(20, attempts))))
+        start = time.monotonic()
+        results = await asyncio.gather(*(one(i) for i in range(attempts)))
+        wall = time.monotonic() - start
+        await client.close()
+        return results, wall, client.format_stats()
+
+    results, wall, stats = asyncio.run(run())
+    lines.append(_summary(f"连接池（并发 {concurrency}，上限 {limit} / 重试 / 对冲）", [r[0] for r in results],
+                          sum(not r[1] for r in results), wall))
+    lines.append(stats)
+    return lines
+
+
+def main():
+    import argparse
+
+    import mock_dashscope
+
+    parser = argparse.ArgumentParser(description="DashScope 连接池客户端")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_bench = sub.add_parser("bench", help="对照组 vs 连接池客户端（默认启动本地替身服务）")
+    p_bench.add_argument("--url", default=None, help="已运行的服务地址，不填则在本进程启动替身服务")
+    p_bench.add_argument("--requests", type=int, default=100, help="尝试次数（每次 OCR + 判断两次调用）")
+    p_bench.add_argument("--concurrency", type=int, default=4, help="同时进行的尝试数")
+    p_bench.add_argument("--limit", type=int, default=None, help="客户端并发上限，默认 concurrency 的两倍")
+    p_bench.add_argument("--timeout", type=float, default=5.0)
+    p_bench.add_argument("--backend", choices=["aiohttp", "stdlib"], default=None)
+    p_bench.add_argument("--latency", type=float, default=0.08)
+    p_bench.add_argument("--sigma", type=float, default=0.3)
+    p_bench.add_argument("--tail", type=float, default=0.05)
+    p_bench.add_argument("--tail-latency", type=float, default=1.0)
+    p_bench.add_argument("--error-rate", type=float, default=0.05)
+    p_bench.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        cfg = mock_dashscope.MockConfig(args.latency, args.sigma, args.tail, args.tail_latency,
+                                        args.error_rate, seed=args.seed)
+        server = mock_dashscope.MockServer(cfg).start()
+        url = server.base_url
+    try:
+        for line in bench(url, args.requests, args.concurrency, args.timeout, args.limit, args.backend):
+            print(line)
+        if server is not None:
+            print(server.format_stats())
+    finally:
+        if server is not None:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
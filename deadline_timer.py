@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+高精度截止时间等待
+先用 time.sleep / Event.wait 粗睡眠到截止时间前 spin_ns，再自旋到截止时间。
+循环使用绝对截止时间（上一次截止时间 + 周期），每轮处理耗时不会拉长周期。
+每次唤醒的迟到量（实际唤醒 - 截止时间）记在预分配的环形缓冲区中，可输出抖动统计。
+
+    timer = DeadlineTimer("monitor")
+    ticker = timer.periodic(0.3)
+    while running:
+        do_work()
+        ticker.wait()
+    print(timer.format_stats())
+"""
+
+import time
+
+import numpy as np
+
+
+def now_ns():
+    return time.perf_counter_ns()
+
+
+class DeadlineTimer:
+    def __init__(self, name="timer", spin_ns=2_000_000, capacity=100000):
+        """
+        :param spin_ns: 自旋预算：截止时间前多少纳秒改为自旋（越大越准，CPU 占用越高）；0 表示只睡眠
+        :param capacity: 保留的唤醒记录数
+        """
+        self.name = name
+        self.spin_ns = spin_ns
+        self.capacity = capacity
+        self._late = np.zeros(capacity, dtype=np.int64)
+        self._n = 0
+        self.spin_total_ns = 0
+        self.missed = 0     # Periodic 落后超过一个周期而跳过的次数
+
+    def wait_until(self, deadline_ns, cancel=None):
+        """
+        等到 deadline_ns（perf_counter_ns）。
+        :param cancel: threading.Event，置位时立即返回
+        :return: True 表示因 cancel 置位而提前返回
+        """
+        remaining = deadline_ns - time.perf_counter_ns()
+        coarse = remaining - self.spin_ns
+        if coarse > 0:
+            if cancel is not None:
+                if cancel.wait(coarse / 1e9):
+                    return True
+            else:
+                time.sleep(coarse / 1e9)
+        elif cancel is not None and cancel.is_set():
+            return True
+        spin_start = time.perf_counter_ns()
+        t = spin_start
+        while t < deadline_ns:
+            t = time.perf_counter_ns()
+        if remaining > 0:
+            self.spin_total_ns += t - spin_start
+            self._late[self._n % self.capacity] = t - deadline_ns
+            self._n += 1
+        return False
+
+    def sleep(self, seconds, cancel=None):
+        """相对等待（只用于没有自然起点的场合）"""
+        return self.wait_until(time.perf_counter_ns() + int(seconds * 1e9), cancel)
+
+    def periodic(self, period, start_ns=None):
+        return Periodic(self, period, start_ns)
+
+    def calibrate(self, samples=50, quantum=0.001):
+        """测量 time.sleep(quantum) 的超时量，把自旋预算设为其 p99（至少 0.2ms）"""
+        over = []
+        for _ in range(samples):
+            t0 = time.perf_counter_ns()
+            time.sleep(quantum)
+            over.append(time.perf_counter_ns() - t0 - int(quantum * 1e9))
+        self.spin_ns = max(200_000, int(np.percentile(over, 99)))
+        return self.spin_ns
+
+    def lateness_us(self):
+        n = min(self._n, self.capacity)
+        return self._late[:n] / 1000.0
+
+    def stats(self):
+        """{n, mean_us, p50_us, p99_us, max_us, spin_ms, missed}"""
+        late = self.lateness_us()
+        if len(late) == 0:
+            return {"n": 0, "mean_us": 0.0, "p50_us": 0.0, "p99_us": 0.0, "max_us": 0.0,
+                    "spin_ms": 0.0, "missed": self.missed}
+        p50, p99 = np.percentile(late, [50, 99])
+        return {"n": int(len(late)), "mean_us": float(late.mean()), "p50_us": float(p50),
+                "p99_us": float(p99), "max_us": float(late.max()),
+                "spin_ms": self.spin_total_ns / 1e6, "missed": self.missed}
+
+    def format_stats(self):
+        st = self.stats()
+        text = (f"⏲️ {self.name} 唤醒抖动: {st['n']} 次 | 平均迟到 {st['mean_us']:.1f}us | p50 {st['p50_us']:.1f}us"
+                f" | p99 {st['p99_us']:.1f}us | 最大 {st['max_us']:.1f}us | 自旋 {st['spin_ms']:.1f}ms"
+                f"（预算 {self.spin_ns / 1e6:.2f}ms）")
+        if st["missed"]:
+            text += f" | 落后跳过 {st['missed']} 个周期"
+        return text
+
+
+class Periodic:
+    """固定周期的绝对截止时间：第 k 次唤醒在 start + k * period"""
+
+    def __init__(self, timer, period, start_ns=None):
+        self.timer = timer
+        self.period_ns = int(period * 1e9)
+        self.next_ns = (time.perf_counter_ns() if start_ns is None else start_ns) + self.period_ns
+
+    def set_period(self, period):
+        """周期改变时从上一次截止时间重新计算"""
+        period_ns = int(period * 1e9)
+        self.next_ns += period_ns - self.period_ns
+        self.period_ns = period_ns
+
+    def wait(self, cancel=None):
+        """等到下一个截止时间；落后超过一个周期时跳到最近的未来截止时间而不是连续补跑"""
+        now = time.perf_counter_ns()
+        if now - self.next_ns > self.period_ns:
+            skipped = (now - self.next_ns) // self.period_ns
+            self.next_ns += skipped * self.period_ns
+            self.timer.missed += int(skipped)
+        cancelled = self.timer.wait_until(self.next_ns, cancel)
+        self.next_ns += self.period_ns
+        return cancelled
+
+
+DEFAULT_TIMER = DeadlineTimer("default")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="对比相对 time.sleep 与绝对截止时间 + 不同自旋预算的周期抖动")
+    parser.add_argument("--period", type=float, default=0.005, help="周期（秒）")
+    parser.add_argument("--n", type=int, default=400)
+    parser.add_argument("--work-ms", type=float, default=1.0, help="每轮模拟的处理耗时")
+    args = parser.parse_args()
+
+    def busy(ms):
+        end = time.perf_counter_ns() + int(ms * 1e6)
+        while time.perf_counter_ns() < end:
+            pass
+
+    # 相对睡眠：周期 = 处理耗时 + sleep
+    t0 = time.perf_counter()
+    for _ in range(args.n):
+        busy(args.work_ms)
+        time.sleep(args.period)
+    actual = (time.perf_counter() - t0) / args.n
+    print(f"time.sleep 相对等待: 实际周期 {actual * 1000:.3f}ms（目标 {args.period * 1000:.3f}ms）")
+
+    for spin in (0, 500_000, 2_000_000):
+        timer = DeadlineTimer(f"spin={spin / 1e6:g}ms", spin_ns=spin)
+        ticker = timer.periodic(args.period)
+        t0 = time.perf_counter()
+        for _ in range(args.n):
+            busy(args.work_ms)
+            ticker.wait()
+        actual = (time.perf_counter() - t0) / args.n
+        print(f"绝对截止时间 实际周期 {actual * 1000:.3f}ms | {timer.format_stats()}")
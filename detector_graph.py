@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+"""
+每帧检测流水线
+检测器声明自己需要的图层（rgb / hsv / gray / binary / integral，均按 ROI 区分），
+DetectorGraph 在每帧开始时把所有声明的图层各计算一次，再把同一份结果交给各检测器（只读共享）。
+互不依赖的检测器可以放进线程池并行（cv2 / numpy 计算期间会释放 GIL）。
+每个图层和检测器的耗时单独累计，用于找出最贵的一项。
+
+    graph = DetectorGraph([BarDetector("hp", hp_roi, "red_green"), BarDetector("mp", mp_roi, "blue")])
+    results = graph.run(screen, origin)      # {"hp": 73.5, "mp": None}
+    print(graph.format_costs())
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from latency_trace import NULL_TRACER
+
+PLANE_RGB = "rgb"
+PLANE_HSV = "hsv"
+PLANE_GRAY = "gray"
+PLANE_BINARY = "binary"
+PLANE_INTEGRAL = "integral"     # 灰度积分图 (h+1, w+1)，任意矩形求和 O(1)
+
+# 图层依赖：计算某图层前先要有的图层
+_PLANE_SOURCE = {PLANE_HSV: PLANE_RGB, PLANE_GRAY: PLANE_RGB, PLANE_BINARY: PLANE_GRAY,
+                 PLANE_INTEGRAL: PLANE_GRAY}
+
+
+def _compute_plane(plane, source):
+    if plane == PLANE_HSV:
+        return cv2.cvtColor(source, cv2.COLOR_RGB2HSV)
+    if plane == PLANE_GRAY:
+        return cv2.cvtColor(source, cv2.COLOR_RGB2GRAY)
+    if plane == PLANE_BINARY:
+        _, binary = cv2.threshold(source, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        return binary
+    if plane == PLANE_INTEGRAL:
+        return cv2.integral(source)
+    raise ValueError(f"未知图层: {plane}")
+
+
+class FramePlanes:
+    """一帧的图层缓存：(图层名, ROI) → 数组；ROI 超出截图范围时为 None"""
+
+    def __init__(self, screen, origin=(0, 0)):
+        self.screen = screen
+        self.origin = origin
+        self._planes = {}
+
+    def crop(self, roi):
+        if roi is None:
+            return self.screen
+        x, y, w, h = roi
+        x -= self.origin[0]
+        y -= self.origin[1]
+        if x < 0 or y < 0 or x + w > self.screen.shape[1] or y + h > self.screen.shape[0]:
+            return None
+        return self.screen[y:y + h, x:x + w]
+
+    def prepare(self, plane, roi, cost=None):
+        """计算（若尚未计算）并返回图层；cost 为列表时追加 (图层名, 耗时 ns)"""
+        key = (plane, roi)
+        if key in self._planes:
+            return self._planes[key]
+        if plane == PLANE_RGB:
+            value = self.crop(roi)
+        else:
+            source = self.prepare(_PLANE_SOURCE[plane], roi, cost)
+            t0 = time.perf_counter_ns()
+            value = None if source is None else _compute_plane(plane, source)
+            if cost is not None:
+                cost.append((plane, time.perf_counter_ns() - t0))
+        self._planes[key] = value
+        return value
+
+    def get(self, plane, roi=None):
+        return self._planes.get((plane, roi))
+
+
+class Detector:
+    """检测器基类：needs() 声明图层，run(planes) 只读取已准备好的图层"""
+
+    def __init__(self, name, roi):
+        self.name = name
+        self.roi = tuple(roi) if roi else None
+
+    def needs(self):
+        return [(PLANE_RGB, self.roi)]
+
+    def run(self, planes):
+        raise NotImplementedError
+
+
+class GroupDetector(Detector):
+    """一次计算多个区域的检测器：run() 返回 {区域名: 结果}，由 DetectorGraph 展开"""
+
+    provides = frozenset()
+
+
+# 血条 / 蓝条颜色范围（HSV）：有效性判断用较宽的范围，填充计算用较严的范围
+BAR_COLORS = {
+    "red_green": {
+        "valid": [((0, 50, 40), (25, 255, 255)), ((150, 50, 40), (180, 255, 255)), ((40, 50, 40), (80, 255, 255))],
+        "fill": [((0, 70, 60), (20, 255, 255)), ((160, 70, 60), (180, 255, 255)), ((40, 70, 60), (80, 255, 255))],
+    },
+    "blue": {
+        "valid": [((80, 50, 40), (150, 255, 255))],
+        "fill": [((90, 70, 60), (140, 255, 255))],
+    },
+    # 能量护盾：低饱和度的青白色
+    "es": {
+        "valid": [((80, 20, 120), (110, 170, 255))],
+        "fill": [((85, 30, 150), (105, 160, 255))],
+    },
+}
+
+_KERNEL = np.ones((2, 2), np.uint8)
+
+
+def hsv_mask(hsv, ranges):
+    mask = None
+    for lower, upper in ranges:
+        m = cv2.inRange(hsv, np.array(lower), np.array(upper))
+        mask = m if mask is None else cv2.bitwise_or(mask, m)
+    return mask
+
+
+def fill_percentage(mask):
+    """掩码去噪后，以最上方的有色行计算填充百分比"""
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, _KERNEL)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, _KERNEL)
+    h = mask.shape[0]
+    colored_rows = np.where(np.any(mask > 0, axis=1))[0]
+    if len(colored_rows) == 0:
+        return 0.0
+    filled = h - np.min(colored_rows)
+    return max(0.0, min(100.0, (filled / h) * 100))
+
+
+class BarDetector(Detector):
+    """竖条填充百分比（HP 红/绿、MP 蓝）：有色像素不足 10% 视为无效，返回 None"""
+
+    def __init__(self, name, roi, color="red_green", min_valid=0.1):
+        """
+        :param color: BAR_COLORS 中的预设名，或 {"valid": [...], "fill": [...]} 自定义 HSV 范围
+        """
+        super().__init__(name, roi)
+        self.colors = BAR_COLORS[color] if isinstance(color, str) else color
+        self.min_valid = min_valid
+
+    def needs(self):
+        return [(PLANE_HSV, self.roi)]
+
+    def run(self, planes):
+        hsv = planes.get(PLANE_HSV, self.roi)
+        if hsv is None or hsv.shape[0] < 10 or hsv.shape[1] < 3:
+            return None
+        valid = hsv_mask(hsv, self.colors["valid"])
+        if cv2.countNonZero(valid) / valid.size <= self.min_valid:
+            return None
+        return fill_percentage(hsv_mask(hsv, self.colors["fill"]))
+
+
+class FlaskSlotDetector(Detector):
+    """
+    药瓶槽状态：{"charge": 液面高度 0~100, "glow": 外框平均亮度 0~255}。
+    药液取饱和且不太暗的像素（红 / 蓝 / 黄药液都适用），以最上方的药液行计算液面；
+    药剂生效时槽位外框发亮，取 ROI 四周 border 像素宽的边框平均亮度。
+    """
+
+    LIQUID = [((0, 90, 70), (180, 255, 255))]
+
+    def __init__(self, name, roi, border=2):
+        super().__init__(name, roi)
+        self.border = border
+
+    def needs(self):
+        return [(PLANE_HSV, self.roi)]
+
+    def run(self, planes):
+        hsv = planes.get(PLANE_HSV, self.roi)
+        b = self.border
+        if hsv is None or hsv.shape[0] <= 2 * b + 4 or hsv.shape[1] <= 2 * b:
+            return None
+        value = hsv[:, :, 2]
+        inner = value[b:-b, b:-b]
+        ring = float(value.sum(dtype=np.int64) - inner.sum(dtype=np.int64)) / (value.size - inner.size)
+        return {"charge": fill_percentage(hsv_mask(hsv[b:-b, b:-b], self.LIQUID)), "glow": ring}
+
+
+class MeanBrightnessGroup(GroupDetector):
+    """
+    多个区域的平均亮度（药瓶充能、技能冷却遮罩等）。
+    整帧只算一次灰度积分图，所有区域的均值用四次花式索引一次算出，新增区域几乎没有额外开销。
+    """
+
+    def __init__(self, name, rois):
+        """:param rois: {区域名: (x, y, w, h)}（屏幕坐标）"""
+        super().__init__(name, None)
+        self.names = list(rois)
+        self.provides = set(self.names)
+        self.rois = np.array([rois[n] for n in self.names], dtype=np.int64).reshape(-1, 4)
+
+    def needs(self):
+        return [(PLANE_INTEGRAL, None)]
+
+    def run(self, planes):
+        integral = planes.get(PLANE_INTEGRAL, None)
+        h, w = integral.shape[0] - 1, integral.shape[1] - 1
+        x0 = self.rois[:, 0] - planes.origin[0]
+        y0 = self.rois[:, 1] - planes.origin[1]
+        x1 = x0 + self.rois[:, 2]
+        y1 = y0 + self.rois[:, 3]
+        inside = (x0 >= 0) & (y0 >= 0) & (x1 <= w) & (y1 <= h) & (self.rois[:, 2] > 0) & (self.rois[:, 3] > 0)
+        x0, y0, x1, y1 = (np.where(inside, a, 0) for a in (x0, y0, x1, y1))
+        sums = (integral[y1, x1].astype(np.float64) - integral[y0, x1] - integral[y1, x0] + integral[y0, x0])
+        area = np.maximum((x1 - x0) * (y1 - y0), 1)
+        means = sums / area
+        return {n: (float(m) if ok else None) for n, m, ok in zip(self.names, means, inside)}
+
+
+class TemplateDetector(Detector):
+    """图标是否出现：在 ROI 的灰度图中做模板匹配，返回最高得分（0~1）"""
+
+    def __init__(self, name, roi, template_gray):
+        super().__init__(name, roi)
+        self.template = template_gray
+
+    @classmethod
+    def from_file(cls, name, roi, path):
+        img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            raise ValueError(f"无法加载图标模板: {path}")
+        return cls(name, roi, img)
+
+    def needs(self):
+        return [(PLANE_GRAY, self.roi)]
+
+    def run(self, planes):
+        gray = planes.get(PLANE_GRAY, self.roi)
+        th, tw = self.template.shape[:2]
+        if gray is None or gray.shape[0] < th or gray.shape[1] < tw:
+            return None
+        res = cv2.matchTemplate(gray, self.template, cv2.TM_CCOEFF_NORMED)
+        return float(res.max())
+
+
+class DetectorGraph:
+    def __init__(self, detectors, workers=0, tracer=None):
+        """
+        :param detectors: Detector 列表（名字唯一）
+        :param workers: >1 时用线程池并行运行检测器
+        :param tracer: latency_trace.SpanTracer，记录 planes 和每个检测器的阶段
+        """
+        self.detectors = list(detectors)
+        self.tracer = NULL_TRACER if tracer is None else tracer
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="detector") if workers > 1 else None
+        self._cost_ns = {}
+        self._count = {}
+        self.frames = 0
+
+    def _account(self, name, ns):
+        self._cost_ns[name] = self._cost_ns.get(name, 0) + ns
+        self._count[name] = self._count.get(name, 0) + 1
+
+    def _timed(self, detector, planes):
+        t0 = time.perf_counter_ns()
+        result = detector.run(planes)
+        return result, t0, time.perf_counter_ns()
+
+    def select(self, only):
+        """only 中的名字对应的检测器（分组检测器只要包含其一即选中）；only 为 None 时全部"""
+        if only is None:
+            return self.detectors
+        return [d for d in self.detectors
+                if d.name in only or (isinstance(d, GroupDetector) and not d.provides.isdisjoint(only))]
+
+    def run(self, screen, origin=(0, 0), only=None):
+        """
+        处理一帧，返回 {检测器名: 结果}
+        :param only: 只运行这些名字的检测器（各区域采样周期不同时用），None 表示全部；
+                     分组检测器也只返回 only 中的区域，未到期的区域不会以 None 覆盖调用方保存的读数
+        """
+        tracer = self.tracer
+        planes = FramePlanes(screen, origin)
+        detectors = self.select(only)
+        t = tracer.now()
+        plane_costs = []
+        for detector in detectors:
+            for plane, roi in detector.needs():
+                planes.prepare(plane, roi, plane_costs)
+        for name, ns in plane_costs:
+            self._account(f"[{name}]", ns)
+        t = tracer.lap("planes", t)
+
+        if self._pool is not None and len(detectors) > 1:
+            timed = list(self._pool.map(lambda d: self._timed(d, planes), detectors))
+        else:
+            timed = [self._timed(d, planes) for d in detectors]
+        results = {}
+        for detector, (result, t0, t1) in zip(detectors, timed):
+            if isinstance(detector, GroupDetector):
+                results.update(result if only is None else {n: v for n, v in result.items() if n in only})
+            else:
+                results[detector.name] = result
+            self._account(detector.name, t1 - t0)
+            tracer.add(detector.name, t0, t1)
+        self.frames += 1
+        return results
+
+    def costs(self):
+        """{名称: {n, total_ms, mean_us}}；图层以 [hsv] 形式出现"""
+        return {name: {"n": self._count[name], "total_ms": ns / 1e6, "mean_us": ns / 1e3 / self._count[name]}
+                for name, ns in self._cost_ns.items()}
+
+    def format_costs(self):
+        items = sorted(self.costs().items(), key=lambda kv: -kv[1]["total_ms"])
+        parts = [f"{name} {st['mean_us']:.0f}us×{st['n']}" for name, st in items]
+        return f"🧮 检测耗时（{self.frames} 帧）: " + " | ".join(parts)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
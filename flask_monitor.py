@@ -0,0 +1,497 @@
+# -*- coding: utf-8 -*-
+"""
+自动喝药核心逻辑（与界面、截图、输入解耦）
+FlaskMonitor.tick(screen) 根据一帧截图计算各监控区域的读数并给出要按的键，
+既可在界面进程的线程里跑，也可在独立的监控进程里跑（见 monitor_process.py）。
+检测由 detector_graph.DetectorGraph 完成：每帧只截一次图（所有区域的外接矩形），每个区域的图层只算一次。
+
+除了原有的 hp_region / mp_region，配置中的 "regions" 列表可以加入任意多个区域：
+    {"name": "es", "type": "bar", "color": "es", "region": [x, y, w, h], "key": "3", "below": 50}
+    {"name": "flask4", "type": "brightness", "region": [...], "key": "4", "above": 90, "cooldown": 4}
+    {"name": "onslaught", "type": "icon", "template": "buff.png", "threshold": 0.8,
+     "region": [...], "key": "5", "present": false}
+type:
+    bar         竖条填充百分比，color 为 red_green / blue / es 或自定义 HSV 范围
+    brightness  区域平均亮度 0~255（药瓶充能格、冷却遮罩），所有亮度区域共用一张积分图
+    icon        模板匹配得分 0~1
+触发规则（可组合，全部满足才按键）：below / above 数值阈值；present 为 true / false 时按图标出现 / 消失触发
+（以 threshold 为界）。cooldown 为两次触发按键的最小间隔，timer > 0 时每 timer 秒定时按一次。
+fallback_key（hp / mp 为 hp_fallback_key / mp_fallback_key）为主键不可用时改按的备用药瓶。
+
+"flasks" 列表配置药瓶槽，用同一帧判断按键是否有意义：
+    {"key": "1", "region": [x, y, w, h], "min_charge": 20, "active_glow": 160}
+液面低于 min_charge（空瓶）或外框亮度高于 active_glow（药效生效中，不设则不判断）时跳过该键，
+改按备用键；都不可用时这次按键被抑制，按原因计数（format_flask_stats）。
+没有配置药瓶槽的按键、或药瓶槽不在截图内时照常按下。
+
+低功耗：所有竖条连续 idle_after 秒“无有效读数”（城镇、读图、最小化）或“满且不变”时，
+检测间隔放慢到 idle_interval（探测模式）；任一竖条读数变化立即恢复 check_interval。
+
+调度：每个区域的采样和每个定时按键都是 scheduler.Scheduler 中的独立任务（jobs()），
+区域的 interval / tolerance 为采样周期和允许抖动（hp / mp 为 hp_interval / mp_interval，
+不设则用 check_interval），定时按键按 timer 周期准点执行，不再取整到检测间隔。
+同一次唤醒中到期的区域合并成一次截图（sample(names)）。
+"""
+
+import time
+
+from detector_graph import DetectorGraph, BarDetector, FlaskSlotDetector, MeanBrightnessGroup, TemplateDetector
+from latency_trace import NULL_TRACER
+
+# 事件类型（monitor_process 事件环中的 kind）
+EVENT_LOG = 0
+EVENT_HP = 1
+EVENT_MP = 2
+EVENT_HP_TIMER = 3
+EVENT_MP_TIMER = 4
+EVENT_REGION = 5
+EVENT_REGION_TIMER = 6
+
+REGION_TYPES = ("bar", "brightness", "icon")
+
+REGION_DEFAULTS = {
+    "name": "",
+    "type": "bar",
+    "region": None,
+    "color": "red_green",
+    "template": None,
+    "threshold": 0.8,       # icon 判定“出现”的匹配得分
+    "key": "",
+    "fallback_key": "",
+    "below": None,
+    "above": None,
+    "present": None,
+    "cooldown": 0.0,
+    "timer": 0.0,
+    "timer_tolerance": 0.05,
+    "interval": None,       # 采样周期；None 用 check_interval
+    "tolerance": None,      # 采样允许的迟到秒数；None 为周期的 10%
+    "disabled": False,
+}
+
+FLASK_DEFAULTS = {
+    "key": "",
+    "region": None,
+    "min_charge": 20.0,     # 液面低于此百分比视为空瓶
+    "active_glow": None,    # 外框亮度高于此值视为药效生效中；None 不判断
+}
+
+FLASK_OK = "ok"
+FLASK_EMPTY = "empty"
+FLASK_ACTIVE = "active"
+
+DEFAULT_CONFIG = {
+    "hp_region": None,
+    "mp_region": None,
+    "hp_key": "1",
+    "hp_threshold": 35.0,
+    "disable_hp": False,
+    "enable_hp_timer": False,
+    "hp_timer_interval": 5.0,
+    "mp_key": "2",
+    "mp_threshold": 35.0,
+    "disable_mp": False,
+    "enable_mp_timer": False,
+    "mp_timer_interval": 8.0,
+    "hp_fallback_key": "",
+    "mp_fallback_key": "",
+    "check_interval": 0.3,
+    "hp_interval": None,       # HP / MP 各自的采样周期；None 用 check_interval
+    "mp_interval": None,
+    "detector_workers": 0,     # >1 时检测器在线程池中并行
+    "regions": [],             # 额外的监控区域，见模块说明
+    "flasks": [],              # 药瓶槽，见模块说明
+    "idle_after": 5.0,         # 无有效血条 / 满血不变持续多少秒进入探测模式；0 表示不进入
+    "idle_interval": 1.0,      # 探测模式的检测间隔
+    "full_threshold": 98.0,    # 竖条读数不低于此值视为“满”
+}
+
+MODE_ACTIVE = "active"
+MODE_IDLE = "idle"
+MODE_NAMES = {MODE_ACTIVE: "全速", MODE_IDLE: "探测"}
+
+
+def union_region(regions):
+    """多个 (x, y, w, h) 的外接矩形；没有区域时返回 None"""
+    regions = [r for r in regions if r]
+    if not regions:
+        return None
+    x0 = min(r[0] for r in regions)
+    y0 = min(r[1] for r in regions)
+    x1 = max(r[0] + r[2] for r in regions)
+    y1 = max(r[1] + r[3] for r in regions)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def region_specs(cfg):
+    """
+    把 hp / mp 的旧配置和 "regions" 列表统一成区域规格列表（名字重复的后者被忽略）。
+    :return: (规格列表, 警告文字列表)
+    """
+    specs = []
+    for name, color, event, timer_event in (("hp", "red_green", EVENT_HP, EVENT_HP_TIMER),
+                                            ("mp", "blue", EVENT_MP, EVENT_MP_TIMER)):
+        if not cfg[f"{name}_region"]:
+            continue
+        spec = dict(REGION_DEFAULTS)
+        spec.update({
+            "name": name, "color": color, "region": tuple(cfg[f"{name}_region"]),
+            "key": cfg[f"{name}_key"], "fallback_key": cfg[f"{name}_fallback_key"],
+            "below": cfg[f"{name}_threshold"], "disabled": cfg[f"disable_{name}"],
+            "timer": cfg[f"{name}_timer_interval"] if cfg[f"enable_{name}_timer"] else 0.0,
+            "interval": cfg[f"{name}_interval"],
+            "events": (event, timer_event),
+        })
+        specs.append(spec)
+
+    warnings = []
+    names = {s["name"] for s in specs}
+    for raw in cfg.get("regions") or []:
+        spec = dict(REGION_DEFAULTS)
+        spec.update(raw)
+        name = spec["name"]
+        if not name or name in names:
+            warnings.append(f"⚠️ 区域名为空或重复，已忽略: {name!r}")
+            continue
+        if spec["type"] not in REGION_TYPES:
+            warnings.append(f"⚠️ 区域 {name} 类型未知: {spec['type']}")
+            continue
+        if not spec["region"] or len(spec["region"]) != 4:
+            warnings.append(f"⚠️ 区域 {name} 未设置坐标")
+            continue
+        spec["region"] = tuple(int(v) for v in spec["region"])
+        spec["events"] = (EVENT_REGION, EVENT_REGION_TIMER)
+        names.add(name)
+        specs.append(spec)
+    return specs, warnings
+
+
+def flask_slots(cfg):
+    """:return: ({按键: 药瓶槽规格}, 警告文字列表)"""
+    slots, warnings = {}, []
+    for raw in cfg.get("flasks") or []:
+        slot = dict(FLASK_DEFAULTS)
+        slot.update(raw)
+        key = str(slot["key"])
+        if not key or key in slots or not slot["region"] or len(slot["region"]) != 4:
+            warnings.append(f"⚠️ 药瓶槽按键为空、重复或未设置坐标，已忽略: {key!r}")
+            continue
+        slot["key"] = key
+        slot["region"] = tuple(int(v) for v in slot["region"])
+        slots[key] = slot
+    return slots, warnings
+
+
+def flask_state(slot, reading):
+    """药瓶槽读数 → FLASK_OK / FLASK_EMPTY / FLASK_ACTIVE（读不到时视为可用）"""
+    if reading is None:
+        return FLASK_OK
+    if reading["charge"] < slot["min_charge"]:
+        return FLASK_EMPTY
+    if slot["active_glow"] is not None and reading["glow"] > slot["active_glow"]:
+        return FLASK_ACTIVE
+    return FLASK_OK
+
+
+def rule_triggered(spec, value):
+    """读数是否满足区域的触发规则（没有任何规则时不触发）"""
+    if value is None:
+        return False
+    below, above, present = spec["below"], spec["above"], spec["present"]
+    if below is None and above is None and present is None:
+        return False
+    if below is not None and not value < below:
+        return False
+    if above is not None and not value > above:
+        return False
+    if present is not None and (value >= spec["threshold"]) != bool(present):
+        return False
+    return True
+
+
+def format_event(kind, key, value, config, name=""):
+    """把事件转成与原界面相同的日志文字"""
+    if kind == EVENT_HP:
+        return f"🩸 HP {value:.1f}% → 按 '{key}'"
+    if kind == EVENT_MP:
+        return f"💧 MP {value:.1f}% → 按 '{key}'"
+    if kind == EVENT_HP_TIMER:
+        return f"⏱️ 定时喝 HP（每 {config.get('hp_timer_interval')}s）"
+    if kind == EVENT_MP_TIMER:
+        return f"⏱️ 定时喝 MP（每 {config.get('mp_timer_interval')}s）"
+    if kind == EVENT_REGION:
+        return f"🔔 {name} {value:.2f} → 按 '{key}'"
+    if kind == EVENT_REGION_TIMER:
+        return f"⏱️ 定时按 '{key}'（{name}）"
+    return ""
+
+
+class SceneClassifier:
+    """
+    判断当前画面是否“不在战斗”：竖条全部无效，或全部满且与上一帧相差不超过 change_eps。
+    连续 idle_after 秒满足即进入 MODE_IDLE；一旦不满足立即回到 MODE_ACTIVE。
+    """
+
+    def __init__(self, idle_after=5.0, full_threshold=98.0, change_eps=1.0):
+        self.idle_after = idle_after
+        self.full_threshold = full_threshold
+        self.change_eps = change_eps
+        self.mode = MODE_ACTIVE
+        self.reason = ""
+        self._since = None
+        self._last = None
+
+    def quiet_reason(self, bars):
+        """:param bars: 竖条读数列表；返回“安静”的原因，不安静时返回空字符串"""
+        last, self._last = self._last, bars
+        if not bars:
+            return ""
+        if all(v is None for v in bars):
+            return "无有效血条"
+        if any(v is None or v < self.full_threshold for v in bars):
+            return ""
+        if last is None or len(last) != len(bars) or any(
+                p is None or abs(v - p) > self.change_eps for v, p in zip(bars, last)):
+            return ""
+        return "满血不变"
+
+    def update(self, bars, now):
+        """:return: 模式是否发生变化"""
+        reason = self.quiet_reason(bars)
+        old = self.mode
+        if not reason or self.idle_after <= 0:
+            self._since = None
+            self.mode = MODE_ACTIVE
+        else:
+            if self._since is None:
+                self._since = now
+            if now - self._since >= self.idle_after:
+                self.mode = MODE_IDLE
+                self.reason = reason
+        return self.mode != old
+
+
+class ModeMeter:
+    """按模式累计墙钟时间和进程 CPU 时间（time.process_time）"""
+
+    def __init__(self):
+        self.wall = {}
+        self.cpu = {}
+        self.switches = 0
+        self._mode = None
+        self._wall0 = self._cpu0 = 0.0
+
+    def enter(self, mode):
+        """切换（或开始）到 mode，把上一段时间记到上一个模式"""
+        wall, cpu = time.perf_counter(), time.process_time()
+        if self._mode is not None:
+            self.wall[self._mode] = self.wall.get(self._mode, 0.0) + wall - self._wall0
+            self.cpu[self._mode] = self.cpu.get(self._mode, 0.0) + cpu - self._cpu0
+            if mode != self._mode:
+                self.switches += 1
+        self._mode, self._wall0, self._cpu0 = mode, wall, cpu
+
+    def stats(self):
+        """{模式: {wall_s, cpu_s, cpu_s_per_hour}}"""
+        return {mode: {"wall_s": wall, "cpu_s": self.cpu[mode],
+                       "cpu_s_per_hour": self.cpu[mode] / wall * 3600 if wall > 0 else 0.0}
+                for mode, wall in self.wall.items()}
+
+    def format_stats(self):
+        self.enter(self._mode)
+        parts = [f"{MODE_NAMES.get(mode, mode)} {st['wall_s'] / 60:.1f} 分钟 CPU {st['cpu_s']:.2f}s"
+                 f"（{st['cpu_s_per_hour']:.0f} s/小时）" for mode, st in self.stats().items()]
+        return "🔋 检测模式: " + " | ".join(parts) + f" | 切换 {self.switches} 次"
+
+
+class FlaskMonitor:
+    def __init__(self, config, tracer=None):
+        """
+        :param config: 与 CombinedApp.get_config() 相同结构的字典
+        :param tracer: latency_trace.SpanTracer，记录 planes 和各检测器阶段
+        """
+        self.tracer = NULL_TRACER if tracer is None else tracer
+        self.last_press = {}      # 区域名 → 上次规则触发按键时间
+        self.values = {}          # 各检测器最近一次的读数（各区域采样时刻不同）
+        self.slots = {}
+        self.pressed = {}         # 按键 → 实际按下次数
+        self.suppressed = {}      # 按键 → {FLASK_EMPTY: n, FLASK_ACTIVE: n}
+        self.fallbacks = 0        # 主键不可用、改按备用键的次数
+        self.dropped = 0          # 主键和备用键都不可用而放弃的按键次数
+        self.config = {}
+        self.specs = []
+        self.warnings = []        # 配置问题，由调用方取走后清空
+        self.graph = None
+        self._layout = None
+        self.scene = SceneClassifier()
+        self.mode_changed = False  # 最近一次 sample 是否切换了模式
+        self.update_config(config)
+
+    def update_config(self, config):
+        cfg = dict(DEFAULT_CONFIG)
+        cfg.update(config or {})
+        for key in ("hp_region", "mp_region"):
+            cfg[key] = tuple(cfg[key]) if cfg[key] else None
+        specs, warnings = region_specs(cfg)
+        slots, slot_warnings = flask_slots(cfg)
+        self.warnings.extend(warnings + slot_warnings)
+        # 只有区域、检测类型或线程数变化时才重建检测图（阈值、按键等改动不影响检测）
+        layout = (tuple((s["name"], s["type"], s["region"], str(s["color"]), s["template"]) for s in specs),
+                  tuple((key, slot["region"]) for key, slot in slots.items()),
+                  cfg["detector_workers"])
+        if self.graph is None or layout != self._layout:
+            if self.graph is not None:
+                self.graph.close()
+            self.graph = DetectorGraph(self.build_detectors(specs, slots), workers=cfg["detector_workers"],
+                                       tracer=self.tracer)
+            self._layout = layout
+        self.config = cfg
+        self.specs = specs
+        self.slots = slots
+        self.scene.idle_after = cfg["idle_after"]
+        self.scene.full_threshold = cfg["full_threshold"]
+
+    def build_detectors(self, specs, slots=None):
+        detectors = [FlaskSlotDetector(f"flask:{key}", slot["region"]) for key, slot in (slots or {}).items()]
+        brightness = {}
+        for spec in specs:
+            name, roi = spec["name"], spec["region"]
+            if spec["type"] == "bar":
+                detectors.append(BarDetector(name, roi, spec["color"]))  # hp 自动支持红/绿
+            elif spec["type"] == "brightness":
+                brightness[name] = roi
+            elif spec["type"] == "icon":
+                try:
+                    detectors.append(TemplateDetector.from_file(name, roi, spec["template"]))
+                except Exception as e:
+                    self.warnings.append(f"⚠️ 区域 {name}: {e}")
+        if brightness:
+            # 所有亮度区域合成一个检测器，一次向量化计算
+            detectors.append(MeanBrightnessGroup("[brightness]", brightness))
+        return detectors
+
+    @property
+    def region_names(self):
+        """配置中 "regions" 列表各项的名字（读数按此顺序写入共享内存）"""
+        return [r.get("name", "") for r in self.config.get("regions") or []]
+
+    @property
+    def mode(self):
+        return self.scene.mode
+
+    def interval(self, spec=None):
+        """当前模式下区域的采样周期（探测模式下所有区域统一用 idle_interval）"""
+        if self.scene.mode == MODE_IDLE:
+            return self.config["idle_interval"]
+        if spec is not None and spec["interval"]:
+            return spec["interval"]
+        return self.config["check_interval"]
+
+    def jobs(self):
+        """
+        当前应有的周期任务 {任务名: (类型, 区域名, 周期秒, 允许抖动秒)}，类型为 "sample" / "timer"。
+        调用方据此增删、调整调度器中的任务。
+        """
+        jobs = {}
+        for spec in self.specs:
+            name = spec["name"]
+            period = self.interval(spec)
+            tolerance = spec["tolerance"] if spec["tolerance"] is not None and self.mode != MODE_IDLE else None
+            jobs[f"sample:{name}"] = ("sample", name, period, period * 0.1 if tolerance is None else tolerance)
+            if spec["timer"] and not spec["disabled"] and spec["key"]:
+                jobs[f"timer:{name}"] = ("timer", name, spec["timer"], spec["timer_tolerance"])
+        return jobs
+
+    def capture_region(self, names=None):
+        """本次需要截取的屏幕区域（names 中的区域与所有药瓶槽的外接矩形；names 为 None 表示全部区域）"""
+        regions = [s["region"] for s in self.specs if names is None or s["name"] in names]
+        if not regions:
+            return None
+        return union_region(regions + [s["region"] for s in self.slots.values()])
+
+    def choose_key(self, spec, values):
+        """按主键、备用键的顺序选第一个可用的药瓶；都不可用时返回 None"""
+        for i, key in enumerate((spec["key"], spec["fallback_key"])):
+            if not key:
+                continue
+            slot = self.slots.get(key)
+            state = FLASK_OK if slot is None else flask_state(slot, values.get(f"flask:{key}"))
+            if state == FLASK_OK:
+                if i:
+                    self.fallbacks += 1
+                self.pressed[key] = self.pressed.get(key, 0) + 1
+                return key
+            counts = self.suppressed.setdefault(key, {FLASK_EMPTY: 0, FLASK_ACTIVE: 0})
+            counts[state] += 1
+        self.dropped += 1
+        return None
+
+    def sample(self, screen, origin=(0, 0), names=None, now=None):
+        """
+        处理一帧中 names 这些区域（None 表示全部）的读数并按规则给出按键；定时按键见 fire_timer。
+        :param screen: RGB 截图（至少覆盖 capture_region(names)）
+        :param origin: screen 左上角的屏幕坐标
+        :param now: 单调时钟秒数（冷却用）
+        :return: ({区域名: 读数或 None}, [(事件类型, 按键, 数值, 区域名)])
+        """
+        now = time.monotonic() if now is None else now
+        only = None if names is None else set(names) | {f"flask:{key}" for key in self.slots}
+        values = self.graph.run(screen, origin, only)
+        # 只含 only 中的区域（分组检测器按 only 过滤），其余区域保留上一次的读数
+        self.values.update(values)
+        self.mode_changed = self.scene.update(
+            [self.values.get(s["name"]) for s in self.specs if s["type"] == "bar"], now)
+
+        actions = []
+        for spec in self.specs:
+            name = spec["name"]
+            if names is not None and name not in names:
+                continue
+            value = values.get(name)
+            if value is None or spec["disabled"] or not spec["key"]:
+                continue
+            # 药瓶都不可用时不记录按键时间，下一帧再试
+            if rule_triggered(spec, value) and now - self.last_press.get(name, -1e18) >= spec["cooldown"]:
+                key = self.choose_key(spec, values)
+                if key is not None:
+                    actions.append((spec["events"][0], key, value, name))
+                    self.last_press[name] = now
+        return values, actions
+
+    def fire_timer(self, name):
+        """
+        定时按键任务：区域最近一次读数有效时按下（药瓶不可用则跳过本周期）。
+        :return: (事件类型, 按键, 数值, 区域名) 或 None
+        """
+        spec = next((s for s in self.specs if s["name"] == name), None)
+        if spec is None or spec["disabled"] or not spec["key"]:
+            return None
+        value = self.values.get(name)
+        if value is None:
+            return None
+        key = self.choose_key(spec, self.values)
+        if key is None:
+            return None
+        return spec["events"][1], key, value, name
+
+    def format_flask_stats(self):
+        """各按键的按下 / 抑制次数；没有配置药瓶槽时返回空字符串"""
+        if not self.slots and not self.suppressed:
+            return ""
+        parts = []
+        for key in sorted(set(self.pressed) | set(self.suppressed)):
+            counts = self.suppressed.get(key, {})
+            parts.append(f"'{key}' 按下 {self.pressed.get(key, 0)} / 空瓶跳过 {counts.get(FLASK_EMPTY, 0)}"
+                         f" / 生效中跳过 {counts.get(FLASK_ACTIVE, 0)}")
+        return ("🧪 药瓶: " + " | ".join(parts)
+                + f" | 备用键接替 {self.fallbacks} 次 | 无药可用放弃 {self.dropped} 次")
+
+    def take_warnings(self):
+        warnings, self.warnings = self.warnings, []
+        return warnings
+
+    def format_costs(self):
+        return self.graph.format_costs()
+
+    def close(self):
+        self.graph.close()
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+洗练截图语料（只追加、内存映射）
+目录结构：
+    meta.json   帧形状/类型、模板名称表
+    frames.u8   所有帧按顺序拼接的原始字节（固定形状）
+    index.bin   与帧一一对应的定长索引记录（时间戳、第几次洗练、得分、判定）
+读取时两个文件都通过 np.memmap 映射，按下标取帧返回的是视图，不复制数据。
+"""
+
+import os
+import re
+import json
+import time
+import datetime
+
+import numpy as np
+
+CORPUS_VERSION = 1
+
+# 判定结果编码
+DECISION_UNKNOWN = -1   # 导入的旧缓存，无判定信息
+DECISION_MISS = 0       # 主词条未匹配
+DECISION_MAIN_ONLY = 1  # 主词条匹配，T阶未匹配
+DECISION_SUCCESS = 2    # 主词条 + T阶均匹配
+
+INDEX_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("attempt", "<i4"),
+    ("main_score", "<f4"),
+    ("tier_score", "<f4"),
+    ("template", "<i2"),   # 模板名称表下标，-1 表示无
+    ("decision", "i1"),
+    ("_pad", "u1"),
+])
+
+_META_FILE = "meta.json"
+_FRAMES_FILE = "frames.u8"
+_INDEX_FILE = "index.bin"
+
+
+def _read_meta(corpus_dir):
+    path = os.path.join(corpus_dir, _META_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_meta(corpus_dir, meta):
+    path = os.path.join(corpus_dir, _META_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+class CorpusWriter:
+    def __init__(self, corpus_dir, shape, dtype="uint8"):
+        """
+        打开（或新建）语料目录用于追加。
+        :param shape: 单帧形状，如 (h, w, 3)；已有语料的形状必须一致
+        """
+        os.makedirs(corpus_dir, exist_ok=True)
+        self.corpus_dir = corpus_dir
+        self.shape = tuple(int(v) for v in shape)
+        self.dtype = np.dtype(dtype)
+
+        meta = _read_meta(corpus_dir)
+        if meta is None:
+            meta = {"version": CORPUS_VERSION, "shape": list(self.shape),
+                    "dtype": self.dtype.str, "templates": []}
+            _write_meta(corpus_dir, meta)
+        elif tuple(meta["shape"]) != self.shape or np.dtype(meta["dtype"]) != self.dtype:
+            raise ValueError(f"语料帧形状不一致: 已有 {tuple(meta['shape'])}，写入 {self.shape}")
+        self.meta = meta
+        self._template_ids = {name: i for i, name in enumerate(meta["templates"])}
+
+        self.frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self._frames = open(os.path.join(corpus_dir, _FRAMES_FILE), "ab")
+        self._index = open(os.path.join(corpus_dir, _INDEX_FILE), "ab")
+        self._truncate_to_consistent()
+        self._record = np.zeros(1, dtype=INDEX_DTYPE)
+
+    def _truncate_to_consistent(self):
+        """上次异常退出时两个文件可能长度不一致，截断到完整记录数"""
+        n_frames = self._frames.seek(0, os.SEEK_END) // self.frame_bytes
+        n_index = self._index.seek(0, os.SEEK_END) // INDEX_DTYPE.itemsize
+        n = min(n_frames, n_index)
+        self._frames.truncate(n * self.frame_bytes)
+        self._index.truncate(n * INDEX_DTYPE.itemsize)
+        self.count = n
+
+    def _template_id(self, name):
+        if not name:
+            return -1
+        tid = self._template_ids.get(name)
+        if tid is None:
+            tid = len(self.meta["templates"])
+            self.meta["templates"].append(name)
+            self._template_ids[name] = tid
+            _write_meta(self.corpus_dir, self.meta)
+        return tid
+
+    def append(self, frame, attempt=0, main_score=0.0, tier_score=0.0,
+               decision=DECISION_UNKNOWN, template=None, timestamp=None):
+        """追加一帧及其索引记录，返回该帧的下标"""
+        if frame.shape != self.shape or frame.dtype != self.dtype:
+            raise ValueError(f"帧形状不一致: {frame.shape}/{frame.dtype}，需要 {self.shape}/{self.dtype}")
+        rec = self._record
+        rec["timestamp"] = time.time() if timestamp is None else timestamp
+        rec["attempt"] = attempt
+        rec["main_score"] = main_score
+        rec["tier_score"] = tier_score
+        rec["template"] = self._template_id(template)
+        rec["decision"] = decision
+        self._frames.write(np.ascontiguousarray(frame).data)
+        self._index.write(rec.tobytes())
+        self.count += 1
+        return self.count - 1
+
+    def flush(self):
+        self._frames.flush()
+        self._index.flush()
+
+    def close(self):
+        if not self._frames.closed:
+            self.flush()
+            self._frames.close()
+            self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CorpusReader:
+    def __init__(self, corpus_dir):
+        meta = _read_meta(corpus_dir)
+        if meta is None:
+            raise FileNotFoundError(f"不是有效的语料目录: {corpus_dir}")
+        self.corpus_dir = corpus_dir
+        self.meta = meta
+        self.shape = tuple(meta["shape"])
+        self.dtype = np.dtype(meta["dtype"])
+        self.templates = list(meta["templates"])
+
+        frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        frames_path = os.path.join(corpus_dir, _FRAMES_FILE)
+        index_path = os.path.join(corpus_dir, _INDEX_FILE)
+        n_frames = os.path.getsize(frames_path) // frame_bytes if os.path.exists(frames_path) else 0
+        n_index = os.path.getsize(index_path) // INDEX_DTYPE.itemsize if os.path.exists(index_path) else 0
+        n = min(n_frames, n_index)
+
+        # 空文件无法 memmap，用零长度数组代替
+        if n == 0:
+            self.frames = np.zeros((0,) + self.shape, dtype=self.dtype)
+            self.index = np.zeros(0, dtype=INDEX_DTYPE)
+        else:
+            self.frames = np.memmap(frames_path, dtype=self.dtype, mode="r", shape=(n,) + self.shape)
+            self.index = np.memmap(index_path, dtype=INDEX_DTYPE, mode="r", shape=(n,))
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        """返回 (帧视图, 索引记录)，不复制帧数据"""
+        return self.frames[i], self.index[i]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.frames[i], self.index[i]
+
+    def template_name(self, tid):
+        return self.templates[tid] if 0 <= tid < len(self.templates) else None
+
+    def select(self, decision=None):
+        """按判定结果筛选，返回下标数组"""
+        if decision is None:
+            return np.arange(len(self))
+        return np.nonzero(self.index["decision"] == decision)[0]
+
+
+# ==================== 从旧的 PNG 缓存导入 ====================
+_CACHE_TS_RE = re.compile(r"_(\d{8}_\d{6}_\d{6})\.(png|jpg|npy)$")
+
+
+def import_png_cache(cache_dir, corpus_dir, prefix="equip_mods"):
+    """
+    将 equipment_cache 中某个前缀的截图按时间顺序导入语料。
+    旧缓存没有得分与判定信息，记录为 DECISION_UNKNOWN；
+    注意 equip_mods 缓存是带标注框的结果图，并非原始截图。
+    形状与第一帧不一致的文件会被跳过。
+    :return: (导入数量, 跳过数量)
+    """
+    from cache_manager import load_cached_image
+
+    files = []
+    for name in os.listdir(cache_dir):
+        m = _CACHE_TS_RE.search(name)
+        if m and name[:m.start()] == prefix:
+            files.append((m.group(1), name))
+    files.sort()
+
+    writer = None
+    imported = skipped = 0
+    try:
+        for ts, name in files:
+            img = load_cached_image(os.path.join(cache_dir, name))
+            if img is None:
+                skipped += 1
+                continue
+            if writer is None:
+                writer = CorpusWriter(corpus_dir, img.shape, img.dtype)
+            if img.shape != writer.shape or img.dtype != writer.dtype:
+                skipped += 1
+                continue
+            timestamp = datetime.datetime.strptime(ts, "%Y%m%d_%H%M%S_%f").timestamp()
+            writer.append(img, timestamp=timestamp)
+            imported += 1
+    finally:
+        if writer is not None:
+            writer.close()
+    return imported, skipped
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="洗练截图语料工具")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_imp = sub.add_parser("import", help="从 PNG 缓存导入")
+    p_imp.add_argument("cache_dir")
+    p_imp.add_argument("corpus_dir")
+    p_imp.add_argument("--prefix", default="equip_mods")
+    p_info = sub.add_parser("info", help="显示语料统计")
+    p_info.add_argument("corpus_dir")
+    args = parser.parse_args()
+
+    if args.cmd == "import":
+        n, skipped = import_png_cache(args.cache_dir, args.corpus_dir, args.prefix)
+        print(f"✅ 已导入 {n} 帧，跳过 {skipped} 个文件")
+    else:
+        reader = CorpusReader(args.corpus_dir)
+        print(f"📦 {args.corpus_dir}: {len(reader)} 帧，形状 {reader.shape}")
+        for code, label in [(DECISION_UNKNOWN, "未知"), (DECISION_MISS, "主词条未匹配"),
+                            (DECISION_MAIN_ONLY, "仅主词条"), (DECISION_SUCCESS, "成功")]:
+            print(f"  {label}: {len(reader.select(code))}")
@@ -0,0 +1,625 @@
+# -*- coding: utf-8 -*-
+"""
+本地字形模板 OCR（属性面板）
+游戏提示框只用少数几种字体和颜色，所以不必调用远程多模态模型：
+1. 字形库：从“截图 + 远程 OCR 结果”配对中按文字收集字形（harvest），每个字符取多次样本的平均位图。
+2. 识别：二值化并去噪点、去掉关键词下的虚线下划线 → 按水平投影切行 → 按垂直投影切出连通列段 → 1~3 个相邻列段组合成候选字形，
+   所有候选一次矩阵乘法与字形库匹配，动态规划选出总失配（按宽度加权）最小的切分；
+   间隔大于行高 SPACE_RATIO 倍处输出空格，行间输出换行（与远程结果 output_raw.txt 同形）。
+3. 词典纠错：每段连续汉字与已知词缀短语按编辑距离比对，足够接近时替换为短语。
+   已能拼成已知短语的汉字段不改；距离最近的短语不唯一时也不改（宁可留着原文，不凭空编出词缀）。
+
+用法：
+    python glyph_ocr.py harvest --image shot.png --text shot.txt --bank glyph_bank.npz
+    python glyph_ocr.py ocr --image shot.png --bank glyph_bank.npz
+    python glyph_ocr.py bench --pairs ocr_pairs/ --bank glyph_bank.npz     # 与远程结果对比准确率、字符/毫秒
+    python glyph_ocr.py bench --synthetic                                  # 合成字形自检 + 示例截图收集 / 识别
+--pairs 目录中每张 xxx.png 对应一个 xxx.txt（远程 OCR 结果）。
+"""
+
+import argparse
+import glob
+import os
+import re
+import time
+
+import cv2
+import numpy as np
+
+GLYPH_SIZE = 16            # 字形归一化边长
+SPACE_RATIO = 0.45         # 列段间隔 > 行高 × 此值时输出空格
+MAX_SPAN = 3               # 一个字形最多由几个相邻列段组成（左右结构的汉字）
+MAX_GLYPH_WIDTH = 1.3      # 候选字形最大宽度（行高的倍数）
+MIN_ROW_HEIGHT = 5
+MIN_BLOB = 3               # 小于此面积的连通块视为噪点（句点约 4 像素）
+UNDERLINE_HEIGHT = 3       # 下划线虚线段的最大高度
+UNDERLINE_ZONE = 0.8       # 顶边低于行高此比例处的扁平连通块视为下划线（连字符在行中部，不受影响）
+SKIP_COST = 0.5            # 对齐时丢弃一个列段（杂点）的代价（另加其宽度 / 行高）
+AFFIX_LABELS = ("前綴", "後綴", "固定")     # 暗灰色标签，Otsu 二值化后通常不在图中
+DEFAULT_BANK = "glyph_bank.npz"
+
+# 已知词缀短语（繁体，与游戏文本一致），用于纠正识别出的汉字段
+KNOWN_PHRASES = [
+    "前綴", "後綴", "固定", "攻擊附加", "附加", "至", "物理傷害", "火焰傷害", "冰冷傷害", "閃電傷害", "混沌傷害",
+    "點力量", "點敏捷", "點智慧", "點全屬性", "最大生命", "最大魔力", "最大能量護盾",
+    "火焰抗性", "冰冷抗性", "閃電抗性", "混沌抗性", "全部元素抗性", "所有元素抗性", "上限",
+    "攻擊速度", "施放速度", "暴擊率", "暴擊傷害加成", "命中值", "移動速度",
+    "所有投射物技能石等級", "所有法術技能石等級", "所有近戰技能石等級", "所有技能石等級",
+    "物理傷害增加", "法術傷害增加", "元素傷害增加", "生命再生", "魔力再生", "護甲", "閃避值",
+    "擊中時獲得生命", "擊殺時獲得魔力", "偷取生命", "偷取魔力",
+]
+
+_CJK_RUN = re.compile(r"[㐀-鿿]+")
+
+
+# ==================== 预处理 ====================
+def binarize(image):
+    """提示框文字比背景亮：取各通道最大值做 Otsu 二值化，返回 0/1 的 uint8"""
+    if image.ndim == 3:
+        gray = image.max(axis=2)
+    else:
+        gray = image
+    gray = np.ascontiguousarray(gray, dtype=np.uint8)
+    _, binary = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # 去掉噪点（面积小于 MIN_BLOB 的 8 连通块），否则投影切行 / 切列会被噪点连成一片
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    small = np.flatnonzero(stats[:, cv2.CC_STAT_AREA] < MIN_BLOB)
+    small = small[small > 0]
+    if len(small):
+        binary[np.isin(labels, small)] = 0
+    return binary
+
+
+def drop_underlines(binary):
+    """
+    去掉关键词下的虚线下划线（原地修改并返回）：每行底部 UNDERLINE_ZONE 以下、高度不超过 UNDERLINE_HEIGHT 的连通块。
+    下划线的点划填满了字间空隙，不去掉时相邻几个字连成一个 50~100 像素宽的列段，无法切字。
+    """
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    top, height = stats[:, cv2.CC_STAT_TOP], stats[:, cv2.CC_STAT_HEIGHT]
+    drop = []
+    for y0, y1 in segment_rows(binary):
+        hit = np.flatnonzero((top >= y0 + UNDERLINE_ZONE * (y1 - y0)) & (top < y1) & (height <= UNDERLINE_HEIGHT))
+        drop.extend(hit[hit > 0])
+    if drop:
+        binary[np.isin(labels, drop)] = 0
+    return binary
+
+
+def _runs(mask):
+    """一维布尔数组中连续 True 的 [(start, end)]"""
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return list(zip(edges[::2], edges[1::2]))
+
+
+def segment_rows(binary, min_height=MIN_ROW_HEIGHT, merge_gap=1):
+    """水平投影切行；相隔不超过 merge_gap 像素的行段合并（“二”“三”等上下分离的字）"""
+    rows = []
+    for y0, y1 in _runs(binary.any(axis=1)):
+        if rows and y0 - rows[-1][1] <= merge_gap:
+            rows[-1] = (rows[-1][0], y1)
+        else:
+            rows.append((y0, y1))
+    return [(int(y0), int(y1)) for y0, y1 in rows if y1 - y0 >= min_height]
+
+
+def line_bands(binary, rows):
+    """每行取以行中心为中心、高度为各行高中位数的带（同一图中字形位置可比）"""
+    if not rows:
+        return []
+    h = int(np.median([y1 - y0 for y0, y1 in rows]))
+    bands = []
+    for y0, y1 in rows:
+        height = max(h, y1 - y0)
+        top = max(0, (y0 + y1 - height) // 2)
+        bands.append((top, min(binary.shape[0], top + height)))
+    return bands
+
+
+def column_segments(band):
+    return [(int(x0), int(x1)) for x0, x1 in _runs(band.any(axis=0))]
+
+
+def normalize_glyph(glyph, height):
+    """字形（行带高度 × 字宽）水平居中补成正方形后缩放到 GLYPH_SIZE，返回零均值单位长度向量"""
+    h, w = glyph.shape
+    side = max(height, w)
+    box = np.zeros((side, side), np.float32)
+    x = (side - w) // 2
+    box[(side - h) // 2:(side - h) // 2 + h, x:x + w] = glyph
+    vec = cv2.resize(box, (GLYPH_SIZE, GLYPH_SIZE), interpolation=cv2.INTER_AREA).ravel()
+    vec -= vec.mean()
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm > 0 else vec
+
+
+# ==================== 字形库 ====================
+class GlyphBank:
+    """字符 → 平均字形向量；matrix 为 (字符数, GLYPH_SIZE²) 的单位向量矩阵"""
+
+    def __init__(self):
+        self._sums = {}
+        self._counts = {}
+        self._chars = None
+        self._matrix = None
+
+    def __len__(self):
+        return len(self._sums)
+
+    def add(self, char, vec):
+        if char in self._sums:
+            self._sums[char] = self._sums[char] + vec
+            self._counts[char] += 1
+        else:
+            self._sums[char] = vec.astype(np.float32).copy()
+            self._counts[char] = 1
+        self._chars = None
+
+    def _build(self):
+        self._chars = list(self._sums)
+        m = np.stack([self._sums[c] for c in self._chars]).astype(np.float32)
+        m /= np.maximum(np.linalg.norm(m, axis=1, keepdims=True), 1e-6)
+        self._matrix = m
+
+    def match(self, vecs):
+        """
+        :param vecs: (n, D) 候选字形向量
+        :return: (字符列表, 得分数组)，得分为余弦相似度
+        """
+        if self._chars is None:
+            self._build()
+        scores = vecs @ self._matrix.T
+        best = scores.argmax(axis=1)
+        return [self._chars[i] for i in best], scores[np.arange(len(vecs)), best]
+
+    def save(self, path):
+        chars = list(self._sums)
+        np.savez_compressed(path, chars=np.array(chars), sums=np.stack([self._sums[c] for c in chars]),
+                            counts=np.array([self._counts[c] for c in chars]))
+
+    @classmethod
+    def load(cls, path):
+        bank = cls()
+        if os.path.exists(path):
+            data = np.load(path)
+            for c, s, n in zip(data["chars"], data["sums"], data["counts"]):
+                bank._sums[str(c)] = s.astype(np.float32)
+                bank._counts[str(c)] = int(n)
+        return bank
+
+
+# ==================== 收集字形 ====================
+def _expected_width(char, height):
+    if _CJK_RUN.match(char):
+        return 0.95 * height
+    if char in "()[]+-.,:;%'|!":
+        return 0.3 * height
+    return 0.55 * height
+
+
+def align_segments(segments, text, height):
+    """
+    把一行的列段按宽度对齐到已知文字（去掉空格）：每个字符覆盖 1~MAX_SPAN 个相邻列段，
+    列段也可以丢弃（杂点，代价 SKIP_COST + 宽度），动态规划使 |实际宽度 - 期望宽度| 之和最小。
+    :return: [(字符, x0, x1)]，无法对齐（列段少于字符）时返回 None
+    """
+    chars = [c for c in text if not c.isspace()]
+    n, m = len(chars), len(segments)
+    if n == 0 or m < n:
+        return None
+    inf = float("inf")
+    cost = np.full((n + 1, m + 1), inf)
+    back = np.zeros((n + 1, m + 1), np.int64)
+    cost[0, 0] = 0.0
+    skip = [SKIP_COST + (x1 - x0) / height for x0, x1 in segments]
+    for k in range(1, m + 1):
+        cost[0, k] = cost[0, k - 1] + skip[k - 1]
+    for j in range(1, n + 1):
+        expect = _expected_width(chars[j - 1], height)
+        for k in range(j, m + 1):
+            if k > j and cost[j, k - 1] + skip[k - 1] < cost[j, k]:
+                cost[j, k] = cost[j, k - 1] + skip[k - 1]
+                back[j, k] = 0
+            for span in range(1, min(MAX_SPAN, k) + 1):
+                prev = cost[j - 1, k - span]
+                if prev == inf:
+                    continue
+                width = segments[k - 1][1] - segments[k - span][0]
+                c = prev + abs(width - expect) / height
+                if c < cost[j, k]:
+                    cost[j, k] = c
+                    back[j, k] = span
+    if cost[n, m] == inf:
+        return None
+    out, j, k = [], n, m
+    while j > 0:
+        span = back[j, k]
+        if span == 0:
+            k -= 1
+            continue
+        out.append((chars[j - 1], segments[k - span][0], segments[k - 1][1]))
+        j, k = j - 1, k - span
+    return out[::-1]
+
+
+def harvest(bank, image, text, max_cost=0.35):
+    """
+    用远程 OCR 结果给截图中的字形打标签并加入字形库。
+    行数不一致（远程 OCR 漏行）时整张跳过；某行平均对齐误差超过 max_cost（行高倍数）时跳过该行。
+    行首的暗灰色标签（AFFIX_LABELS）二值化后通常不在图中：带标签对齐不上时去掉标签再试一次。
+    :return: 加入的字形数
+    """
+    binary = drop_underlines(binarize(image))
+    rows = segment_rows(binary)
+    bands = line_bands(binary, rows)
+    lines = [line for line in text.splitlines() if line.strip()]
+    if len(lines) != len(bands):
+        return 0
+    added = 0
+    for (top, bottom), line in zip(bands, lines):
+        band = binary[top:bottom]
+        height = bottom - top
+        segments = column_segments(band)
+        candidates = [line.strip()]
+        for label in AFFIX_LABELS:
+            if candidates[0].startswith(label):
+                candidates.append(candidates[0][len(label):])
+        aligned = None
+        for candidate in candidates:
+            aligned = align_segments(segments, candidate, height)
+            if aligned is not None and _align_error(aligned, height) <= max_cost:
+                break
+            aligned = None
+        if aligned is None:
+            continue
+        for char, x0, x1 in aligned:
+            bank.add(char, normalize_glyph(band[:, x0:x1].astype(np.float32), height))
+            added += 1
+    return added
+
+
+def _align_error(aligned, height):
+    return float(np.mean([abs((x1 - x0) - _expected_width(c, height)) / height for c, x0, x1 in aligned]))
+
+
+# ==================== 词典纠错 ====================
+def edit_distance(a, b):
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+class PhraseCorrector:
+    def __init__(self, phrases=KNOWN_PHRASES):
+        self.phrases = set(phrases)
+        self.by_length = {}
+        for p in self.phrases:
+            self.by_length.setdefault(len(p), []).append(p)
+        self.corrections = 0
+
+    def is_valid(self, run):
+        """汉字段能完整拼成若干已知短语（如相邻词缀之间没有空格）"""
+        ok = [True] + [False] * len(run)
+        for i in range(len(run)):
+            if ok[i]:
+                for length in self.by_length:
+                    if i + length <= len(run) and run[i:i + length] in self.phrases:
+                        ok[i + length] = True
+        return ok[-1]
+
+    def correct_run(self, run):
+        if len(run) < 3 or self.is_valid(run):
+            return run
+        # 最多改 1 个字（8 字以上的长短语 2 个字），且最近的短语必须唯一；两个字的段改一个字就是一半，不纠
+        limit = 1 if len(run) < 8 else 2
+        best, best_d, ties = run, limit + 1, 0
+        for length in range(len(run) - limit, len(run) + limit + 1):
+            for p in self.by_length.get(length, ()):
+                d = edit_distance(run, p)
+                if d < best_d:
+                    best, best_d, ties = p, d, 1
+                elif d == best_d:
+                    ties += 1
+        if best == run or ties > 1:
+            return run
+        self.corrections += 1
+        return best
+
+    def correct_line(self, line):
+        return _CJK_RUN.sub(lambda m: self.correct_run(m.group(0)), line)
+
+
+# ==================== 识别 ====================
+class GlyphOCR:
+    def __init__(self, bank, phrases=KNOWN_PHRASES, min_score=0.5):
+        """
+        :param bank: GlyphBank
+        :param phrases: 纠错用短语；None 表示不纠错
+        :param min_score: 低于此相似度的字形输出为空（宁缺毋滥）
+        """
+        self.bank = bank
+        self.corrector = PhraseCorrector(phrases) if phrases else None
+        self.min_score = min_score
+        self.chars = 0
+        self.ns = 0
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_BANK, **kwargs):
+        bank = GlyphBank.load(path)
+        if not len(bank):
+            raise ValueError(f"字形库为空或不存在: {path}")
+        return cls(bank, **kwargs)
+
+    def recognize(self, image):
+        """RGB / 灰度截图 → 多行文本（行间换行，词间空格）"""
+        t0 = time.perf_counter_ns()
+        binary = drop_underlines(binarize(image))
+        bands = line_bands(binary, segment_rows(binary))
+        lines = [self.recognize_band(binary[top:bottom]) for top, bottom in bands]
+        text = "\n".join(line for line in lines if line)
+        self.ns += time.perf_counter_ns() - t0
+        self.chars += sum(1 for c in text if not c.isspace())
+        return text
+
+    def recognize_band(self, band):
+        height = band.shape[0]
+        segments = column_segments(band)
+        m = len(segments)
+        if m == 0:
+            return ""
+        space_gap = SPACE_RATIO * height
+        max_width = MAX_GLYPH_WIDTH * height
+
+        # 所有候选（i..k-1 列段组成一个字形），跨越空格间隔或过宽的不要
+        spans, vecs = [], []
+        for i in range(m):
+            for k in range(i + 1, min(m, i + MAX_SPAN) + 1):
+                if k > i + 1 and segments[k - 1][0] - segments[k - 2][1] > space_gap:
+                    break
+                x0, x1 = segments[i][0], segments[k - 1][1]
+                if k > i + 1 and x1 - x0 > max_width:
+                    break
+                spans.append((i, k))
+                vecs.append(normalize_glyph(band[:, x0:x1].astype(np.float32), height))
+        chars, scores = self.bank.match(np.stack(vecs))
+
+        # 动态规划：总失配（1 - 相似度）× 宽度 最小
+        best = np.full(m + 1, np.inf)
+        best[0] = 0.0
+        choice = [None] * (m + 1)
+        by_end = {}
+        for idx, (i, k) in enumerate(spans):
+            by_end.setdefault(k, []).append((i, idx))
+        for k in range(1, m + 1):
+            for i, idx in by_end.get(k, ()):
+                width = segments[k - 1][1] - segments[i][0]
+                c = best[i] + (1.0 - scores[idx]) * width
+                if c < best[k]:
+                    best[k] = c
+                    choice[k] = (i, idx)
+        out, k = [], m
+        while k > 0:
+            i, idx = choice[k]
+            out.append((i, k, chars[idx] if scores[idx] >= self.min_score else ""))
+            k = i
+        out.reverse()
+
+        parts = []
+        for n, (i, k, char) in enumerate(out):
+            if n and segments[i][0] - segments[out[n - 1][1] - 1][1] > space_gap:
+                parts.append(" ")
+            parts.append(char)
+        line = "".join(parts).strip()
+        return self.corrector.correct_line(line) if self.corrector is not None else line
+
+    def stats(self):
+        ms = self.ns / 1e6
+        return {"chars": self.chars, "ms": ms, "chars_per_ms": self.chars / ms if ms else 0.0,
+                "corrections": self.corrector.corrections if self.corrector is not None else 0}
+
+
+# ==================== 基准 ====================
+def char_accuracy(predicted, reference):
+    """1 - 字符编辑距离 / 参考长度（忽略空白）"""
+    p = "".join(predicted.split())
+    r = "".join(reference.split())
+    if not r:
+        return 1.0 if not p else 0.0
+    return max(0.0, 1.0 - edit_distance(p, r) / len(r))
+
+
+def synthetic_font(chars, height=16, seed=7):
+    """
+    合成字形（仅用于自检）：ASCII 用 Hershey 字体，汉字按码位生成固定的随机笔画（部分为左右分离结构）。
+    :return: {字符: 0/1 位图（高 height）}
+    """
+    font = {}
+    for c in chars:
+        if c in font or c.isspace():
+            continue
+        if ord(c) < 128:
+            (w, h), base = cv2.getTextSize(c, cv2.FONT_HERSHEY_PLAIN, height / 16, 1)
+            img = np.zeros((height, w + 2), np.uint8)
+            cv2.putText(img, c, (1, height - 3), cv2.FONT_HERSHEY_PLAIN, height / 16, 1, 1)
+        else:
+            rng = np.random.default_rng(seed * 100003 + ord(c))
+            w = height - 2
+            img = np.zeros((height, w), np.uint8)
+            split = rng.random() < 0.3
+            for _ in range(int(rng.integers(4, 8))):
+                x0, x1 = sorted(rng.integers(0, w, 2))
+                y0, y1 = rng.integers(1, height - 1, 2)
+                if split and x0 < w // 2 <= x1:
+                    x1 = w // 2 - 2
+                cv2.line(img, (int(x0), int(y0)), (int(max(x0, x1)), int(y1)), 1, 1)
+            img[height // 2, :2] = 1
+            img[height // 2, w - 2:] = 1
+        cols = np.flatnonzero(img.any(axis=0))
+        if len(cols):
+            img = img[:, cols[0]:cols[-1] + 1]
+        font[c] = img
+    return font
+
+
+def render_text(font, text, height=16, gap=2, space=9, noise=0.0, seed=0):
+    """用合成字形渲染多行文本，返回 RGB（深色背景、浅色文字）"""
+    lines = text.splitlines()
+    width = max(sum(font[c].shape[1] + gap if not c.isspace() else space for c in line) for line in lines) + 8
+    img = np.zeros((len(lines) * (height + 6) + 6, width), np.uint8)
+    for row, line in enumerate(lines):
+        x, y = 4, 4 + row * (height + 6)
+        for c in line:
+            if c.isspace():
+                x += space
+                continue
+            g = font[c]
+            img[y:y + g.shape[0], x:x + g.shape[1]] |= g
+            x += g.shape[1] + gap
+    rng = np.random.default_rng(seed)
+    if noise:
+        img ^= (rng.random(img.shape) < noise).astype(np.uint8)
+    rgb = np.stack([img * 200, img * 180, img * 120], axis=2).astype(np.uint8) + 15
+    return rgb
+
+
+def bench_synthetic(corpus, rounds=20, noise_levels=(0.0, 0.001, 0.003)):
+    """
+    在合成字形上自检：干净渲染收集字形，再在各噪声水平下识别。
+    :return: (字形数, {噪声: (纠错前准确率, 纠错后准确率)}, 纠错后的识别统计)
+    """
+    font = synthetic_font("".join(corpus))
+    bank = GlyphBank()
+    text = "\n".join(corpus)
+    harvest(bank, render_text(font, text), text)
+    ocr = GlyphOCR(bank)
+    raw = GlyphOCR(bank, phrases=None)
+    results = {}
+    for noise in noise_levels:
+        acc, acc_raw = [], []
+        for r in range(rounds):
+            img = render_text(font, text, noise=noise, seed=r + 1)
+            acc.append(char_accuracy(ocr.recognize(img), text))
+            acc_raw.append(char_accuracy(raw.recognize(img), text))
+        results[noise] = (float(np.mean(acc_raw)), float(np.mean(acc)))
+    return len(bank), results, ocr.stats()
+
+
+def bench_sample(path, lines=None):
+    """
+    真实截图（默认示例截图 + REAL_LINES）上收集字形再识别同一张图：检查下划线、暗灰色标签等真实面板的问题。
+    同图收集同图识别，准确率只说明切字和对齐正确，不代表对新截图的准确率。
+    :return: (收集的字形数, 识别结果, 准确率)；参考文本去掉了二值化后不在图中的行首标签
+    """
+    lines = REAL_LINES if lines is None else lines
+    image = _read_rgb(path)
+    bank = GlyphBank()
+    n = harvest(bank, image, "\n".join(lines))
+    if not n:
+        return 0, "", 0.0
+    text = GlyphOCR(bank).recognize(image)
+    reference = "\n".join(next((line[len(label):] for label in AFFIX_LABELS if line.startswith(label)), line)
+                          for line in lines)
+    return n, text, char_accuracy(text, reference)
+
+
+def bench_pairs(bank, pairs_dir):
+    """与远程 OCR 结果对比：:return: [(文件名, 准确率)], stats"""
+    ocr = GlyphOCR(bank)
+    results = []
+    for path in sorted(glob.glob(os.path.join(pairs_dir, "*.png"))):
+        txt = os.path.splitext(path)[0] + ".txt"
+        if not os.path.exists(txt):
+            continue
+        with open(txt, encoding="utf-8") as f:
+            reference = f.read()
+        image = cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2RGB)
+        results.append((os.path.basename(path), char_accuracy(ocr.recognize(image), reference)))
+    return results, ocr.stats()
+
+
+# 示例截图 debug_stats_region.png 的真实文本（“所有元素抗性”是游戏原文），纠错不得改动
+REAL_LINES = [
+    "固定 所有元素抗性 +9(7-10)%",
+    "前綴 攻擊附加 3(1-4) 至 67(60-71) 閃電傷害 T1",
+    "攻擊附加 1(1-2) 至 3 物理傷害 T9",
+    "後綴 +27(25-27) 點力量 T3",
+]
+
+SAMPLE_CORPUS = REAL_LINES + [
+    "前綴 攻擊附加 3(1-4) 至 67(60-71) 閃電傷害 9",
+    "前綴 攻擊附加 1(1-2) 至 3 物理傷害 9",
+    "後綴 +27(25-27) 點力量 13",
+    "後綴 +38(36-40)% 火焰抗性 2",
+    "前綴 +3 所有投射物技能石等級 1",
+    "後綴 +112(100-119) 最大生命 4",
+]
+
+
+def _read_rgb(path):
+    img = cv2.imread(path)
+    if img is None:
+        raise SystemExit(f"无法读取图片: {path}")
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地字形模板 OCR")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_h = sub.add_parser("harvest", help="用截图 + 远程 OCR 结果收集字形")
+    p_h.add_argument("--image", required=True, action="append")
+    p_h.add_argument("--text", required=True, action="append", help="与 --image 一一对应的文本文件")
+    p_h.add_argument("--bank", default=DEFAULT_BANK)
+    p_o = sub.add_parser("ocr", help="识别一张截图")
+    p_o.add_argument("--image", required=True)
+    p_o.add_argument("--bank", default=DEFAULT_BANK)
+    p_b = sub.add_parser("bench", help="准确率与速度")
+    p_b.add_argument("--pairs", help="截图 + 远程 OCR 结果目录")
+    p_b.add_argument("--bank", default=DEFAULT_BANK)
+    p_b.add_argument("--synthetic", action="store_true", help="合成字形自检")
+    args = parser.parse_args()
+
+    if args.cmd == "harvest":
+        bank = GlyphBank.load(args.bank)
+        for image_path, text_path in zip(args.image, args.text):
+            with open(text_path, encoding="utf-8") as f:
+                n = harvest(bank, _read_rgb(image_path), f.read())
+            print(f"{image_path}: 收集 {n} 个字形")
+        bank.save(args.bank)
+        print(f"💾 字形库 {args.bank}: {len(bank)} 个字符")
+    elif args.cmd == "ocr":
+        ocr = GlyphOCR.from_file(args.bank)
+        print(ocr.recognize(_read_rgb(args.image)))
+    elif args.synthetic:
+        changed = [(line, fixed) for line, fixed in ((l, PhraseCorrector().correct_line(l)) for l in REAL_LINES)
+                   if fixed != line]
+        for line, fixed in changed:
+            print(f"❌ 纠错改动了真实文本: {line!r} → {fixed!r}")
+        if changed:
+            raise SystemExit(1)
+        n, results, st = bench_synthetic(SAMPLE_CORPUS)
+        print(f"合成字形 {n} 个 | {st['chars_per_ms']:.1f} 字符/ms | 纠错 {st['corrections']} 次")
+        for noise, (acc_raw, acc) in results.items():
+            print(f"  噪点 {noise:.1%}: 准确率 纠错前 {acc_raw:.2%} / 纠错后 {acc:.2%}")
+        sample = os.path.join(os.path.dirname(os.path.abspath(__file__)), "debug_stats_region.png")
+        n, text, acc = bench_sample(sample)
+        print(f"示例截图 {os.path.basename(sample)}: 收集 {n} 个字形，同图识别准确率 {acc:.2%}")
+        if not n:
+            print("❌ 示例截图收集不到字形")
+            raise SystemExit(1)
+    elif args.pairs:
+        results, st = bench_pairs(GlyphBank.load(args.bank), args.pairs)
+        for name, acc in results:
+            print(f"{name}: {acc:.2%}")
+        if results:
+            print(f"平均准确率 {np.mean([a for _, a in results]):.2%} | {st['chars_per_ms']:.1f} 字符/ms")
+    else:
+        parser.error("bench 需要 --pairs 或 --synthetic")
+
+
+if __name__ == "__main__":
+    main()
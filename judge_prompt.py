@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+LLM 判断提示词：用解析后的词缀代替原始 OCR 文本，固定说明放进可复用的系统提示词
+原提示词（verbose_prompt）每次都重复一大段说明，再贴上带杂字、数值范围和大段空白的原始 OCR 文本；
+输入 token 数同时决定延迟和费用。这里：
+- 系统提示词 = 固定说明 + 预期描述，同一次运行中每次调用都相同（按预期描述缓存，只构造一次），
+  相同前缀也便于服务端的上下文缓存命中
+- 用户消息只有词缀的规范形式，每行一条：“前綴/後綴”分组，词缀名（mod_parser.STATS 的短语）+ 数值，
+  去掉数值范围 (1-4) 和多余空白；解析不出词缀、靠容错匹配识别、或除词缀短语外还有其他汉字的行
+  原样保留（去掉范围后）——解析可能有误时不替模型改写，不丢信息
+
+    messages = build_messages(stats_text, "有投射物技能等级加成，而且至少 +3")
+    Generation.call(model=..., messages=messages)
+
+比较前后的提示词 token 数、调用延迟和判断一致率（默认用 mod_parser.CORPUS 和本地替身服务）：
+    python judge_prompt.py bench
+替身服务按关键字回答，两种提示词都含预期描述，一致率必然是 100%；判断一致率要用 --url 对真实模型测。
+"""
+
+import functools
+import re
+
+import llm_verdict
+import mod_parser
+
+_LABELS = {key: "".join(phrases) for key, phrases in mod_parser.STATS}
+_AFFIX_NAMES = {"prefix": "前綴", "suffix": "後綴", "implicit": "固定"}
+_RANGE = re.compile(r"\(\s*[\d.]+\s*-\s*[\d.]+\s*\)")
+_CJK_OR_WIDE = re.compile(r"[　-鿿＀-￯]")
+_CJK = re.compile(r"[㐀-鿿]")
+_KNOWN_WORDS = re.compile("|".join(re.escape(p) for p in sorted(
+    {p for _, phrases in mod_parser.STATS for p in phrases} | {"至"}, key=len, reverse=True)))
+
+SYSTEM_RULES = ("你是《流放之路》装备属性分析员。用户消息是装备词缀，每行“词缀 数值”，"
+                "a-b 表示附加 a 至 b 点伤害，Tn 为阶级。\n"
+                "装备满足预期中的所有要求才算满足；量化要求严格比较；定性要求只要有相关词缀即可。\n"
+                f"{llm_verdict.ANSWER_RULE}")
+
+
+def verbose_prompt(stats_text, expected_description):
+    """原来的提示词（LLM_COMPACT_PROMPT 为 False 时使用，也是压测的对照组）"""
+    return (
+        f"你是一位专业的《流放之路》(Path of Exile) 装备属性分析员。\n\n"
+        f"请仔细阅读以下信息并严格按照指令回答：\n\n"
+        f"**装备属性文本:**\n{stats_text}\n\n"
+        f"**用户预期描述:**\n{expected_description}\n\n"
+        f"请根据装备属性文本，判断该装备是否**完全满足**用户的预期描述。\n\n"
+        f"**判断规则:**\n"
+        f"- 必须满足预期描述中的**所有**明确要求。\n"
+        f"- 如果预期描述中有量化的要求（如“大于等于8”），必须严格遵守。\n"
+        f"- 如果预期描述中有定性的要求（如“有法术伤害词缀”），只要属性文本中能找到相关表述即可。\n"
+        f"- 如果有任何一项要求不满足，则判定为不满足。\n\n"
+        f"**你的回答只能是以下两种之一，且必须严格遵守格式：**\n"
+        f"- **满足**\n"
+        f"- **不满足**\n\n"
+        f"{llm_verdict.ANSWER_RULE}\n"
+        f"请开始你的判断："
+    )
+
+
+def _number(v):
+    return str(int(v)) if float(v).is_integer() else f"{v:g}"
+
+
+def canonical(records):
+    """解析记录 → 规范形式（每行一条词缀）"""
+    lines, affix = [], None
+    for rec in records:
+        if rec["affix"] != affix and rec["affix"] in _AFFIX_NAMES:
+            affix = rec["affix"]
+            lines.append(_AFFIX_NAMES[affix])
+        if rec["stat"] is None or rec["fuzzy"] or _CJK.search(_KNOWN_WORDS.sub("", rec["text"])):
+            line = " ".join(_RANGE.sub("", rec["text"]).split())
+        else:
+            value = "-".join(_number(v) for v in rec["values"]) + ("%" if rec["percent"] else "")
+            line = f"{_LABELS[rec['stat']]} {value}".rstrip()
+            if rec["tier"] is not None:
+                line += f" T{rec['tier']}"
+        if line:
+            lines.append(line)
+    return "\n".join(lines)
+
+
+@functools.lru_cache(maxsize=16)
+def system_prompt(expected_description):
+    return f"{SYSTEM_RULES}\n用户预期：{' '.join(expected_description.split())}"
+
+
+def build_messages(stats_text, expected_description):
+    return [{"role": "system", "content": system_prompt(expected_description)},
+            {"role": "user", "content": canonical(mod_parser.parse(stats_text))}]
+
+
+def estimate_tokens(text):
+    """
+    粗略估算 token 数（没有分词器时用于前后对比）：中文 / 全角字符各算 1 个，其余非空白字符每 3.5 个算 1 个。
+    实际调用时以响应的 usage.input_tokens 为准。
+    """
+    wide = len(_CJK_OR_WIDE.findall(text))
+    other = len("".join(text.split())) - wide
+    return wide + int(round(other / 3.5))
+
+
+def messages_text(messages):
+    return "\n".join(m["content"] for m in messages)
+
+
+# ==================== 压测 ====================
+def _tap_usage(responses, usage):
+    """透传流式响应，记下最后的 usage"""
+    try:
+        for resp in responses:
+            usage.update(resp.usage or {})
+            yield resp
+    finally:
+        responses.close()
+
+
+def bench(texts, expectations, url, model="qwen-turbo"):
+    """
+    每条 OCR 文本 × 每条预期描述，分别用原提示词和精简提示词调用（流式判断，与 script.py 相同）：
+    :return: 输出行列表（估算 token 数、usage.input_tokens、延迟、判断一致率）
+    """
+    import time
+
+    import numpy as np
+
+    import dashscope_client
+
+    client = dashscope_client.PooledClient(base_url=url, hedge=False)
+    est = {"verbose": [], "compact": []}
+    latency = {"verbose": [], "compact": []}
+    used = {"verbose": [], "compact": []}       # 响应 usage.input_tokens（替身服务按字符数计）
+    agree = total = 0
+    try:
+        for text in texts:
+            for expectation in expectations:
+                verdicts = {}
+                for name in ("verbose", "compact"):
+                    if name == "verbose":
+                        prompt, extra = verbose_prompt(text, expectation), {}
+                    else:
+                        prompt, extra = None, {"messages": build_messages(text, expectation)}
+                    est[name].append(estimate_tokens(prompt or messages_text(extra["messages"])))
+                    usage = {}
+                    t0 = time.perf_counter()
+                    verdicts[name], _, _ = llm_verdict.stream_verdict(_tap_usage(client.generation_stream(
+                        model, prompt, max_tokens=llm_verdict.VERDICT_MAX_TOKENS, temperature=0.0, **extra), usage))
+                    latency[name].append(time.perf_counter() - t0)
+                    if "input_tokens" in usage:
+                        used[name].append(usage["input_tokens"])
+                total += 1
+                agree += verdicts["verbose"] is not None and verdicts["verbose"] == verdicts["compact"]
+    finally:
+        client.close()
+    lines = [f"{len(texts)} 条 OCR 文本 × {len(expectations)} 条预期 = {total} 次判断"]
+    for name, label in (("verbose", "原提示词"), ("compact", "精简提示词")):
+        ms = np.asarray(latency[name]) * 1000
+        lines.append(f"{label}: 估算输入 {np.mean(est[name]):.0f} token/次"
+                     + (f"（usage.input_tokens {np.mean(used[name]):.0f}）" if used[name] else "")
+                     + f"，出结果 p50 {np.percentile(ms, 50):.0f}ms 平均 {ms.mean():.0f}ms")
+    lines.append(f"估算输入 token 减少 {1 - np.sum(est['compact']) / np.sum(est['verbose']):.0%}，"
+                 f"判断一致 {agree}/{total}")
+    return lines
+
+
+def main():
+    import argparse
+
+    import mock_dashscope
+
+    parser = argparse.ArgumentParser(description="精简判断提示词")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_show = sub.add_parser("show", help="打印一段 OCR 文本的两种提示词和估算 token 数")
+    p_show.add_argument("file")
+    p_show.add_argument("--expect", default="有投射物技能等级加成，而且至少 +3")
+    p_bench = sub.add_parser("bench", help="原提示词 vs 精简提示词：token 数、延迟、判断一致率")
+    p_bench.add_argument("--file", action="append", help="录制的 OCR 文本文件，不填用 mod_parser.CORPUS")
+    p_bench.add_argument("--expect", action="append", help="预期描述，可多次指定")
+    p_bench.add_argument("--url", default=None, help="服务地址，不填则在本进程启动替身服务")
+    p_bench.add_argument("--model", default="qwen-turbo")
+    p_bench.add_argument("--latency", type=float, default=0.2, help="替身服务固定延迟（秒）")
+    p_bench.add_argument("--prefill", type=float, default=0.001, help="替身服务每个输入字符的处理时间（秒）")
+    args = parser.parse_args()
+
+    if args.cmd == "show":
+        with open(args.file, encoding="utf-8") as f:
+            text = f.read()
+        before = verbose_prompt(text, args.expect)
+        after = messages_text(build_messages(text, args.expect))
+        print(f"--- 原提示词（估算 {estimate_tokens(before)} token）---\n{before}")
+        print(f"--- 精简提示词（估算 {estimate_tokens(after)} token）---\n{after}")
+        return
+
+    texts = []
+    for path in args.file or []:
+        with open(path, encoding="utf-8") as f:
+            texts.append(f.read())
+    texts = texts or [text for text, _ in mod_parser.CORPUS]
+    expectations = args.expect or ["有投射物技能等级加成，而且至少 +3", "力量至少 +25，并且有闪电伤害词缀"]
+
+    server = None
+    url = args.url
+    if url is None:
+        cfg = mock_dashscope.MockConfig(args.latency, sigma=0.1, seed=1, prefill=args.prefill)
+        server = mock_dashscope.MockServer(cfg).start()
+        url = server.base_url
+    try:
+        for line in bench(texts, expectations, url, args.model):
+            print(line)
+        if server is not None:
+            print(server.format_stats())
+            print("（替身服务按关键字回答，判断一致率不代表真实模型；用 --url 测真实模型）")
+    finally:
+        if server is not None:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
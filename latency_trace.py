@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+轻量级耗时追踪（洗练循环 / 喝药监控循环）
+- 使用单调时钟 time.perf_counter_ns()，记录存放在预分配的 numpy 环形缓冲区中，记录时不分配内存。
+- 关闭时使用 NULL_TRACER，lap() 直接返回，不读时钟，开销接近于零。
+- 可导出 Chrome trace JSON（chrome://tracing 或 Perfetto 打开）和 CSV，并给出各阶段 p50/p95/p99。
+
+典型用法（与 ReforgeEngine 中相同）：
+    t = tracer.now()
+    do_click()
+    t = tracer.lap("click", t)
+    do_capture()
+    t = tracer.lap("capture", t)
+"""
+
+import csv
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+
+class SpanTracer:
+    def __init__(self, name="trace", capacity=200000):
+        """
+        :param name: 追踪名称（Chrome trace 中的线程名）
+        :param capacity: 最多保留的记录数，超出后覆盖最旧的记录
+        """
+        self.name = name
+        self.enabled = True
+        self.capacity = capacity
+        self._stage = np.zeros(capacity, dtype=np.int16)
+        self._start = np.zeros(capacity, dtype=np.int64)
+        self._end = np.zeros(capacity, dtype=np.int64)
+        self._seq = np.zeros(capacity, dtype=np.int32)
+        self._n = 0            # 累计写入条数（可能大于 capacity）
+        self._names = []
+        self._ids = {}
+        self.seq = 0           # 当前序号（第几次洗练 / 第几次检测）
+        self.origin_ns = time.perf_counter_ns()
+        self.tid = threading.get_ident()
+
+    def stage_id(self, stage):
+        sid = self._ids.get(stage)
+        if sid is None:
+            sid = len(self._names)
+            self._names.append(stage)
+            self._ids[stage] = sid
+        return sid
+
+    @staticmethod
+    def now():
+        return time.perf_counter_ns()
+
+    def add(self, stage, start_ns, end_ns):
+        i = self._n % self.capacity
+        self._stage[i] = self.stage_id(stage)
+        self._start[i] = start_ns
+        self._end[i] = end_ns
+        self._seq[i] = self.seq
+        self._n += 1
+
+    def lap(self, stage, start_ns):
+        """记录从 start_ns 到现在的阶段耗时，返回当前时间作为下一阶段起点"""
+        end_ns = time.perf_counter_ns()
+        self.add(stage, start_ns, end_ns)
+        return end_ns
+
+    def mark(self):
+        """返回当前写入位置，配合 since() 取出之后记录的各阶段耗时"""
+        return self._n
+
+    def since(self, mark):
+        """{阶段名: 毫秒}，只包含 mark 之后写入的记录（同名阶段累加）"""
+        out = {}
+        for k in range(max(mark, self._n - self.capacity), self._n):
+            i = k % self.capacity
+            name = self._names[self._stage[i]]
+            out[name] = out.get(name, 0.0) + (int(self._end[i]) - int(self._start[i])) / 1e6
+        return out
+
+    def __len__(self):
+        return min(self._n, self.capacity)
+
+    @property
+    def dropped(self):
+        return max(0, self._n - self.capacity)
+
+    def records(self):
+        """按时间顺序返回 (阶段名数组下标, 开始ns, 结束ns, 序号)"""
+        n = len(self)
+        if self._n <= self.capacity:
+            sl = slice(0, n)
+            return self._stage[sl], self._start[sl], self._end[sl], self._seq[sl]
+        order = np.roll(np.arange(self.capacity), -(self._n % self.capacity))
+        return self._stage[order], self._start[order], self._end[order], self._seq[order]
+
+    def durations(self):
+        """{阶段名: 耗时数组（秒）}"""
+        stage, start, end, _ = self.records()
+        dur = (end - start) / 1e9
+        return {name: dur[stage == sid] for sid, name in enumerate(self._names) if np.any(stage == sid)}
+
+    def summary(self):
+        """{阶段名: {n, mean_ms, p50_ms, p95_ms, p99_ms, max_ms}}，按阶段首次出现顺序"""
+        out = {}
+        for name, dur in self.durations().items():
+            ms = dur * 1000.0
+            p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+            out[name] = {"n": int(len(ms)), "mean_ms": float(ms.mean()), "p50_ms": float(p50),
+                         "p95_ms": float(p95), "p99_ms": float(p99), "max_ms": float(ms.max())}
+        return out
+
+    def format_summary(self):
+        lines = [f"{'阶段':<14}{'次数':>7}{'平均ms':>10}{'p50ms':>10}{'p95ms':>10}{'p99ms':>10}"]
+        for name, st in self.summary().items():
+            lines.append(f"{name:<14}{st['n']:>7}{st['mean_ms']:>10.3f}{st['p50_ms']:>10.3f}"
+                         f"{st['p95_ms']:>10.3f}{st['p99_ms']:>10.3f}")
+        if self.dropped:
+            lines.append(f"（环形缓冲区已满，最早的 {self.dropped} 条记录被覆盖）")
+        return "\n".join(lines)
+
+    def write_csv(self, path):
+        stage, start, end, seq = self.records()
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["seq", "stage", "start_us", "duration_us"])
+            for sid, s, e, q in zip(stage.tolist(), start.tolist(), end.tolist(), seq.tolist()):
+                writer.writerow([q, self._names[sid], f"{(s - self.origin_ns) / 1000:.1f}", f"{(e - s) / 1000:.1f}"])
+
+    def chrome_events(self, pid=1, origin_ns=None):
+        origin_ns = self.origin_ns if origin_ns is None else origin_ns
+        stage, start, end, seq = self.records()
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": self.tid, "args": {"name": self.name}}]
+        for sid, s, e, q in zip(stage.tolist(), start.tolist(), end.tolist(), seq.tolist()):
+            events.append({"name": self._names[sid], "ph": "X", "pid": pid, "tid": self.tid,
+                           "ts": (s - origin_ns) / 1000.0, "dur": (e - s) / 1000.0, "args": {"seq": q}})
+        return events
+
+
+class _NullTracer:
+    """追踪关闭时使用：所有方法都是空操作"""
+    enabled = False
+    seq = 0
+
+    @staticmethod
+    def now():
+        return 0
+
+    def add(self, stage, start_ns, end_ns):
+        pass
+
+    def lap(self, stage, start_ns):
+        return 0
+
+    def mark(self):
+        return 0
+
+    def since(self, mark):
+        return {}
+
+    def __len__(self):
+        return 0
+
+
+NULL_TRACER = _NullTracer()
+
+
+def write_chrome_trace(path, tracers):
+    """把一个或多个 SpanTracer 合并导出为 Chrome trace JSON（时间轴对齐到最早的起点）"""
+    tracers = [t for t in tracers if isinstance(t, SpanTracer)]
+    if not tracers:
+        return
+    origin = min(t.origin_ns for t in tracers)
+    events = []
+    for t in tracers:
+        events.extend(t.chrome_events(origin_ns=origin))
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+
+def export_trace(tracer, out_dir, prefix):
+    """导出 {prefix}_{时间}.json / .csv，返回 JSON 路径"""
+    os.makedirs(out_dir, exist_ok=True)
+    stamp = time.strftime("%Y%m%d_%H%M%S")
+    base = os.path.join(out_dir, f"{prefix}_{stamp}")
+    write_chrome_trace(base + ".json", [tracer])
+    tracer.write_csv(base + ".csv")
+    return base + ".json"
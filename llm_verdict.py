@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+LLM 判断：流式读取，判断结果一确定就结束请求
+阻塞调用要等整段回复生成完才返回；模型守格式时只多等一两个 token，不守格式（“满足。理由是……”）时
+要等到 max_tokens 用完。流式调用（incremental_output）逐 token 读取，VerdictScanner 一看出结果
+就关闭连接，服务端随之停止生成。
+输出限定为二选一：提示词要求只回答“满足”或“不满足”，max_tokens 只留够这两个词（VERDICT_MAX_TOKENS），
+扫描时第一个“满”字之前出现否定字（不 / 未 / 没）即为不满足，否则为满足——
+“满”出现时结果就已确定，不必等“足”。
+
+    scanner = VerdictScanner()
+    for resp in Generation.call(model=..., prompt=..., stream=True, incremental_output=True):
+        if scanner.feed(resp.output.text) is not None:
+            break
+
+对比阻塞调用与流式调用的出结果时间（默认启动本地替身服务，回复后附带一段解释）：
+    python llm_verdict.py bench --calls 30
+"""
+
+import time
+
+import numpy as np
+
+VERDICT_MAX_TOKENS = 4
+NEGATIONS = "不未没"
+ANSWER_RULE = "只回答“满足”或“不满足”，不要输出其他任何文字。"
+
+
+class VerdictScanner:
+    """逐段喂入回复文本，结果确定后返回 True / False，之前返回 None"""
+
+    def __init__(self):
+        self.text = ""
+        self.chunks = 0
+        self.verdict = None
+
+    def feed(self, piece):
+        if self.verdict is not None:
+            return self.verdict
+        self.chunks += 1
+        self.text += piece or ""
+        i = self.text.find("满")
+        if i >= 0:
+            self.verdict = not any(c in self.text[:i] for c in NEGATIONS)
+        return self.verdict
+
+
+def parse_verdict(text):
+    """完整回复 → True / False，无法解析为 None"""
+    return VerdictScanner().feed(text)
+
+
+def stream_verdict(responses):
+    """
+    :param responses: 流式响应迭代器（SDK 的 Generation.call(stream=True, incremental_output=True)
+                      或 dashscope_client.PooledClient.generation_stream）
+    :return: (结果 True / False / None, 扫描器, 出错的响应或 None)
+    结果确定后立即关闭迭代器（断开连接）
+    """
+    scanner = VerdictScanner()
+    error = None
+    try:
+        for resp in responses:
+            if resp.status_code != 200:
+                error = resp
+                break
+            if scanner.feed(resp.output.text) is not None:
+                break
+    finally:
+        close = getattr(responses, "close", None)
+        if close is not None:
+            close()
+    return scanner.verdict, scanner, error
+
+
+# ==================== 压测 ====================
+def bench(base_url, calls=30, model="qwen-turbo"):
+    """
+    同一提示词分别用阻塞调用（max_tokens=100，与原来相同；max_tokens=VERDICT_MAX_TOKENS）
+    和流式调用（提前结束）各调用 calls 次，比较出结果时间和结果是否一致。
+    """
+    import dashscope_client
+
+    client = dashscope_client.PooledClient(base_url=base_url, hedge=False)
+    # 替身服务按关键字“投射物”回答，两种提示词各占一半，满足 / 不满足都覆盖到
+    prompts = [f"**装备属性文本:**\n+3 所有投射物技能石等級\n**用户预期描述:**\n投射物技能等級 >= 3\n{ANSWER_RULE}"
+               if i % 2 else f"**装备属性文本:**\n+{20 + i}% 火焰抗性\n**用户预期描述:**\n火焰抗性 >= 30\n{ANSWER_RULE}"
+               for i in range(calls)]
+    blocking, capped, streaming, agree, unparsed = [], [], [], 0, 0
+    try:
+        for prompt in prompts:
+            t0 = time.perf_counter()
+            resp = client.generation(model, prompt, max_tokens=100, temperature=0.0)
+            blocking.append(time.perf_counter() - t0)
+            expected = parse_verdict(resp.output.text or "") if resp.status_code == 200 else None
+
+            t0 = time.perf_counter()
+            client.generation(model, prompt, max_tokens=VERDICT_MAX_TOKENS, temperature=0.0)
+            capped.append(time.perf_counter() - t0)
+
+            t0 = time.perf_counter()
+            verdict, _, _ = stream_verdict(client.generation_stream(model, prompt, max_tokens=VERDICT_MAX_TOKENS,
+                                                                    temperature=0.0))
+            streaming.append(time.perf_counter() - t0)
+            agree += verdict == expected
+            unparsed += verdict is None
+    finally:
+        client.close()
+    lines = []
+    for name, lat in (("阻塞调用（max_tokens=100）", blocking),
+                      (f"阻塞调用（max_tokens={VERDICT_MAX_TOKENS}）", capped),
+                      ("流式调用（提前结束）", streaming)):
+        ms = np.asarray(lat) * 1000
+        p50, p95 = np.percentile(ms, [50, 95])
+        lines.append(f"{name}: 出结果 p50 {p50:.0f}ms p95 {p95:.0f}ms 平均 {ms.mean():.0f}ms")
+    lines.append(f"结果一致 {agree}/{calls}，流式无法解析 {unparsed} 次")
+    return lines
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import mock_dashscope
+
+    parser = argparse.ArgumentParser(description="流式 LLM 判断")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_bench = sub.add_parser("bench", help="阻塞调用 vs 流式提前结束的出结果时间")
+    p_bench.add_argument("--url", default=None, help="已运行的服务地址，不填则在本进程启动替身服务")
+    p_bench.add_argument("--calls", type=int, default=30)
+    p_bench.add_argument("--model", default="qwen-turbo")
+    p_bench.add_argument("--latency", type=float, default=0.3, help="替身服务首 token 延迟（秒）")
+    p_bench.add_argument("--token-interval", type=float, default=0.03, help="替身服务每个 token 的间隔（秒）")
+    p_bench.add_argument("--explain", default="。理由：装备属性文本中的投射物技能等级与预期描述逐项对照后得出上述结论。",
+                         help="替身服务附加在判断结果之后的解释")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        cfg = mock_dashscope.MockConfig(args.latency, sigma=0.1, seed=1, token_interval=args.token_interval,
+                                        explain=args.explain)
+        server = mock_dashscope.MockServer(cfg).start()
+        url = server.base_url
+    try:
+        for line in bench(url, args.calls, args.model):
+            print(line)
+        if server is not None:
+            print(server.format_stats())
+    finally:
+        if server is not None:
+            server.stop()
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+本地 DashScope 替身服务（仅标准库），用于离线压测 OCR / LLM 调用链
+实现与 DashScope HTTP API 相同的两个接口和响应结构：
+    POST /api/v1/services/aigc/text-generation/generation        → output.text
+    POST /api/v1/services/aigc/multimodal-generation/generation  → output.choices[0].message.content
+延迟：对数正态（中位数 latency、离散度 sigma），另有 tail 的概率落在 tail_latency 附近（长尾）；
+错误：error_rate 的概率返回 500，throttle_rate 的概率返回 429。
+上传：设置 bandwidth（字节/秒）时按请求体大小额外延迟，用来比较不同上传体积的端到端延迟。
+生成：latency 相当于首个 token 的延迟，文本生成另按提示词字符数加 prefill 秒 / 字符（输入越长越慢），
+之后每个输出字符再等 token_interval 秒；
+explain 附加在判断结果之后（模拟不守格式、继续解释的模型）。
+流式：请求头 X-DashScope-SSE: enable 时按 SSE 逐 token 返回（chunked 编码，保持长连接），
+parameters.incremental_output 为 true 时每个事件只含新增部分；客户端中途断开即停止生成，
+tokens_out 统计实际生成的 token 数。
+保持 HTTP/1.1 长连接，并统计新建连接数，用来验证客户端是否复用连接。
+
+文本判断：提示词中出现 match 关键字回复“满足”，否则“不满足”；OCR 固定返回 ocr_text。
+图文一次判断：多模态提示词提到“满足”时，第一行回复判断（match 关键字出现在提示词或 ocr_text 中即满足），
+其后是 ocr_text（见 combined_judge.py）。
+
+    python mock_dashscope.py --port 8765 --latency 0.3 --tail 0.05 --tail-latency 2 --error-rate 0.02
+    # script.py：DASHSCOPE_BASE_URL = "http://127.0.0.1:8765/api/v1"
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+GENERATION_PATH = "/api/v1/services/aigc/text-generation/generation"
+MULTIMODAL_PATH = "/api/v1/services/aigc/multimodal-generation/generation"
+
+_RAW = os.path.join(os.path.dirname(os.path.abspath(__file__)), "output_raw.txt")
+
+
+def _default_ocr_text():
+    try:
+        with open(_RAW, encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return "後綴 +27(25-27) 點力量 13"
+
+
+class MockConfig:
+    def __init__(self, latency=0.3, sigma=0.3, tail=0.0, tail_latency=2.0, error_rate=0.0,
+                 throttle_rate=0.0, match="投射物", ocr_text=None, seed=None, bandwidth=None,
+                 token_interval=0.0, explain="", prefill=0.0):
+        self.latency = latency
+        self.sigma = sigma
+        self.tail = tail
+        self.tail_latency = tail_latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.bandwidth = bandwidth
+        self.token_interval = token_interval
+        self.explain = explain
+        self.prefill = prefill
+        self.match = match
+        self.ocr_text = _default_ocr_text() if ocr_text is None else ocr_text
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.errors = 0
+        self.tokens_out = 0
+        self.aborted = 0
+
+    def draw(self):
+        """:return: (延迟秒数, HTTP 状态码)"""
+        with self.lock:
+            self.requests += 1
+            if self.rng.random() < self.tail:
+                delay = self.tail_latency * self.rng.lognormvariate(0, 0.1)
+            else:
+                delay = self.latency * self.rng.lognormvariate(0, self.sigma)
+            r = self.rng.random()
+            if r < self.error_rate:
+                status = 500
+            elif r < self.error_rate + self.throttle_rate:
+                status = 429
+            else:
+                status = 200
+            if status != 200:
+                self.errors += 1
+        return delay, status
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"     # 长连接
+    config = None
+
+    def setup(self):
+        super().setup()
+        with self.config.lock:
+            self.config.connections += 1
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionResetError:
+            # 客户端拿到流式判断结果后直接断开，等下一个请求时读到连接重置
+            pass
+
+    def _reply(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, pieces, incremental, usage, request_id):
+        """逐 token 发送 SSE 事件；客户端断开时停止"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream;charset=UTF-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        text = ""
+        try:
+            for i, piece in enumerate(pieces):
+                if i:
+                    time.sleep(self.config.token_interval)
+                text += piece
+                with self.config.lock:
+                    self.config.tokens_out += 1
+                last = i == len(pieces) - 1
+                body = {"output": {"text": piece if incremental else text,
+                                   "finish_reason": "stop" if last else "null"},
+                        "usage": dict(usage, output_tokens=i + 1), "request_id": request_id}
+                event = (f"id:{i + 1}\nevent:result\n:HTTP_STATUS/200\n"
+                         f"data:{json.dumps(body, ensure_ascii=False)}\n\n").encode("utf-8")
+                self.wfile.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            with self.config.lock:
+                self.config.aborted += 1
+            self.close_connection = True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._reply(400, {"code": "InvalidParameter", "message": "bad json"})
+            return
+        delay, status = self.config.draw()
+        if self.config.bandwidth:
+            delay += length / self.config.bandwidth
+        streaming = self.headers.get("X-DashScope-SSE", "").lower() == "enable" and self.path == GENERATION_PATH
+        time.sleep(delay)
+        request_id = f"mock-{self.config.requests}"
+        if status == 500:
+            self._reply(500, {"code": "InternalError", "message": "mock error", "request_id": request_id})
+            return
+        if status == 429:
+            self._reply(429, {"code": "Throttling", "message": "mock throttling", "request_id": request_id})
+            return
+
+        if self.path == GENERATION_PATH:
+            inp = payload.get("input", {})
+            prompt = inp.get("prompt") or "".join(
+                str(m.get("content", "")) for m in inp.get("messages", []))
+            time.sleep(self.config.prefill * len(prompt))
+            text = "满足" if self.config.match and self.config.match in prompt else "不满足"
+            pieces = list(text + self.config.explain)
+            max_tokens = payload.get("parameters", {}).get("max_tokens")
+            if max_tokens:
+                pieces = pieces[:max_tokens]
+            usage = {"input_tokens": len(prompt), "output_tokens": len(pieces)}
+            if streaming:
+                incremental = bool(payload.get("parameters", {}).get("incremental_output"))
+                self._stream(pieces, incremental, usage, request_id)
+                return
+            time.sleep(self.config.token_interval * max(0, len(pieces) - 1))
+            with self.config.lock:
+                self.config.tokens_out += len(pieces)
+            output = {"text": "".join(pieces), "finish_reason": "stop"}
+        elif self.path == MULTIMODAL_PATH:
+            prompt = "".join(part.get("text", "") for m in payload.get("input", {}).get("messages", [])
+                             for part in (m.get("content") if isinstance(m.get("content"), list) else []))
+            text = self.config.ocr_text
+            if "满足" in prompt:
+                match = self.config.match and (self.config.match in prompt or self.config.match in text)
+                text = f"{'满足' if match else '不满足'}\n{text}"
+            time.sleep(self.config.token_interval * max(0, len(text) - 1))
+            with self.config.lock:
+                self.config.tokens_out += len(text)
+            output = {"choices": [{"finish_reason": "stop",
+                                   "message": {"role": "assistant", "content": [{"text": text}]}}]}
+            usage = {"input_tokens": length // 4, "output_tokens": len(text)}
+        else:
+            self._reply(404, {"code": "NotFound", "message": self.path, "request_id": request_id})
+            return
+        self._reply(200, {"output": output, "usage": usage, "request_id": request_id})
+
+
+class MockServer:
+    """在后台线程运行替身服务；port=0 时自动选端口"""
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = MockConfig() if config is None else config
+        handler = type("Handler", (_Handler,), {"config": self.config})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/api/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="mock-dashscope", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def format_stats(self):
+        c = self.config
+        return (f"🧪 替身服务: 请求 {c.requests} 次，新建连接 {c.connections} 个，注入错误 {c.errors} 次，"
+                f"生成 {c.tokens_out} 个 token（中途断开 {c.aborted} 次）")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地 DashScope 替身服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.3, help="延迟中位数（秒）")
+    parser.add_argument("--sigma", type=float, default=0.3, help="对数正态离散度")
+    parser.add_argument("--tail", type=float, default=0.0, help="长尾请求比例")
+    parser.add_argument("--tail-latency", type=float, default=2.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--match", default="投射物", help="提示词含此关键字时回复“满足”")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--bandwidth", type=float, default=None, help="上传带宽（字节/秒），按请求体大小增加延迟")
+    parser.add_argument("--token-interval", type=float, default=0.0, help="每个输出 token 的间隔（秒）")
+    parser.add_argument("--explain", default="", help="附加在判断结果之后的解释文字")
+    parser.add_argument("--prefill", type=float, default=0.0, help="文本生成每个输入字符的处理时间（秒）")
+    args = parser.parse_args()
+
+    cfg = MockConfig(args.latency, args.sigma, args.tail, args.tail_latency, args.error_rate,
+                     args.throttle_rate, args.match, seed=args.seed, bandwidth=args.bandwidth,
+                     token_interval=args.token_interval, explain=args.explain, prefill=args.prefill)
+    server = MockServer(cfg, args.host, args.port)
+    print(f"🧪 替身服务: {server.base_url}（Ctrl+C 退出）")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(server.format_stats())
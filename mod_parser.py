@@ -0,0 +1,401 @@
+# -*- coding: utf-8 -*-
+"""
+词缀行解析（OCR 文本 → 结构化记录）
+输入为 OCR 结果（见 output_raw.txt），每行一个词缀，例如：
+    前綴 攻擊附加 3(1-4) 至 67(60-71) 閃電傷害 9
+    後綴 +27(25-27) 點力量 13
+输出每行一条记录（dict）：
+    affix   "prefix" / "suffix" / None（“前綴 / 後綴”标记行及其后续行）
+    stat    词缀键（STATS 中的 key），未识别为 None；最后一个词缀短语之后还跟着两个以上汉字时
+            （未收录的更长词缀，如“火焰抗性穿透”）也为 None，不当作较短的词缀
+    values  数值列表；ranges 对应的 (下限, 上限) 或 None；percent 是否百分比
+    tier    行尾单独的整数（阶级），没有为 None
+    fuzzy   是否靠容错匹配（允许一个字的错漏）才识别出词缀
+    text    归一化后的行文本
+
+容错：简体字、全角符号先按表归一化成繁体 / 半角；短语用预编译的字典树扫描，短语之间的杂字直接跳过；
+整行没有精确命中任何词缀时，再在字典树上做编辑距离 ≤ 1 的搜索（OCR 把某个字认错、认漏、多认一个）。
+
+用法：
+    python mod_parser.py parse output_raw.txt     # 打印 JSON 记录
+    python mod_parser.py check                    # 内置语料自检 + 解析耗时
+"""
+
+import json
+import re
+import sys
+import time
+
+# 简体 / 异体 → 繁体（只收录词缀用字中两者不同的字）
+_S2T = str.maketrans({
+    "击": "擊", "伤": "傷", "电": "電", "闪": "閃", "点": "點", "级": "級", "后": "後", "缀": "綴", "护": "護", "术": "術", "战": "戰", "获": "獲",
+    "时": "時", "杀": "殺", "属": "屬", "动": "動", "灵": "靈", "敌": "敵", "对": "對", "冻": "凍", "结": "結", "脑": "腦", "体": "體", "钱": "錢",
+    "减": "減", "复": "復", "诅": "詛", "冲": "衝", "额": "額", "无": "無", "视": "視", "韧": "韌", "药": "藥", "剂": "劑", "间": "間", "续": "續",
+    "发": "發", "数": "數", "双": "雙", "范": "範", "围": "圍", "几": "幾", "经": "經", "验": "驗", "阶": "階", "异": "異", "状": "狀", "态": "態",
+    "节": "節", "约": "約", "窃": "竊", "换": "換", "为": "為", "转": "轉",
+})
+
+# 全角 / 中文标点 → 半角
+_FULLWIDTH = str.maketrans({
+    "（": "(", "）": ")", "＋": "+", "－": "-", "—": "-", "–": "-", "～": "-", "~": "-", "％": "%",
+    "：": ":", "，": ",", "．": ".", "　": " ",
+    "０": "0", "１": "1", "２": "2", "３": "3", "４": "4", "５": "5", "６": "6", "７": "7", "８": "8", "９": "9",
+})
+
+AFFIX_MARKERS = {"前綴": "prefix", "後綴": "suffix", "固定": "implicit"}
+
+# 词缀定义：(key, 必须全部出现的短语)；多个词缀都命中时取短语总长最长的
+STATS = [
+    ("added_physical_attack", ("攻擊附加", "物理傷害")),
+    ("added_fire_attack", ("攻擊附加", "火焰傷害")),
+    ("added_cold_attack", ("攻擊附加", "冰冷傷害")),
+    ("added_lightning_attack", ("攻擊附加", "閃電傷害")),
+    ("added_chaos_attack", ("攻擊附加", "混沌傷害")),
+    ("increased_physical_damage", ("增加", "物理傷害")),
+    ("increased_spell_damage", ("增加", "法術傷害")),
+    ("increased_elemental_damage", ("增加", "元素傷害")),
+    ("strength", ("點力量",)),
+    ("dexterity", ("點敏捷",)),
+    ("intelligence", ("點智慧",)),
+    ("all_attributes", ("點全屬性",)),
+    ("maximum_life", ("最大生命",)),
+    ("maximum_mana", ("最大魔力",)),
+    ("maximum_energy_shield", ("最大能量護盾",)),
+    ("fire_resistance", ("火焰抗性",)),
+    ("cold_resistance", ("冰冷抗性",)),
+    ("lightning_resistance", ("閃電抗性",)),
+    ("chaos_resistance", ("混沌抗性",)),
+    ("all_elemental_resistance", ("全部元素抗性",)),
+    ("all_elemental_resistance", ("所有元素抗性",)),     # 游戏原文（debug_stats_region.png）
+    ("maximum_fire_resistance", ("火焰抗性上限",)),
+    ("maximum_cold_resistance", ("冰冷抗性上限",)),
+    ("maximum_lightning_resistance", ("閃電抗性上限",)),
+    ("maximum_chaos_resistance", ("混沌抗性上限",)),
+    ("maximum_all_elemental_resistance", ("全部元素抗性上限",)),
+    ("maximum_all_elemental_resistance", ("所有元素抗性上限",)),
+    ("attack_speed", ("攻擊速度",)),
+    ("cast_speed", ("施放速度",)),
+    ("critical_chance", ("暴擊率",)),
+    ("critical_multiplier", ("暴擊傷害加成",)),
+    ("accuracy", ("命中值",)),
+    ("movement_speed", ("移動速度",)),
+    ("projectile_skill_level", ("所有投射物技能石等級",)),
+    ("spell_skill_level", ("所有法術技能石等級",)),
+    ("melee_skill_level", ("所有近戰技能石等級",)),
+    ("all_skill_level", ("所有技能石等級",)),
+    ("life_regeneration", ("生命再生",)),
+    ("mana_regeneration", ("魔力再生",)),
+    ("armour", ("護甲",)),
+    ("evasion", ("閃避值",)),
+    ("life_on_hit", ("擊中時獲得生命",)),
+    ("mana_on_kill", ("擊殺時獲得魔力",)),
+    ("life_leech", ("偷取生命",)),
+    ("mana_leech", ("偷取魔力",)),
+]
+
+# 数值：+27(25-27)、3(1-4)、38%、-5
+_NUMBER = re.compile(r"([+-]?\d+(?:\.\d+)?)\s*(?:\(\s*(\d+(?:\.\d+)?)\s*-\s*(\d+(?:\.\d+)?)\s*\))?\s*(%)?")
+_CJK = re.compile(r"[㐀-鿿]")
+_CJK_RUN = re.compile(r"[㐀-鿿]{2,}")
+
+
+_NORMALIZE = {**_FULLWIDTH, **_S2T}
+
+
+def normalize(text):
+    """全角 → 半角、简体 → 繁体（合并成一张表，一次 translate）"""
+    return text.translate(_NORMALIZE)
+
+
+class PhraseTrie:
+    """字典树：节点为 dict，终止节点以 None 键存短语"""
+
+    def __init__(self, phrases):
+        self.root = {}
+        for phrase in phrases:
+            node = self.root
+            for ch in phrase:
+                node = node.setdefault(ch, {})
+            node[None] = phrase
+
+    def longest_at(self, text, start):
+        """从 start 开始的最长精确匹配：(短语, 结束位置) 或 None"""
+        node, best = self.root, None
+        for i in range(start, len(text)):
+            node = node.get(text[i])
+            if node is None:
+                break
+            if None in node:
+                best = (node[None], i + 1)
+        return best
+
+    def scan(self, text):
+        """从左到右取最长匹配，未匹配的字符跳过：[(短语, 起点, 终点)]"""
+        out, i, n = [], 0, len(text)
+        while i < n:
+            hit = self.longest_at(text, i) if text[i] in self.root else None
+            if hit is None:
+                i += 1
+                continue
+            out.append((hit[0], i, hit[1]))
+            i = hit[1]
+        return out
+
+    def fuzzy_at(self, text, start, max_edits=1):
+        """
+        从 start 开始、编辑距离 ≤ max_edits 的匹配（替换 / 文本多一个字 / 文本少一个字），
+        取编辑数最少、其次最长的：(短语, 结束位置, 编辑数) 或 None
+        """
+        best = None
+        stack = [(self.root, start, 0)]
+        while stack:
+            node, i, edits = stack.pop()
+            if None in node and i > start:
+                cand = (node[None], i, edits)
+                if best is None or (edits, -len(cand[0])) < (best[2], -len(best[0])):
+                    best = cand
+            ch = text[i] if i < len(text) else None
+            if ch is not None and ch in node:
+                stack.append((node[ch], i + 1, edits))
+            if edits < max_edits:
+                # 用掉最后一次编辑后只能精确匹配：下一个字接不上（且不是短语结尾）的分支直接剪掉
+                last = edits + 1 == max_edits
+                nxt = text[i + 1] if i + 1 < len(text) else None
+                for key, child in node.items():
+                    if key is None:
+                        continue
+                    if ch is not None and key != ch and (not last or None in child or nxt in child):
+                        stack.append((child, i + 1, edits + 1))      # 认错一个字
+                    if not last or None in child or ch in child:
+                        stack.append((child, i, edits + 1))          # 认漏一个字
+                if ch is not None and i > start and (not last or nxt in node):
+                    stack.append((node, i + 1, edits + 1))           # 多认一个字（不在开头）
+        return best
+
+
+class ModParser:
+    def __init__(self, stats=STATS, markers=AFFIX_MARKERS):
+        self.stats = [(key, set(phrases), sum(len(p) for p in phrases)) for key, phrases in stats]
+        self._by_phrase = {}      # 短语 → 含该短语的词缀，匹配时只看候选
+        for entry in self.stats:
+            for phrase in entry[1]:
+                self._by_phrase.setdefault(phrase, []).append(entry)
+        self.markers = dict(markers)
+        phrases = {p for _, ps in stats for p in ps}
+        self.trie = PhraseTrie(phrases)
+        self.marker_trie = PhraseTrie(self.markers)
+        self._marker_heads = {m[0]: kind for m, kind in self.markers.items()}
+
+    def parse(self, text):
+        """整段 OCR 文本 → 记录列表（空行和只有标记的行不产生记录）"""
+        records = []
+        affix = None
+        for raw in normalize(text).splitlines():
+            line = raw.strip()
+            if not line:
+                continue
+            kind, line = self.strip_marker(line)
+            if kind is not None:
+                affix = kind
+            if not line:
+                continue
+            record = self.parse_line(line)
+            record["affix"] = affix
+            records.append(record)
+        return records
+
+    def strip_marker(self, line):
+        """
+        去掉行首的前綴 / 後綴标记：精确匹配，或首字为“前 / 後”且其后两字内接着一个词缀短语
+        （OCR 常把标记和下一个字粘连认错，如“前芋擊附加”）。
+        :return: (词缀类型或 None, 剩余文本)
+        """
+        hit = self.marker_trie.longest_at(line, 0)
+        if hit is not None:
+            return self.markers[hit[0]], line[hit[1]:].lstrip()
+        kind = self._marker_heads.get(line[0])
+        if kind is None or self.trie.longest_at(line, 0) is not None:
+            return None, line
+        for skip in (1, 2):
+            if self.trie.longest_at(line, skip) is not None or self.trie.fuzzy_at(line, skip) is not None:
+                return kind, line[skip:].lstrip()
+        return None, line
+
+    def match_stat(self, found):
+        best = None
+        names = {p for p, _, _ in found}
+        for name, _, _ in found:
+            for key, phrases, weight in self._by_phrase[name]:
+                if phrases <= names and (best is None or weight > best[1]):
+                    best = (key, weight)
+        return None if best is None else best[0]
+
+    def parse_line(self, line):
+        found = self.trie.scan(line)
+        stat = self.match_stat(found)
+        fuzzy = False
+        if stat is None and _CJK.search(line):
+            found = self._fuzzy_scan(line)
+            stat = self.match_stat(found)
+            fuzzy = stat is not None
+        stat_end = max((end for _, _, end in found), default=None)
+        # 短语之后的单个汉字多为 OCR 杂字（“閃電傷害過”），两个以上说明是未收录的更长词缀
+        if stat is not None and _CJK_RUN.search(line, stat_end):
+            stat, fuzzy, stat_end = None, False, None
+
+        values, ranges, percent, tier = [], [], False, None
+        for m in _NUMBER.finditer(line):
+            number, lo, hi, pct = m.groups()
+            standalone = lo is None and pct is None and number[0] not in "+-"
+            # 最后一个词缀短语之后单独的整数是阶级（“T3” 的 T 不参与匹配）。
+            # 远程 OCR 偶尔把 “T” 认成 “1”（output_raw.txt 的 “點力量 13” 实为 T3），
+            # 与真实的两位数阶级无法区分，这里不做猜测，阶级只作参考、不参与规则判断
+            if stat_end is not None and m.start() >= stat_end and standalone and "." not in number:
+                tier = int(number)
+                continue
+            values.append(_num(number))
+            ranges.append((_num(lo), _num(hi)) if lo is not None else None)
+            percent = percent or pct is not None
+        return {"stat": stat, "values": values, "ranges": ranges, "percent": percent, "tier": tier,
+                "fuzzy": fuzzy, "text": line}
+
+    def _fuzzy_scan(self, line):
+        out, i, n = [], 0, len(line)
+        while i < n:
+            hit = None
+            if _CJK.match(line[i]):
+                exact = self.trie.longest_at(line, i)
+                hit = (exact[0], exact[1]) if exact is not None else self.trie.fuzzy_at(line, i)
+            if hit is None:
+                i += 1
+                continue
+            out.append((hit[0], i, hit[1]))
+            i = hit[1]
+        return out
+
+
+def _num(s):
+    if s is None:
+        return None
+    return float(s) if "." in s else int(s)
+
+
+DEFAULT_PARSER = ModParser()
+
+
+def parse(text):
+    return DEFAULT_PARSER.parse(text)
+
+
+# ==================== 内置语料自检 ====================
+# (输入, 期望的记录字段列表)；只比较给出的字段
+CORPUS = [
+    # output_raw.txt 原样（标记与首字粘连、行尾杂字、句号杂字；“13” 是 T3 被认成的，见 parse_line）
+    ("前芋擊附加 3(1-4) 至 67(60-71) 閃電傷害過\n攻擊附加 1(1-2) 至3物理傷害 。 9\n後綴            +27(25-27) 點力量              13",
+     [{"affix": "prefix", "stat": "added_lightning_attack", "values": [3, 67], "ranges": [(1, 4), (60, 71)],
+       "tier": None},
+      {"affix": "prefix", "stat": "added_physical_attack", "values": [1, 3], "ranges": [(1, 2), None], "tier": 9},
+      {"affix": "suffix", "stat": "strength", "values": [27], "ranges": [(25, 27)], "tier": 13}]),
+    # debug_stats_region.png 的真实文本（固定词缀 + 阶级带 T）
+    ("固定 所有元素抗性 +9(7-10)%\n前綴 攻擊附加 3(1-4) 至 67(60-71) 閃電傷害 T1\n"
+     "攻擊附加 1(1-2) 至 3 物理傷害 T9\n後綴 +27(25-27) 點力量 T3",
+     [{"affix": "implicit", "stat": "all_elemental_resistance", "values": [9], "ranges": [(7, 10)],
+       "percent": True, "tier": None},
+      {"affix": "prefix", "stat": "added_lightning_attack", "values": [3, 67], "tier": 1},
+      {"affix": "prefix", "stat": "added_physical_attack", "values": [1, 3], "tier": 9},
+      {"affix": "suffix", "stat": "strength", "values": [27], "tier": 3}]),
+    ("+9(7-10)% 所有元素抗性", [{"stat": "all_elemental_resistance", "values": [9], "fuzzy": False}]),
+    # 干净文本
+    ("前綴 攻擊附加 3(1-4) 至 67(60-71) 閃電傷害 9",
+     [{"affix": "prefix", "stat": "added_lightning_attack", "values": [3, 67], "tier": 9, "fuzzy": False}]),
+    ("前綴\n+3 所有投射物技能石等級 1",
+     [{"affix": "prefix", "stat": "projectile_skill_level", "values": [3], "ranges": [None], "tier": 1}]),
+    ("後綴 +38(36-40)% 火焰抗性 2",
+     [{"affix": "suffix", "stat": "fire_resistance", "values": [38], "ranges": [(36, 40)], "percent": True,
+       "tier": 2}]),
+    # 简体 + 全角符号
+    ("后缀 ＋２７（２５－２７） 点力量 13",
+     [{"affix": "suffix", "stat": "strength", "values": [27], "ranges": [(25, 27)], "tier": 13}]),
+    ("前缀 攻击附加 3(1-4) 至 67(60-71) 闪电伤害",
+     [{"affix": "prefix", "stat": "added_lightning_attack", "values": [3, 67], "tier": None}]),
+    ("+3 所有投射物技能石等级",
+     [{"affix": None, "stat": "projectile_skill_level", "values": [3]}]),
+    # 繁简混合
+    ("後缀 +112(100-119) 最大生命 4",
+     [{"affix": "suffix", "stat": "maximum_life", "values": [112], "ranges": [(100, 119)], "tier": 4}]),
+    # 认错 / 认漏 / 多认一个字
+    ("+3 所有投射物技能右等級", [{"stat": "projectile_skill_level", "values": [3], "fuzzy": True}]),
+    ("+38% 火焰抗 2", [{"stat": "fire_resistance", "values": [38], "tier": 2, "fuzzy": True}]),
+    ("+27 點力x量 5", [{"stat": "strength", "values": [27], "tier": 5}]),
+    ("+45% 冰冷抗性性", [{"stat": "cold_resistance", "values": [45]}]),
+    # 相近词缀不混淆
+    ("增加 30% 物理傷害", [{"stat": "increased_physical_damage", "values": [30], "percent": True}]),
+    ("+12% 全部元素抗性 3", [{"stat": "all_elemental_resistance", "values": [12], "tier": 3}]),
+    ("+2 所有技能石等級", [{"stat": "all_skill_level", "values": [2]}]),
+    ("+3% 火焰抗性上限", [{"stat": "maximum_fire_resistance", "values": [3], "percent": True}]),
+    ("+3% 火焰抗性上限\n+28% 火焰抗性",
+     [{"stat": "maximum_fire_resistance", "values": [3]}, {"stat": "fire_resistance", "values": [28]}]),
+    ("+1% 所有元素抗性上限", [{"stat": "maximum_all_elemental_resistance", "values": [1]}]),
+    # 短语后还有未收录的汉字：不当作较短的词缀
+    ("+10% 火焰抗性穿透", [{"stat": None, "values": [10], "fuzzy": False}]),
+    # 小数与负数
+    ("+1.5% 暴擊率 6", [{"stat": "critical_chance", "values": [1.5], "percent": True, "tier": 6}]),
+    ("-5% 混沌抗性", [{"stat": "chaos_resistance", "values": [-5]}]),
+    # 无法识别的行保留数值
+    ("某未知詞綴 12 3", [{"stat": None, "values": [12, 3], "tier": None}]),
+]
+
+
+def self_check(parser=DEFAULT_PARSER, verbose=True):
+    """:return: 失败条数"""
+    failures = 0
+    for text, expected in CORPUS:
+        records = parser.parse(text)
+        problems = []
+        if len(records) != len(expected):
+            problems.append(f"记录数 {len(records)} ≠ {len(expected)}")
+        for rec, exp in zip(records, expected):
+            for field, value in exp.items():
+                if rec[field] != value:
+                    problems.append(f"{field}: {rec[field]!r} ≠ {value!r}（{rec['text']}）")
+        if problems:
+            failures += 1
+            if verbose:
+                print(f"❌ {text!r}")
+                for p in problems:
+                    print(f"     {p}")
+    if verbose:
+        print(f"{'✅' if not failures else '⚠️'} 语料 {len(CORPUS)} 条，失败 {failures} 条")
+    return failures
+
+
+def bench(parser=DEFAULT_PARSER, rounds=2000):
+    """整段提示框（output_raw.txt 样例）的平均解析耗时（微秒）"""
+    text = CORPUS[0][0]
+    t0 = time.perf_counter_ns()
+    for _ in range(rounds):
+        parser.parse(text)
+    return (time.perf_counter_ns() - t0) / rounds / 1000
+
+
+def main():
+    import argparse
+
+    ap = argparse.ArgumentParser(description="词缀行解析")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p_parse = sub.add_parser("parse", help="解析 OCR 文本文件，打印 JSON 记录")
+    p_parse.add_argument("file")
+    sub.add_parser("check", help="内置语料自检 + 解析耗时")
+    args = ap.parse_args()
+
+    if args.cmd == "parse":
+        with open(args.file, encoding="utf-8") as f:
+            print(json.dumps(parse(f.read()), ensure_ascii=False, indent=2))
+    else:
+        failures = self_check()
+        print(f"⏱️ 整段提示框解析 {bench():.1f}us")
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,587 @@
+# -*- coding: utf-8 -*-
+"""
+独立进程中的自动喝药监控
+监控进程自己截图、自己按键，不与界面线程和洗练匹配争抢 GIL。
+界面进程仍是控制方：通过一块共享内存（multiprocessing.shared_memory）下发配置、读取读数和事件。
+
+共享内存布局：
+    [0:8)      控制区：停止标志 u8、进程状态 u8
+    [8:..)     配置区：seqlock 序号 u64、长度 u32、JSON（界面写，监控进程读）
+    [..:..)    读数区：seqlock 序号 u64、hp f64、mp f64、tick 计数、tick 时间 ns、tick 耗时 us、
+               区域数 u32 + MAX_REGIONS 个 f64（配置 "regions" 列表各项的读数，按列表顺序；监控进程写）
+    [..:end)   事件环：累计写入数 u64 + EVENT_SLOTS 个定长槽（监控进程写，界面按自己的游标读）
+seqlock：写方先把序号加到奇数、写数据、再加到偶数；读方读到奇数或前后序号不一致就重读。
+
+基准（反应延迟 = 血量降到阈值以下 → 按键发出）：
+    python monitor_process.py bench --seconds 5
+低功耗模式（满血静止 → 探测模式 → 掉血后恢复全速的延迟，各模式 CPU）：
+    python monitor_process.py idle --seconds 10
+"""
+
+import json
+import math
+import multiprocessing
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from backends import PyAutoGUICapture, make_input
+from deadline_timer import DeadlineTimer, now_ns
+from flask_monitor import FlaskMonitor, ModeMeter, MODE_IDLE, EVENT_LOG, EVENT_HP, EVENT_REGION, format_event
+from latency_trace import SpanTracer, NULL_TRACER, export_trace
+from scheduler import Scheduler
+
+STATE_STARTING = 0
+STATE_RUNNING = 1
+STATE_STOPPED = 2
+
+CONFIG_BYTES = 16384
+EVENT_SLOTS = 256
+MAX_REGIONS = 32
+PUBLISH_INTERVAL = 0.1      # 读数发布 / 配置检查周期（秒）
+IDLE_PUBLISH_INTERVAL = 0.5  # 探测模式下的读数发布周期（秒）
+ACTIVE_SPIN_NS = 500_000    # 全速检测时唤醒前的自旋预算；探测模式只睡眠（0），空闲时不占 CPU
+
+_U64 = struct.Struct("<Q")
+_U32 = struct.Struct("<I")
+_READINGS = struct.Struct(f"<ddqqdI{MAX_REGIONS}d")   # hp, mp, tick, tick_ns, cost_us, n, 区域读数...
+_EVENT = struct.Struct("<qBf15s236s")         # ts_ns, kind, value, key, msg（UTF-8，超长截断）
+
+_OFF_STOP = 0
+_OFF_STATE = 1
+_OFF_CFG_SEQ = 8
+_OFF_CFG_LEN = 16
+_OFF_CFG = 24
+_OFF_RD_SEQ = _OFF_CFG + CONFIG_BYTES
+_OFF_RD = _OFF_RD_SEQ + 8
+_OFF_EV_COUNT = _OFF_RD + _READINGS.size
+_OFF_EV = _OFF_EV_COUNT + 8
+TOTAL_BYTES = _OFF_EV + EVENT_SLOTS * _EVENT.size
+
+
+def _seq_write(buf, off, write):
+    seq = _U64.unpack_from(buf, off)[0]
+    _U64.pack_into(buf, off, seq + 1)
+    write()
+    _U64.pack_into(buf, off, seq + 2)
+    return seq + 2
+
+
+def _seq_read(buf, off, read, retries=1000):
+    """返回 (序号, 数据)；写方长时间持有时返回 (None, None)"""
+    for _ in range(retries):
+        s1 = _U64.unpack_from(buf, off)[0]
+        if s1 & 1:
+            continue
+        data = read()
+        if _U64.unpack_from(buf, off)[0] == s1:
+            return s1, data
+    return None, None
+
+
+class MonitorChannel:
+    """界面进程与监控进程之间的共享内存通道"""
+
+    def __init__(self, name=None, create=False):
+        if create:
+            self.shm = shared_memory.SharedMemory(create=True, size=TOTAL_BYTES)
+            self.shm.buf[:TOTAL_BYTES] = bytes(TOTAL_BYTES)
+        else:
+            # spawn 出的子进程与创建方共用同一个 resource_tracker，释放只由创建方 unlink 完成
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.buf = self.shm.buf
+        self.owner = create
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    # ---------- 控制 ----------
+    def request_stop(self):
+        self.buf[_OFF_STOP] = 1
+
+    def stop_requested(self):
+        return self.buf[_OFF_STOP] == 1
+
+    def set_state(self, state):
+        self.buf[_OFF_STATE] = state
+
+    @property
+    def state(self):
+        return self.buf[_OFF_STATE]
+
+    # ---------- 配置（界面写） ----------
+    def write_config(self, config):
+        data = json.dumps(config, ensure_ascii=False).encode("utf-8")
+        if len(data) > CONFIG_BYTES:
+            raise ValueError(f"配置过大: {len(data)} 字节")
+
+        def write():
+            _U32.pack_into(self.buf, _OFF_CFG_LEN, len(data))
+            self.buf[_OFF_CFG:_OFF_CFG + len(data)] = data
+        return _seq_write(self.buf, _OFF_CFG_SEQ, write)
+
+    def read_config(self, last_seq=0):
+        """配置有更新时返回 (序号, 配置字典)，否则返回 None"""
+        if _U64.unpack_from(self.buf, _OFF_CFG_SEQ)[0] == last_seq:
+            return None
+
+        def read():
+            n = _U32.unpack_from(self.buf, _OFF_CFG_LEN)[0]
+            return bytes(self.buf[_OFF_CFG:_OFF_CFG + n])
+        seq, data = _seq_read(self.buf, _OFF_CFG_SEQ, read)
+        if seq is None or seq == last_seq:
+            return None
+        return seq, json.loads(data.decode("utf-8"))
+
+    # ---------- 读数（监控进程写） ----------
+    def write_readings(self, hp, mp, tick, tick_ns, cost_us, regions=()):
+        """:param regions: 配置 "regions" 列表各项的读数（None 表示无效），超出 MAX_REGIONS 的丢弃"""
+        hp = math.nan if hp is None else hp
+        mp = math.nan if mp is None else mp
+        values = [math.nan if v is None else v for v in list(regions)[:MAX_REGIONS]]
+        n = len(values)
+        values += [math.nan] * (MAX_REGIONS - n)
+        _seq_write(self.buf, _OFF_RD_SEQ,
+                   lambda: _READINGS.pack_into(self.buf, _OFF_RD, hp, mp, tick, tick_ns, cost_us, n, *values))
+
+    def read_readings(self):
+        """{hp, mp, tick, tick_ns, cost_us, regions}；读数为 None 表示无效"""
+        seq, data = _seq_read(self.buf, _OFF_RD_SEQ, lambda: _READINGS.unpack_from(self.buf, _OFF_RD))
+        if seq is None:
+            return None
+        hp, mp, tick, tick_ns, cost_us, n = data[:6]
+        regions = [None if math.isnan(v) else v for v in data[6:6 + n]]
+        return {"hp": None if math.isnan(hp) else hp, "mp": None if math.isnan(mp) else mp,
+                "tick": tick, "tick_ns": tick_ns, "cost_us": cost_us, "regions": regions}
+
+    # ---------- 事件环（监控进程写） ----------
+    def push_event(self, kind, key="", value=0.0, msg="", ts_ns=None):
+        count = _U64.unpack_from(self.buf, _OFF_EV_COUNT)[0]
+        off = _OFF_EV + (count % EVENT_SLOTS) * _EVENT.size
+        _EVENT.pack_into(self.buf, off, now_ns() if ts_ns is None else ts_ns, kind, value,
+                         str(key).encode("utf-8")[:15], msg.encode("utf-8")[:236])
+        # 槽写完后再发布计数
+        _U64.pack_into(self.buf, _OFF_EV_COUNT, count + 1)
+
+    def read_events(self, cursor):
+        """
+        :param cursor: 上次返回的游标（初始为 0）
+        :return: (新游标, [(ts_ns, kind, key, value, msg)], 被覆盖而丢失的条数)
+        """
+        count = _U64.unpack_from(self.buf, _OFF_EV_COUNT)[0]
+        dropped = 0
+        if count - cursor > EVENT_SLOTS:
+            dropped = count - cursor - EVENT_SLOTS
+            cursor = count - EVENT_SLOTS
+        events = []
+        for i in range(cursor, count):
+            ts, kind, value, key, msg = _EVENT.unpack_from(self.buf, _OFF_EV + (i % EVENT_SLOTS) * _EVENT.size)
+            events.append((ts, kind, key.rstrip(b"\0").decode("utf-8", "ignore"), value,
+                           msg.rstrip(b"\0").decode("utf-8", "ignore")))
+        return count, events, dropped
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def run_monitor(channel, capture, inputs, tracer=None, trace_dir=None):
+    """
+    监控主循环（监控进程中运行；基准中也可在线程里运行作对比）。
+    所有周期工作都是 scheduler.Scheduler 的任务：各区域采样、各定时按键、读数发布（含配置检查）。
+    同一次唤醒中到期的采样合并成一次截图，定时按键在采样之后执行（用到最新读数）。
+    """
+    tracer = NULL_TRACER if tracer is None else tracer
+    cfg_seq, config = channel.read_config(0) or (0, {})
+    monitor = FlaskMonitor(config, tracer=tracer)
+    for msg in monitor.take_warnings():
+        channel.push_event(EVENT_LOG, msg=msg)
+    timer = DeadlineTimer("monitor", spin_ns=0)
+    sched = Scheduler(timer, tracer=tracer)
+    meter = ModeMeter()
+    meter.enter(monitor.mode)
+    state = {"cfg_seq": cfg_seq, "tick": 0, "tick_ns": 0, "cost_us": 0.0}
+    due_samples = []
+    due_timers = []
+
+    def sync_jobs():
+        """按 monitor.jobs() 增删任务、调整周期"""
+        wanted = monitor.jobs()
+        for name in [n for n in sched.jobs if n != "publish" and n not in wanted]:
+            sched.remove(name)
+        for name, (kind, region, period, tolerance) in wanted.items():
+            job = sched.jobs.get(name)
+            if job is None:
+                target = due_samples if kind == "sample" else due_timers
+                sched.add(name, period, lambda r=region, t=target: t.append(r), tolerance, run_now=True)
+            else:
+                sched.set_period(name, period, tolerance)
+
+    def apply_mode():
+        """探测模式下不自旋、放慢读数发布；全速检测时恢复"""
+        idle = monitor.mode == MODE_IDLE
+        timer.spin_ns = 0 if idle else ACTIVE_SPIN_NS
+        period = IDLE_PUBLISH_INTERVAL if idle else PUBLISH_INTERVAL
+        sched.set_period("publish", period, tolerance=period / 2)
+
+    def publish():
+        update = channel.read_config(state["cfg_seq"])
+        if update is not None:
+            state["cfg_seq"], new_config = update
+            monitor.update_config(new_config)
+            sync_jobs()
+            for msg in monitor.take_warnings():
+                channel.push_event(EVENT_LOG, msg=msg)
+        values = monitor.values
+        channel.write_readings(values.get("hp"), values.get("mp"), state["tick"], state["tick_ns"],
+                               state["cost_us"], [values.get(name) for name in monitor.region_names])
+
+    def press(actions):
+        for kind, key, value, name in actions:
+            inputs.press(key)
+            # 通用区域的名字不在事件槽里，文字在这里生成；hp / mp 事件由界面按配置格式化
+            msg = format_event(kind, key, value, monitor.config, name) if kind >= EVENT_REGION else ""
+            channel.push_event(kind, key, value, msg)
+
+    def run_batch():
+        """本次唤醒到期的采样（一次截图）和定时按键"""
+        if due_samples:
+            names = set(due_samples)
+            due_samples.clear()
+            region = monitor.capture_region(names)
+            if region is not None:
+                state["tick"] += 1
+                if tracer.enabled:
+                    tracer.seq = state["tick"]
+                t0 = now_ns()
+                t = tracer.now()
+                screen = capture.grab(region)
+                t = tracer.lap("capture", t)
+                _, actions = monitor.sample(screen, origin=region[:2], names=names)
+                t = tracer.lap("detect", t)
+                press(actions)
+                tracer.lap("press", t)
+                state["tick_ns"], state["cost_us"] = t0, (now_ns() - t0) / 1000.0
+                if monitor.mode_changed:
+                    # 恢复全速时 set_period 把各采样任务的下一次 due 提前，下一次唤醒立即采样
+                    sync_jobs()
+                    apply_mode()
+                    meter.enter(monitor.mode)
+                    channel.push_event(EVENT_LOG, msg=(
+                        f"💤 {monitor.scene.reason}，进入探测模式（每 {monitor.interval()}s）"
+                        if monitor.mode == MODE_IDLE else "⚡ 血条变化，恢复全速检测"))
+        if due_timers:
+            actions = [monitor.fire_timer(name) for name in due_timers]
+            due_timers.clear()
+            press([a for a in actions if a is not None])
+
+    sched.add("publish", PUBLISH_INTERVAL, publish, tolerance=PUBLISH_INTERVAL / 2)
+    apply_mode()
+    sync_jobs()
+    channel.set_state(STATE_RUNNING)
+    while not channel.stop_requested():
+        try:
+            sched.run_once()
+            run_batch()
+        except Exception as e:
+            due_samples.clear()
+            due_timers.clear()
+            channel.push_event(EVENT_LOG, msg=f"⚠️ 异常: {e}")
+            timer.sleep(1.0)
+
+    for line in sched.format_lines():
+        channel.push_event(EVENT_LOG, msg=line)
+    channel.push_event(EVENT_LOG, msg=timer.format_stats())
+    channel.push_event(EVENT_LOG, msg=monitor.format_costs())
+    channel.push_event(EVENT_LOG, msg=meter.format_stats())
+    flask_stats = monitor.format_flask_stats()
+    if flask_stats:
+        channel.push_event(EVENT_LOG, msg=flask_stats)
+    monitor.close()
+    if tracer.enabled and len(tracer) and trace_dir:
+        try:
+            path = export_trace(tracer, trace_dir, "monitor")
+            channel.push_event(EVENT_LOG, msg=f"💾 耗时追踪已导出: {path}")
+        except Exception as e:
+            channel.push_event(EVENT_LOG, msg=f"⚠️ 耗时追踪导出失败: {e}")
+    channel.set_state(STATE_STOPPED)
+
+
+def monitor_process_main(shm_name, input_backend="pyautogui", trace=False, trace_dir=None, bench=None):
+    """监控进程入口（spawn 方式启动，只能使用可导入的顶层函数）"""
+    channel = MonitorChannel(shm_name)
+    try:
+        if bench is not None:
+            capture, inputs = BenchScreen(**bench), NullInput()
+        else:
+            capture, inputs = PyAutoGUICapture(), make_input(input_backend)
+        run_monitor(channel, capture, inputs, tracer=SpanTracer("monitor") if trace else None, trace_dir=trace_dir)
+    except Exception as e:
+        channel.push_event(EVENT_LOG, msg=f"❌ 监控进程退出: {e}")
+        channel.set_state(STATE_STOPPED)
+    finally:
+        channel.close()
+
+
+class MonitorProcess:
+    """界面进程一侧的控制器"""
+
+    def __init__(self, config, input_backend="pyautogui", trace=False, trace_dir=None, bench=None):
+        self.config = dict(config)
+        self.input_backend = input_backend
+        self.trace = trace
+        self.trace_dir = trace_dir
+        self.bench = bench
+        self.channel = None
+        self.process = None
+        self.cursor = 0
+
+    def start(self):
+        self.channel = MonitorChannel(create=True)
+        self.channel.write_config(self.config)
+        ctx = multiprocessing.get_context("spawn")
+        self.process = ctx.Process(
+            target=monitor_process_main, name="flask-monitor", daemon=True,
+            args=(self.channel.name, self.input_backend, self.trace, self.trace_dir, self.bench),
+        )
+        self.process.start()
+
+    def is_alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def update_config(self, config):
+        """配置有变化时才写入共享内存"""
+        if config != self.config:
+            self.config = dict(config)
+            self.channel.write_config(self.config)
+
+    def readings(self):
+        return self.channel.read_readings()
+
+    def events(self):
+        """新事件 [(ts_ns, kind, key, value, 日志文字)]"""
+        self.cursor, events, dropped = self.channel.read_events(self.cursor)
+        out = [(ts, kind, key, value, msg or format_event(kind, key, value, self.config))
+               for ts, kind, key, value, msg in events]
+        if dropped:
+            out.insert(0, (0, EVENT_LOG, "", 0.0, f"⚠️ 事件环溢出，丢失 {dropped} 条"))
+        return out
+
+    def stop(self, timeout=3.0):
+        """请求停止并等待退出；返回退出前的剩余事件"""
+        if self.channel is None:
+            return []
+        self.channel.request_stop()
+        if self.process is not None:
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join(1.0)
+        remaining = self.events()
+        self.channel.close()
+        self.channel = None
+        return remaining
+
+
+# ==================== 基准 ====================
+class BenchScreen:
+    """
+    假血条：每 period 秒在 drop_offset 处掉到 low%，持续 low_duration 秒，其余时间为 high%。
+    时间基准为 perf_counter_ns（Linux / Windows 上跨进程一致）。
+    """
+
+    def __init__(self, base_ns, period=0.2, low_duration=0.1, high=80.0, low=20.0, region=(0, 0, 12, 100)):
+        self.base_ns = base_ns
+        self.period_ns = int(period * 1e9)
+        self.low_ns = int(low_duration * 1e9)
+        self.high = high
+        self.low = low
+        self.w, self.h = region[2], region[3]
+
+    def is_low(self, t_ns):
+        return (t_ns - self.base_ns) % self.period_ns < self.low_ns
+
+    def grab(self, region):
+        pct = self.low if self.is_low(now_ns()) else self.high
+        img = np.full((region[3], region[2], 3), 20, dtype=np.uint8)
+        filled = int(round(region[3] * pct / 100.0))
+        if filled:
+            img[region[3] - filled:, :] = (200, 30, 30)
+        return img
+
+
+class IdleBenchScreen(BenchScreen):
+    """switch_ns 之前血条满且静止，之后按 BenchScreen 周期掉血"""
+
+    def __init__(self, switch_ns, **kwargs):
+        super().__init__(high=100.0, **kwargs)
+        self.switch_ns = switch_ns
+
+    def is_low(self, t_ns):
+        return t_ns >= self.switch_ns and super().is_low(t_ns)
+
+
+class NullInput:
+    def press(self, key):
+        pass
+
+
+def _reaction_latencies(events, base_ns, period, low_duration, start_ns, end_ns):
+    """每个低血窗口内第一次 HP 按键相对掉血时刻的延迟（ms），以及未响应的窗口数"""
+    period_ns = int(period * 1e9)
+    first = {}
+    for ts, kind, *_ in events:
+        if kind != EVENT_HP:
+            continue
+        # 只有低血窗口内截到的帧会触发按键，按键时刻所在的周期即对应的窗口
+        k = (ts - base_ns) // period_ns
+        first.setdefault(k, ts - (base_ns + k * period_ns))
+    k0 = (start_ns - base_ns) // period_ns + 1
+    k1 = (end_ns - base_ns) // period_ns - 1
+    lat = [first[k] / 1e6 for k in range(k0, k1) if k in first]
+    return np.asarray(lat), max(0, (k1 - k0) - len(lat))
+
+
+def _reforge_load(stop):
+    """在当前进程里满速跑洗练匹配（合成帧），模拟洗练时的 CPU / GIL 压力"""
+    import os
+    import tempfile
+    import cv2
+    from replay_harness import FakeGame, synthetic_frames, run_headless
+
+    tmp = tempfile.mkdtemp()
+    main_path = os.path.join(tmp, "main.png")
+    tier_path = os.path.join(tmp, "tier.png")
+    tpl = np.zeros((16, 90, 3), np.uint8)
+    cv2.putText(tpl, "+3 proj", (2, 12), cv2.FONT_HERSHEY_PLAIN, 1, (255, 255, 255), 1)
+    cv2.imwrite(main_path, tpl)
+    tier = np.zeros((12, 12, 3), np.uint8)
+    cv2.circle(tier, (6, 6), 5, (0, 200, 255), -1)
+    cv2.imwrite(tier_path, tier)
+    frames, _ = synthetic_frames([main_path], tier_path, count=50, hit_rate=0.0, shape=(400, 600, 3))
+    while not stop.is_set():
+        run_headless(FakeGame(frames), [main_path], tier_path, max_attempts=50, save_cache=lambda img, prefix: None)
+
+
+def bench(seconds=5.0, interval=0.01, period=0.1937, low_duration=0.1):
+    """
+    四种情况：监控在线程 / 独立进程 × 是否同时满速洗练。
+    掉血周期取与检测间隔不成整数倍的值，使掉血时刻均匀落在 tick 的各个相位上。
+    :return: {名称: (延迟数组 ms, 未响应窗口数)}
+    """
+    region = (0, 0, 12, 100)
+    config = {"hp_region": region, "hp_threshold": 35.0, "check_interval": interval, "mp_region": None}
+    results = {}
+    for mode in ("thread", "process"):
+        for load in (False, True):
+            base = now_ns()
+            bench_args = {"base_ns": base, "period": period, "low_duration": low_duration, "region": region}
+            stop_load = threading.Event()
+            load_thread = None
+            if load:
+                load_thread = threading.Thread(target=_reforge_load, args=(stop_load,), daemon=True)
+                load_thread.start()
+
+            # 事件环只有 EVENT_SLOTS 个槽，期间像界面一样定期读取
+            events = []
+            if mode == "process":
+                proc = MonitorProcess(config, bench=bench_args)
+                proc.start()
+                while proc.channel.state != STATE_RUNNING and proc.is_alive():
+                    time.sleep(0.01)
+                start = now_ns()
+                while now_ns() - start < seconds * 1e9:
+                    time.sleep(0.05)
+                    events.extend(proc.events())
+                end = now_ns()
+                events.extend(proc.stop())
+            else:
+                channel = MonitorChannel(create=True)
+                channel.write_config(config)
+                th = threading.Thread(target=run_monitor,
+                                      args=(channel, BenchScreen(**bench_args), NullInput()), daemon=True)
+                th.start()
+                while channel.state != STATE_RUNNING:
+                    time.sleep(0.01)
+                start = now_ns()
+                cursor = 0
+                while now_ns() - start < seconds * 1e9:
+                    time.sleep(0.05)
+                    cursor, new, _ = channel.read_events(cursor)
+                    events.extend(new)
+                end = now_ns()
+                channel.request_stop()
+                th.join()
+                events.extend(channel.read_events(cursor)[1])
+                channel.close()
+
+            stop_load.set()
+            if load_thread is not None:
+                load_thread.join()
+            name = f"{'独立进程' if mode == 'process' else '界面进程线程'}{' + 洗练负载' if load else ''}"
+            results[name] = _reaction_latencies(events, base, period, low_duration, start, end)
+    return results
+
+
+def idle_bench(seconds=10.0, interval=0.01, idle_after=1.0, idle_interval=0.5):
+    """
+    前 seconds/2 秒满血静止，之后周期掉血；监控在当前进程的线程里运行。
+    :return: (日志文字列表, 掉血到恢复全速的延迟 ms 或 None)
+    """
+    region = (0, 0, 12, 100)
+    config = {"hp_region": region, "hp_threshold": 35.0, "check_interval": interval,
+              "idle_after": idle_after, "idle_interval": idle_interval}
+    base = now_ns()
+    switch = base + int(seconds / 2 * 1e9)
+    screen = IdleBenchScreen(switch, base_ns=switch, period=0.5, low_duration=0.25, region=region)
+    channel = MonitorChannel(create=True)
+    channel.write_config(config)
+    th = threading.Thread(target=run_monitor, args=(channel, screen, NullInput()), daemon=True)
+    th.start()
+    time.sleep(seconds)
+    channel.request_stop()
+    th.join()
+    _, events, _ = channel.read_events(0)
+    channel.close()
+    resumed = [ts for ts, kind, key, value, msg in events if msg.startswith("⚡") and ts >= switch]
+    snap_ms = (resumed[0] - switch) / 1e6 if resumed else None
+    return [msg for _, kind, _, _, msg in events if kind == EVENT_LOG], snap_ms
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="喝药监控进程")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_bench = sub.add_parser("bench", help="反应延迟：线程 vs 独立进程，有无洗练负载")
+    p_bench.add_argument("--seconds", type=float, default=5.0)
+    p_bench.add_argument("--interval", type=float, default=0.01, help="检测间隔（秒）")
+    p_idle = sub.add_parser("idle", help="低功耗探测模式：进入 / 恢复与各模式 CPU")
+    p_idle.add_argument("--seconds", type=float, default=10.0)
+    p_idle.add_argument("--interval", type=float, default=0.01, help="全速检测间隔（秒）")
+    p_idle.add_argument("--idle-interval", type=float, default=0.5, help="探测模式检测间隔（秒）")
+    args = parser.parse_args()
+
+    if args.cmd == "idle":
+        logs, snap_ms = idle_bench(args.seconds, args.interval, idle_interval=args.idle_interval)
+        for msg in logs:
+            print(msg)
+        print(f"掉血 → 恢复全速: {'未恢复' if snap_ms is None else f'{snap_ms:.1f}ms'}")
+        raise SystemExit(0)
+
+    print(f"{'情况':<20}{'窗口':>6}{'未响应':>8}{'平均ms':>10}{'p50ms':>10}{'p95ms':>10}{'最大ms':>10}")
+    for name, (lat, missed) in bench(args.seconds, args.interval).items():
+        if len(lat):
+            print(f"{name:<20}{len(lat):>6}{missed:>8}{lat.mean():>10.2f}{np.median(lat):>10.2f}"
+                  f"{np.percentile(lat, 95):>10.2f}{lat.max():>10.2f}")
+        else:
+            print(f"{name:<20}{0:>6}{missed:>8}")
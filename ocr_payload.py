@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""
+OCR 上传图片最小化
+远程 OCR 的延迟随上传字节数增长。原来直接把彩色截图按默认参数存 PNG 再 base64；这里：
+1. 文字掩码：取各通道最大值后做局部自适应阈值（比周围均值亮 C 以上）。
+   全局 Otsu 会丢掉左侧暗灰色的“前綴 / 後綴”标签和右侧 T 阶，自适应阈值两者都保留；
+   细长连通块（高 ≤ 4 且宽 ≥ 20 的分隔线、宽 ≤ 2 且高 ≥ 12 的框线）和小于 glyph_ocr.MIN_BLOB 的噪点不算文字；
+   连字符（约 7×2）和词缀下的点线保留。
+2. 只保留有文字的行：每行上下留 pad 像素，行间空白压缩成 gap 像素，左右裁到文字边界。
+3. 编码：VARIANTS 中的一种——
+   png      原样彩色 PNG（对照，即原来 script.py 的上传格式）
+   gray     裁剪后的灰度 PNG
+   palette4 裁剪后灰度量化为 4 级的调色板 PNG
+   binary   裁剪后的文字掩码，白底黑字 1 位 PNG（最小）
+   jpeg     裁剪后的灰度 JPEG（质量 70）
+   webp     裁剪后的灰度无损 WebP（Pillow 不支持 WebP 时不可用）
+
+离线检查（不调用模型）：把每种编码解码、放回原图坐标，与原图的参照掩码比较文字像素保留率（允许 1 像素偏移）。
+参照掩码用 glyph_ocr.binarize 的全局 Otsu，与上面的自适应阈值无关（否则 binary 是拿掩码和它自己比，恒为 100%）；
+Otsu 不含暗灰色的标签和 T 阶，这部分在 binary 中计为“多余”。
+有字形库时再比较本地字形 OCR 的结果。加 --url 时对每种编码实际调用一次 OCR 模型，
+与参考文本（同名 .txt）比较准确率和延迟——只有这一项能说明模型端的准确率。
+
+    python ocr_payload.py bench --image debug_stats_region.png
+    python ocr_payload.py bench --pairs recorded/ --url http://127.0.0.1:8765/api/v1
+"""
+
+import base64
+import glob
+import io
+import os
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import glyph_ocr
+
+VARIANTS = ["png", "gray", "palette4", "binary", "jpeg", "webp"]
+_MIME = {"png": "image/png", "gray": "image/png", "palette4": "image/png", "binary": "image/png",
+         "jpeg": "image/jpeg", "webp": "image/webp"}
+
+ADAPTIVE_BLOCK = 25       # 自适应阈值的邻域边长（约一个字高）
+ADAPTIVE_C = 25           # 比邻域均值亮多少算文字
+ROW_PAD = 2
+ROW_GAP = 4
+ROW_MIN_PIXELS = 3        # 文字像素少于此数的像素行视为空行（框线的竖边会把相邻文字行连成一片）
+
+
+def to_gray(image):
+    """PIL Image / RGB / 灰度数组 → 各通道最大值的 uint8 灰度"""
+    arr = np.asarray(image)
+    if arr.ndim == 3:
+        arr = arr[:, :, :3].max(axis=2)
+    return np.ascontiguousarray(arr, dtype=np.uint8)
+
+
+def text_mask(gray):
+    """0/1 文字掩码（去掉框线、分隔线和噪点）"""
+    binary = cv2.adaptiveThreshold(gray, 1, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY,
+                                   ADAPTIVE_BLOCK, -ADAPTIVE_C)
+    return _drop_lines(binary)
+
+
+def reference_mask(gray):
+    """离线检查用的参照掩码：全局 Otsu（glyph_ocr.binarize），与 text_mask 的阈值方法无关"""
+    return _drop_lines(glyph_ocr.binarize(gray))
+
+
+def _drop_lines(binary):
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    w, h, area = stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_HEIGHT], stats[:, cv2.CC_STAT_AREA]
+    lines = (h <= 4) & (w >= 20) | (w <= 2) & (h >= 12)
+    drop = np.flatnonzero(lines | (area < glyph_ocr.MIN_BLOB))
+    drop = drop[drop > 0]
+    if len(drop):
+        binary[np.isin(labels, drop)] = 0
+    return binary
+
+
+def text_rows(mask, pad=ROW_PAD):
+    """:return: ([(y0, y1)] 每个文字行带（含上下 pad）, (x0, x1) 左右边界)；没有文字时返回 ([], None)"""
+    rows = glyph_ocr.segment_rows((mask.sum(axis=1) >= ROW_MIN_PIXELS)[:, None], min_height=3, merge_gap=2)
+    if not rows:
+        return [], None
+    cols = np.flatnonzero(mask.any(axis=0))
+    x0, x1 = max(0, int(cols[0]) - pad), min(mask.shape[1], int(cols[-1]) + 1 + pad)
+    return [(max(0, y0 - pad), min(mask.shape[0], y1 + pad)) for y0, y1 in rows], (x0, x1)
+
+
+def unstack_rows(stacked, rows, cols, shape, gap=ROW_GAP):
+    """stack_rows 的逆操作：把拼接后的行带放回原图坐标（其余为 0）"""
+    x0, x1 = cols
+    out = np.zeros(shape, stacked.dtype)
+    y = 0
+    for y0, y1 in rows:
+        h = y1 - y0
+        out[y0:y1, x0:x1] = np.maximum(out[y0:y1, x0:x1], stacked[y:y + h])
+        y += h + gap
+    return out
+
+
+def stack_rows(image, rows, cols, gap=ROW_GAP, fill=0):
+    """按行带裁剪并上下拼接，行间插入 gap 像素的 fill"""
+    x0, x1 = cols
+    parts = []
+    for y0, y1 in rows:
+        if parts:
+            parts.append(np.full((gap, x1 - x0) + image.shape[2:], fill, image.dtype))
+        parts.append(image[y0:y1, x0:x1])
+    return np.concatenate(parts, axis=0)
+
+
+def _save(pil, fmt, **kwargs):
+    buf = io.BytesIO()
+    pil.save(buf, format=fmt, **kwargs)
+    return buf.getvalue()
+
+
+def webp_available():
+    return "WEBP" in Image.SAVE
+
+
+def minimize(image, variant="binary"):
+    """
+    :param image: PIL Image（RGB）或 numpy 数组
+    :return: (编码后的字节, MIME 类型, 信息 dict{variant, width, height, raw_bytes, bytes, encode_ms})
+    """
+    t0 = time.perf_counter()
+    if variant not in VARIANTS:
+        raise ValueError(f"未知的 OCR 上传格式: {variant}")
+    if variant == "webp" and not webp_available():
+        raise ValueError("当前 Pillow 不支持 WebP")
+    arr = np.asarray(image)
+    if variant == "png":
+        data = _save(Image.fromarray(arr), "PNG")
+        out_shape = arr.shape
+    else:
+        gray = to_gray(arr)
+        mask = text_mask(gray)
+        rows, cols = text_rows(mask)
+        if not rows:
+            rows, cols = [(0, gray.shape[0])], (0, gray.shape[1])
+        if variant == "binary":
+            cropped = stack_rows(mask, rows, cols)
+            data = _save(Image.fromarray((1 - cropped) * 255).convert("1"), "PNG", optimize=True)
+        else:
+            cropped = stack_rows(gray, rows, cols)
+            pil = Image.fromarray(cropped)
+            if variant == "gray":
+                data = _save(pil, "PNG", optimize=True)
+            elif variant == "palette4":
+                data = _save(pil.quantize(4), "PNG", optimize=True)
+            elif variant == "jpeg":
+                data = _save(pil, "JPEG", quality=70)
+            else:
+                data = _save(pil, "WEBP", lossless=True)
+        out_shape = cropped.shape
+    info = {
+        "variant": variant,
+        "width": int(out_shape[1]),
+        "height": int(out_shape[0]),
+        "raw_bytes": int(arr.shape[0] * arr.shape[1] * (arr.shape[2] if arr.ndim == 3 else 1)),
+        "bytes": len(data),
+        "encode_ms": (time.perf_counter() - t0) * 1000,
+    }
+    return data, _MIME[variant], info
+
+
+def data_uri(image, variant="binary"):
+    """:return: (data URI 字符串, 信息 dict，另含 base64 后的字节数 b64_bytes)"""
+    data, mime, info = minimize(image, variant)
+    encoded = base64.b64encode(data).decode("ascii")
+    info["b64_bytes"] = len(encoded)
+    return f"data:{mime};base64,{encoded}", info
+
+
+def decode(data):
+    """编码结果 → 灰度数组（离线检查用）"""
+    return to_gray(Image.open(io.BytesIO(data)).convert("L"))
+
+
+def mask_fidelity(image, variant):
+    """
+    原图参照掩码（reference_mask）中被解码结果保留下来的文字像素比例，允许 1 像素偏移；
+    同时返回多出来的文字像素比例（噪点，以及参照掩码不含的暗灰色标签）。
+    解码结果放回原图坐标后再比较，裁掉的行也计为丢失。
+    """
+    gray = to_gray(image)
+    reference = reference_mask(gray)
+    if not reference.any():
+        return 1.0, 0.0
+    data, _, _ = minimize(image, variant)
+    decoded = decode(data)
+    if variant == "binary":
+        got = (decoded < 128).astype(np.uint8)
+    else:
+        got = _drop_lines(glyph_ocr.binarize(decoded))
+    if variant != "png":
+        rows, cols = text_rows(text_mask(gray))
+        if not rows:
+            rows, cols = [(0, gray.shape[0])], (0, gray.shape[1])
+        if got.shape != (sum(y1 - y0 for y0, y1 in rows) + ROW_GAP * (len(rows) - 1), cols[1] - cols[0]):
+            return 0.0, 1.0
+        got = unstack_rows(got, rows, cols, gray.shape)
+    kernel = np.ones((3, 3), np.uint8)
+    kept = (reference & cv2.dilate(got, kernel)).sum() / max(1, reference.sum())
+    extra = (got & (1 - cv2.dilate(reference, kernel))).sum() / max(1, got.sum())
+    return float(kept), float(extra)
+
+
+# ==================== 基准 ====================
+def _load_pairs(images, pairs_dir):
+    """:return: [(名称, RGB 数组, 参考文本或 None)]"""
+    items = []
+    paths = list(images or [])
+    if pairs_dir:
+        paths += sorted(glob.glob(os.path.join(pairs_dir, "*.png")))
+    for path in paths:
+        img = cv2.imread(path)
+        if img is None:
+            raise SystemExit(f"无法读取图片: {path}")
+        txt = os.path.splitext(path)[0] + ".txt"
+        reference = None
+        if os.path.exists(txt):
+            with open(txt, encoding="utf-8") as f:
+                reference = f.read()
+        items.append((os.path.basename(path), cv2.cvtColor(img, cv2.COLOR_BGR2RGB), reference))
+    return items
+
+
+def bench(items, variants, bank_path=glyph_ocr.DEFAULT_BANK, url=None, model="qwen-vl-plus"):
+    """
+    :return: {variant: {bytes, b64_bytes, encode_ms, kept, extra, glyph_acc, live_acc, live_ms}}（多图取平均）
+    """
+    glyph = None
+    if bank_path and os.path.exists(bank_path):
+        glyph = glyph_ocr.GlyphOCR.from_file(bank_path)
+    client = None
+    if url is not None:
+        import dashscope_client
+        client = dashscope_client.PooledClient(base_url=url, hedge=False, retries=0)
+    prompt = "请精确识别图片中的所有中文和英文文字，包括数字和符号。只输出识别出的文字内容，不要添加任何额外的说明或格式。"
+
+    results = {}
+    try:
+        for variant in variants:
+            rows = []
+            for name, image, reference in items:
+                uri, info = data_uri(image, variant)
+                row = {"bytes": info["bytes"], "b64_bytes": info["b64_bytes"], "encode_ms": info["encode_ms"]}
+                row["kept"], row["extra"] = mask_fidelity(image, variant)
+                if glyph is not None:
+                    decoded = decode(minimize(image, variant)[0])
+                    if variant == "binary":
+                        # 字形库按亮字暗底收集
+                        decoded = 255 - decoded
+                    target = reference if reference is not None else glyph.recognize(image)
+                    row["glyph_acc"] = glyph_ocr.char_accuracy(glyph.recognize(decoded), target)
+                if client is not None:
+                    messages = [{"role": "user", "content": [{"image": uri}, {"text": prompt}]}]
+                    t0 = time.perf_counter()
+                    resp = client.multimodal(model, messages)
+                    row["live_ms"] = (time.perf_counter() - t0) * 1000
+                    if resp.status_code == 200 and reference is not None:
+                        content = resp.output.choices[0]["message"]["content"]
+                        text = "".join(c.get("text", "") for c in content) if isinstance(content, list) else content
+                        row["live_acc"] = glyph_ocr.char_accuracy(text, reference)
+                rows.append(row)
+            results[variant] = {k: float(np.mean([r[k] for r in rows if k in r]))
+                                for k in rows[0] if any(k in r for r in rows)}
+    finally:
+        if client is not None:
+            client.close()
+    return results
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="OCR 上传图片最小化")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_b = sub.add_parser("bench", help="各编码的字节数、编码耗时和离线准确率检查")
+    p_b.add_argument("--image", action="append", help="截图（同名 .txt 为参考文本，可选）")
+    p_b.add_argument("--pairs", help="截图 + 参考文本目录")
+    p_b.add_argument("--bank", default=glyph_ocr.DEFAULT_BANK, help="字形库，存在时比较本地字形 OCR 结果")
+    p_b.add_argument("--url", default=None, help="OCR 服务地址（如本地替身服务），填写后实际调用模型")
+    p_b.add_argument("--model", default="qwen-vl-plus")
+    p_b.add_argument("--variants", default=",".join(VARIANTS))
+    p_e = sub.add_parser("encode", help="输出一种编码结果，便于查看")
+    p_e.add_argument("--image", required=True)
+    p_e.add_argument("--variant", default="binary", choices=VARIANTS)
+    p_e.add_argument("--out", required=True)
+    args = parser.parse_args()
+
+    if args.cmd == "encode":
+        data, _, info = minimize(_load_pairs([args.image], None)[0][1], args.variant)
+        with open(args.out, "wb") as f:
+            f.write(data)
+        print(f"{args.out}: {info['width']}x{info['height']}，{info['bytes']} 字节")
+        return
+
+    items = _load_pairs(args.image, args.pairs)
+    if not items:
+        parser.error("需要 --image 或 --pairs")
+    variants = [v for v in args.variants.split(",") if v != "webp" or webp_available()]
+    results = bench(items, variants, args.bank, args.url, args.model)
+    base = results.get("png", {}).get("b64_bytes")
+    print(f"{len(items)} 张截图，平均：")
+    for variant, r in results.items():
+        line = (f"  {variant:<9} {r['bytes'] / 1024:6.1f}KB（base64 {r['b64_bytes'] / 1024:.1f}KB"
+                + (f"，{r['b64_bytes'] / base:.0%}" if base else "") + f"） 编码 {r['encode_ms']:.1f}ms"
+                f" 文字保留 {r['kept']:.2%} 多余 {r['extra']:.2%}")
+        if "glyph_acc" in r:
+            line += f" 字形 OCR {r['glyph_acc']:.2%}"
+        if "live_ms" in r:
+            line += f" 模型 {r['live_ms']:.0f}ms"
+        if "live_acc" in r:
+            line += f" 准确率 {r['live_acc']:.2%}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+"""
+本地预筛：在远程 OCR + LLM 判断之前，先在本地排除明显不可能满足预期的洗练结果
+两种检查（都只看属性面板截图，不做 OCR）：
+1. 模板：与 cEquipment.py / reforge_engine.py 相同的 Otsu 二值化 + TM_CCOEFF_NORMED 匹配，
+   给了目标词缀的截图模板时，一个都没匹配上就排除（模板之间是“或”）。
+2. 词缀行哈希：每个文字行（ocr_payload.text_mask 切出的行，裁到文字边界）取哈希。
+   远程 OCR 过的面板按内容把文字行与解析出的记录对齐（比较行的墨迹宽度与记录文本的估计宽度，
+   保持上下顺序，两边都允许跳过——远程 OCR 常漏掉一行），只记下精确识别出词缀的记录（非 fuzzy）；
+   同一行哈希对应同一条词缀（词缀 + 数值）出现 CONFIRMATIONS 次才算确认。
+   之后面板上的行全部确认过时，直接用 rule_engine 的规则在本地判断——不满足则排除，满足仍交给远程确认。
+   预期描述不是规则时只做模板检查。
+抽检：本该排除的结果按 audit_rate 的概率照样提交远程，远程判断为满足即为误排除，计入统计并告警。
+
+    pf = Prefilter.from_paths(["tpl_projectile.png"], rule=rule_engine.compile_rule("投射物技能等級 >= 3"))
+    check = pf.check(rgb)
+    if check["decision"] == "reject":
+        pf.report(check)
+    else:
+        text, ok = remote(...)
+        pf.learn(check["rows"], mod_parser.parse(text))
+        pf.report(check, cost=elapsed, verdict=ok)
+
+模拟（合成字形渲染的随机洗练，远程判断用规则代替，--drop 为远程 OCR 漏行的概率）：
+    python prefilter.py simulate --rolls 2000 --drop 0.2
+"""
+
+import hashlib
+import random
+import re
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+import ocr_payload
+from reforge_engine import load_and_preprocess_template, preprocess_image
+
+
+CONFIRMATIONS = 2       # 同一行 → 同一条词缀出现几次才用于排除
+EM_RATIO = 0.82         # 文字行墨迹宽度 / 文本估计宽度（游戏字体，debug_stats_region.png 实测）
+ALIGN_TOLERANCE = 0.25  # 行与记录宽度的允许偏差（相对值，另加 1 个字宽）
+_WIDE = re.compile(r"[　-鿿＀-￯]")
+
+
+def panel_rows(rgb):
+    """面板截图 → 每个文字行的 (哈希, 墨迹宽度)，从上到下；宽度以行高为单位，见 _band_ems"""
+    mask = ocr_payload.text_mask(ocr_payload.to_gray(rgb))
+    rows = []
+    for y0, y1 in ocr_payload.text_rows(mask, pad=0)[0]:
+        band = mask[y0:y1]
+        cols = np.flatnonzero(band.any(axis=0))
+        band = np.ascontiguousarray(band[:, cols[0]:cols[-1] + 1])
+        h = hashlib.blake2b(np.packbits(band).tobytes(), digest_size=12)
+        h.update(f"{band.shape[0]}x{band.shape[1]}".encode())
+        rows.append((h.hexdigest(), _band_ems(band)))
+    return rows
+
+
+def _band_ems(band):
+    """行内有墨迹的列数（间隔不超过 1/3 行高的空列算作连续，词缀与阶级之间的大段空白不计）/ 行高"""
+    cols = np.flatnonzero(band.any(axis=0))
+    if len(cols) == 0:
+        return 0.0
+    gaps = np.diff(cols) - 1
+    return float(len(cols) + gaps[gaps <= band.shape[0] // 3].sum()) / band.shape[0]
+
+
+def text_ems(text):
+    """文本的估计宽度（字宽为单位）：中文 / 全角字符 1，其余非空白字符 0.5"""
+    wide = len(_WIDE.findall(text))
+    return wide + (len("".join(text.split())) - wide) / 2
+
+
+def align(rows, records, em_ratio=EM_RATIO, tolerance=ALIGN_TOLERANCE):
+    """
+    按内容对齐文字行与解析记录：保持上下顺序，两边都允许跳过；
+    行宽与记录文本宽度相差在容差内才能配对，取配对数最多、其次总宽度差最小的对齐。
+    :param rows: panel_rows 的结果
+    :return: [(行序号, 记录序号)]
+    """
+    n, m = len(rows), len(records)
+    widths = [text_ems(rec["text"]) for rec in records]
+    best = [[(0, 0.0)] * (m + 1) for _ in range(n + 1)]     # (配对数, -总宽度差)
+    move = [[None] * (m + 1) for _ in range(n + 1)]
+    for i in range(1, n + 1):
+        est = rows[i - 1][1] / em_ratio
+        for j in range(1, m + 1):
+            options = [(best[i - 1][j], "row"), (best[i][j - 1], "record")]
+            diff = abs(est - widths[j - 1])
+            if diff <= tolerance * max(est, widths[j - 1]) + 1:
+                pairs, cost = best[i - 1][j - 1]
+                options.append(((pairs + 1, cost - diff), "pair"))
+            best[i][j], move[i][j] = max(options, key=lambda o: o[0])
+    out, i, j = [], n, m
+    while i and j:
+        if move[i][j] == "pair":
+            out.append((i - 1, j - 1))
+            i, j = i - 1, j - 1
+        elif move[i][j] == "row":
+            i -= 1
+        else:
+            j -= 1
+    return out[::-1]
+
+
+def measure_em_ratio(rgb, line):
+    """单行文字截图与其文本 → EM_RATIO（换字体 / 分辨率时重新测量）"""
+    rows = panel_rows(rgb)
+    return rows[0][1] / text_ems(line) if len(rows) == 1 else None
+
+
+class Prefilter:
+    def __init__(self, templates=(), threshold=0.8, rule=None, audit_rate=0.05, max_rows=4096, seed=None,
+                 em_ratio=EM_RATIO, confirmations=CONFIRMATIONS):
+        """
+        :param templates: [(名称, 二值化模板)]，见 reforge_engine.load_and_preprocess_template
+        :param threshold: 模板匹配阈值
+        :param rule: rule_engine.Rule，None 时不做词缀行检查
+        :param audit_rate: 排除结果的抽检比例
+        :param max_rows: 最多记住的词缀行数（超出时丢弃最早的）
+        :param em_ratio: 行宽 / 文本宽度，见 measure_em_ratio
+        :param confirmations: 同一行 → 同一条词缀出现几次才用于排除
+        """
+        self.templates = list(templates)
+        self.threshold = threshold
+        self.rule = rule
+        self.audit_rate = audit_rate
+        self.max_rows = max_rows
+        self.em_ratio = em_ratio
+        self.confirmations = confirmations
+        self.known = OrderedDict()      # 行哈希 -> [(词缀, 数值, 百分比), 词缀记录, 出现次数]
+        self.rng = random.Random(seed)
+        self.rolls = 0
+        self.rejected = {}              # 原因 -> 次数（不含抽检）
+        self.escalated = 0
+        self.audits = 0
+        self.false_rejects = 0
+        self.remote_time = 0.0
+        self.learned = 0
+
+    @classmethod
+    def from_paths(cls, paths, **kwargs):
+        import os
+        templates = [(os.path.basename(p), load_and_preprocess_template(p)) for p in paths]
+        return cls(templates, **kwargs)
+
+    @property
+    def enabled(self):
+        return bool(self.templates) or self.rule is not None
+
+    def match_templates(self, rgb):
+        """:return: (最高得分, 对应模板名)"""
+        screen = preprocess_image(cv2.cvtColor(np.ascontiguousarray(rgb), cv2.COLOR_RGB2BGR))
+        best, best_name = -1.0, None
+        for name, tpl in self.templates:
+            if tpl.shape[0] > screen.shape[0] or tpl.shape[1] > screen.shape[1]:
+                continue
+            score = float(cv2.minMaxLoc(cv2.matchTemplate(screen, tpl, cv2.TM_CCOEFF_NORMED))[1])
+            if score > best:
+                best, best_name = score, name
+        return best, best_name
+
+    def confirmed(self, key):
+        entry = self.known.get(key)
+        return entry is not None and entry[2] >= self.confirmations
+
+    def check(self, rgb):
+        """
+        :param rgb: 属性面板截图（RGB 数组）
+        :return: {"decision": "reject" / "escalate", "reason", "kind", "rows", "audit"}
+                 kind 为排除原因类别（template / rows），提交远程时为 None；rows 见 panel_rows，交给 learn
+        """
+        rows = panel_rows(rgb) if self.rule is not None else []
+        keys = [key for key, _ in rows]
+        decision, kind, reason = "escalate", None, "无法在本地判断"
+        if self.templates:
+            score, name = self.match_templates(rgb)
+            if score < self.threshold:
+                decision, kind = "reject", "template"
+                reason = f"目标词缀模板未匹配（最高 {score:.2f}{'，' + name if name else ''}）"
+        if decision == "escalate" and self.rule is not None and keys:
+            unconfirmed = sum(not self.confirmed(k) for k in keys)
+            if not unconfirmed:
+                records = [self.known[k][1] for k in keys]
+                if self.rule.matches(records):
+                    reason = "已知词缀行满足规则，远程确认"
+                else:
+                    decision, kind, reason = "reject", "rows", f"{len(keys)} 行词缀都已确认且不满足规则"
+            else:
+                reason = f"{unconfirmed}/{len(keys)} 行词缀未确认"
+        audit = decision == "reject" and self.rng.random() < self.audit_rate
+        if audit:
+            decision = "escalate"
+        return {"decision": decision, "reason": reason, "kind": kind, "rows": rows, "audit": audit}
+
+    def learn(self, rows, records):
+        """
+        按内容对齐文字行与远程 OCR 解析出的记录（见 align），记下精确识别出词缀的行；
+        同一行哈希对应的词缀或数值变了时重新计数。
+        :return: 本次记下的行数
+        """
+        if not rows or not records:
+            return 0
+        count = 0
+        for i, j in align(rows, records, self.em_ratio):
+            rec = records[j]
+            if rec["stat"] is None or rec["fuzzy"]:
+                continue
+            key = rows[i][0]
+            signature = (rec["stat"], tuple(rec["values"]), rec["percent"])
+            entry = self.known.get(key)
+            if entry is None or entry[0] != signature:
+                entry = self.known[key] = [signature, rec, 0]
+            entry[2] += 1
+            if entry[2] == self.confirmations:
+                self.learned += 1
+            self.known.move_to_end(key)
+            count += 1
+        while len(self.known) > self.max_rows:
+            self.known.popitem(last=False)
+        return count
+
+    def report(self, check, cost=0.0, verdict=None):
+        """
+        每次洗练调用一次。
+        :param cost: 远程 OCR + 判断用的秒数（被排除时为 0）
+        :param verdict: 远程判断结果（被排除时为 None）
+        :return: 本次是否发现误排除
+        """
+        self.rolls += 1
+        if check["decision"] == "reject":
+            self.rejected[check["kind"]] = self.rejected.get(check["kind"], 0) + 1
+            return False
+        self.escalated += 1
+        self.remote_time += cost
+        if check["audit"]:
+            self.audits += 1
+            if verdict:
+                self.false_rejects += 1
+                return True
+        return False
+
+    def stats(self):
+        avg_cost = self.remote_time / self.escalated if self.escalated else 0.0
+        # 抽检的结果付了远程费用，计入提交而不计入排除
+        skipped = sum(self.rejected.values())
+        return {
+            "rolls": self.rolls,
+            "escalated": self.escalated,
+            "escalation_rate": self.escalated / self.rolls if self.rolls else 0.0,
+            "rejected": dict(self.rejected),
+            "audits": self.audits,
+            "false_rejects": self.false_rejects,
+            "false_reject_rate": self.false_rejects / self.audits if self.audits else 0.0,
+            "avg_remote_s": avg_cost,
+            "saved_s": skipped * avg_cost,
+            "known_rows": sum(entry[2] >= self.confirmations for entry in self.known.values()),
+        }
+
+    def format_lines(self):
+        st = self.stats()
+        reasons = "、".join(f"{'模板' if k == 'template' else '已知行'} {n}" for k, n in st["rejected"].items())
+        lines = [f"🔎 本地预筛: {st['rolls']} 次中提交远程 {st['escalated']} 次（{st['escalation_rate']:.0%}），"
+                 f"排除 {sum(st['rejected'].values())} 次（{reasons or '无'}），"
+                 f"约节省 {st['saved_s']:.1f}s（远程平均 {st['avg_remote_s']:.2f}s），已确认词缀行 {st['known_rows']}",
+                 f"🔎 抽检 {st['audits']} 次，误排除 {st['false_rejects']} 次"]
+        return lines
+
+
+# ==================== 模拟 ====================
+# 词缀池：(模板, 可能的数值)；每次洗练随机抽 3~4 条不同的词缀
+MOD_POOL = [
+    ("+{} 所有投射物技能石等級", (1, 2, 3)),
+    ("+{}% 火焰抗性", (20, 25, 30, 35, 40, 45)),
+    ("+{}% 冰冷抗性", (20, 25, 30, 35, 40, 45)),
+    ("+{} 最大生命", (60, 70, 80, 90, 100)),
+    ("+{} 點力量", (13, 18, 23, 27)),
+    ("攻擊附加 {} 至 3 物理傷害", (1, 2)),
+    ("+{}% 攻擊速度", (5, 8, 11)),
+    ("+{} 最大魔力", (40, 50, 60)),
+]
+
+
+def simulate(rolls=2000, rule_source="投射物技能等級 >= 3 或 (火抗 >= 30 且 生命 >= 80)",
+             use_template=False, audit_rate=0.05, remote_cost=2.0, drop=0.2, seed=1):
+    """
+    合成字形渲染随机洗练；远程 OCR 返回真实文本（按 drop 的概率漏掉一行），远程判断用同一条规则。
+    :param use_template: True 时用第一条词缀（+3 投射物）的渲染图作为模板（只适合单条件规则）
+    :return: (Prefilter, 实际漏掉的满足结果数——被排除且未抽检的)
+    """
+    import glyph_ocr
+    import mod_parser
+    import rule_engine
+
+    rng = random.Random(seed)
+    rule = rule_engine.compile_rule(rule_source)
+    chars = "".join({c for fmt, _ in MOD_POOL for c in fmt} | set("0123456789%+"))
+    font = glyph_ocr.synthetic_font(chars)
+    templates = []
+    if use_template:
+        tpl = glyph_ocr.render_text(font, MOD_POOL[0][0].format(3))
+        templates = [("projectile", preprocess_image(cv2.cvtColor(tpl, cv2.COLOR_RGB2BGR))[2:-2, 2:-2])]
+    line = MOD_POOL[0][0].format(3)
+    em_ratio = measure_em_ratio(glyph_ocr.render_text(font, line), line)
+    pf = Prefilter(templates, rule=rule, audit_rate=audit_rate, seed=seed, em_ratio=em_ratio)
+    true_false_rejects = 0
+    for _ in range(rolls):
+        mods = rng.sample(MOD_POOL, rng.randint(3, 4))
+        text = "\n".join(fmt.format(rng.choice(values)) for fmt, values in mods)
+        rgb = glyph_ocr.render_text(font, text)
+        truth = rule.matches(mod_parser.parse(text))
+        check = pf.check(rgb)
+        if check["decision"] == "reject":
+            true_false_rejects += truth
+            pf.report(check)
+            continue
+        lines = text.splitlines()
+        if rng.random() < drop:
+            del lines[rng.randrange(len(lines))]
+        pf.learn(check["rows"], mod_parser.parse("\n".join(lines)))
+        pf.report(check, cost=remote_cost, verdict=truth)
+    return pf, true_false_rejects
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地预筛")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_sim = sub.add_parser("simulate", help="合成洗练模拟：提交率、节省、误排除")
+    p_sim.add_argument("--rolls", type=int, default=2000)
+    p_sim.add_argument("--rule", default="投射物技能等級 >= 3 或 (火抗 >= 30 且 生命 >= 80)")
+    p_sim.add_argument("--template", action="store_true", help="同时使用 +3 投射物模板（仅适合单条件规则）")
+    p_sim.add_argument("--audit", type=float, default=0.05)
+    p_sim.add_argument("--remote-cost", type=float, default=2.0, help="假定的远程 OCR + 判断秒数")
+    p_sim.add_argument("--drop", type=float, default=0.2, help="远程 OCR 漏掉一行的概率")
+    args = parser.parse_args()
+
+    import time
+
+    t0 = time.perf_counter()
+    pf, actual = simulate(args.rolls, args.rule, args.template, args.audit, args.remote_cost, args.drop)
+    elapsed = time.perf_counter() - t0
+    for line in pf.format_lines():
+        print(line)
+    print(f"（模拟中实际漏掉满足的结果 {actual} 次；本地检查平均 {elapsed / args.rolls * 1000:.2f}ms/次，含渲染）")
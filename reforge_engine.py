@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""
+极速洗练核心循环（主词条 + 右侧T阶图标匹配）
+与界面解耦：输入、截图、日志、等待、缓存保存均可注入，
+既可由 CombinedApp 驱动真实游戏，也可由 replay_harness.py 在无界面、无等待的情况下跑满速。
+"""
+
+import os
+import threading
+
+import cv2
+
+from backends import compile_sequence
+from deadline_timer import DeadlineTimer, now_ns
+from latency_trace import SpanTracer, NULL_TRACER
+from frame_corpus import CorpusWriter, DECISION_MISS, DECISION_MAIN_ONLY, DECISION_SUCCESS
+
+
+def preprocess_image(img):
+    """灰度 + OTSU 二值化"""
+    if len(img.shape) == 3:
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    else:
+        gray = img.copy()
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return binary
+
+
+def load_and_preprocess_template(path):
+    """加载并预处理模板"""
+    template = cv2.imread(path, cv2.IMREAD_COLOR)
+    if template is None:
+        raise ValueError(f"无法加载模板: {path}")
+    return preprocess_image(template)
+
+
+class ReforgeCancelled(Exception):
+    """取消事件已置位（F12 热键 / 停止按钮），在阶段边界抛出"""
+
+
+class ReforgeEngine:
+    def __init__(self, config, inputs, capture, log=print, sleep=None,
+                 cancel=None, progress=None, save_cache=None, debug=False, tracer=None,
+                 journal=None, journal_source="live", timer=None):
+        """
+        :param config: run_reforge 使用的配置字典（REFORGE_ORB_POS、MOD_DISPLAY_REGION 等）
+        :param inputs: 输入后端，见 backends.py
+        :param capture: 截图后端，见 backends.py
+        :param log: 洗练日志输出
+        :param sleep: 等待函数，None 表示用 timer 等到绝对截止时间（取消事件置位后立即返回）；离线回放时可传入空函数
+        :param cancel: threading.Event，置位后在当前阶段结束时中断；None 时新建一个
+        :param progress: 每次洗练结束时调用 progress(attempt, max_attempts, decision)
+        :param save_cache: 保存标注结果图的函数 (image, prefix) -> path，None 表示不保存
+        :param debug: 是否打印 [DEBUG] 信息
+        :param tracer: latency_trace.SpanTracer，None 表示不记录阶段耗时
+        :param journal: attempt_journal.AttemptJournal，None 表示不写洗练记录
+        :param journal_source: 写入记录时的来源标记（live / replay）
+        :param timer: deadline_timer.DeadlineTimer，None 时新建一个（可读取唤醒抖动统计）
+        """
+        self.config = config
+        self.inputs = inputs
+        self.capture = capture
+        self.log = log
+        self.sleep = sleep
+        self.cancel = cancel if cancel is not None else threading.Event()
+        self.progress = progress
+        self.save_cache = save_cache
+        self.debug = debug
+        self.journal = journal
+        self.journal_source = journal_source
+        if tracer is None:
+            # 写洗练记录需要每次的阶段耗时，此时用一个小的内部追踪缓冲区
+            tracer = SpanTracer("reforge", capacity=4096) if journal is not None else NULL_TRACER
+        self.tracer = tracer
+        self.timer = timer if timer is not None else DeadlineTimer("reforge")
+
+        self.attempt = 0
+        self.success = False
+        self.stopped = False
+
+    def _debug(self, msg):
+        if self.debug:
+            print(f"[DEBUG] {msg}")
+
+    def _check_cancel(self):
+        if self.cancel.is_set():
+            raise ReforgeCancelled()
+
+    def _wait_until(self, deadline_ns):
+        """等到绝对截止时间（perf_counter_ns）；取消事件置位时立即中断"""
+        if self.sleep is None:
+            if self.timer.wait_until(deadline_ns, self.cancel):
+                raise ReforgeCancelled()
+        else:
+            self.sleep(max(0.0, (deadline_ns - now_ns()) / 1e9))
+            self._check_cancel()
+
+    def match_main_and_get_template(self, screen_gray, templates_with_path, threshold, attempt_num):
+        """匹配主词条并获取最佳模板"""
+        self.log(f"\n🔄 第 {attempt_num} 次洗练 - 主词条匹配:")
+        best_score = -1
+        best_template = None
+        best_path = None
+        best_loc = None
+        h_scr, w_scr = screen_gray.shape
+        for path, template in templates_with_path:
+            h_tpl, w_tpl = template.shape[:2]
+            if h_tpl > h_scr or w_tpl > w_scr:
+                self.log(f" ❌ 模板 {os.path.basename(path)}: 尺寸过大（跳过）")
+                continue
+            res = cv2.matchTemplate(screen_gray, template, cv2.TM_CCOEFF_NORMED)
+            _, max_val, _, max_loc = cv2.minMaxLoc(res)
+            status = "✅" if max_val >= threshold else "❌"
+            self.log(f" 🔍 {os.path.basename(path)}: 得分={max_val:.4f} → {status}")
+            if max_val >= threshold and max_val > best_score:
+                best_score = max_val
+                best_template = template
+                best_path = path
+                best_loc = max_loc
+        if best_template is not None:
+            self.log(f" 🎯 主词条匹配成功！模板: {os.path.basename(best_path)} | 得分={best_score:.4f} | 位置={best_loc}")
+            return True, best_template, best_path, best_loc, best_score
+        return False, None, None, None, -1
+
+    def run(self):
+        """运行洗练循环，返回 (结果文字, 尝试次数)"""
+        config = self.config
+        inputs = self.inputs
+        tracer = self.tracer
+
+        self.log("\n" + "="*70)
+        self.log("⚡ 极速洗练启动（主词条 + 右侧T阶图标匹配 | 整行搜索）")
+        self.log("🛑 按 F12 或点击停止可随时中断洗练")
+        self.log("="*70)
+
+        # 加载主词条模板
+        main_templates_with_path = [
+            (path, load_and_preprocess_template(path))
+            for path in config["MAIN_TEMPLATE_PATHS"]
+        ]
+
+        # 加载T阶模板
+        tier_template = load_and_preprocess_template(config["TIER_TEMPLATE_PATH"])
+        h_tier, w_tier = tier_template.shape
+
+        orb_x, orb_y = config["REFORGE_ORB_POS"]
+        equip_x, equip_y = config["TARGET_EQUIP_POS"]
+        x, y, w, h = config["MOD_DISPLAY_REGION"]
+        main_thresh = config["MAIN_THRESHOLD"]
+        tier_thresh = config["TIER_THRESHOLD"]
+        max_attempts = config["MAX_ATTEMPTS"]
+        equip_click_delay = config["EQUIP_CLICK_DELAY"]
+        orb_delay = config["ORB_DELAY"]
+
+        # 每次洗练都相同的“移到装备 → 左键”预编译一次
+        reroll = compile_sequence(inputs, [(0, "move_to", equip_x, equip_y), (0, "click")])
+        click_wait_ns = int(max(equip_click_delay * 0.7, 0.1) * 1e9)
+
+        # 可选：录制原始属性区域截图到内存映射语料
+        corpus_writer = None
+        if config.get("RECORD_CORPUS") and config.get("CORPUS_DIR"):
+            try:
+                corpus_writer = CorpusWriter(config["CORPUS_DIR"], (h, w, 3))
+                self.log(f"📼 录制语料: {config['CORPUS_DIR']}（已有 {corpus_writer.count} 帧）")
+            except Exception as e:
+                self.log(f"⚠️ 语料录制不可用: {e}")
+
+        self.success = False
+        self.stopped = False
+        self.attempt = 0
+
+        journal = self.journal
+        run_id = None
+        if journal is not None:
+            run_config = {k: v for k, v in config.items() if k not in ("MAIN_TEMPLATE_PATHS", "TIER_TEMPLATE_PATH")}
+            run_config["MAIN_TEMPLATES"] = [os.path.basename(p) for p in config["MAIN_TEMPLATE_PATHS"]]
+            run_config["TIER_TEMPLATE"] = os.path.basename(config["TIER_TEMPLATE_PATH"])
+            run_id = journal.start_run(run_config, source=self.journal_source)
+
+        # 循环正常结束或被中断时改为实际结果；其他异常向外抛出，记录中为“异常”
+        result = "异常"
+        try:
+            self._wait_until(now_ns() + 100_000_000)  # 减少初始延迟
+            inputs.move_to(orb_x, orb_y, duration=0.03)
+            t_orb = now_ns()
+            inputs.right_click()
+            self._wait_until(t_orb + int(orb_delay * 1e9))
+            inputs.key_down('shift')
+
+            self._debug(f"开始洗练循环，最大尝试次数: {max_attempts}")
+            while self.attempt < max_attempts:
+                self._check_cancel()
+                self.attempt += 1
+                attempt = self.attempt
+                self._debug(f"第 {attempt} 次尝试")
+                if tracer.enabled:
+                    tracer.seq = attempt
+                trace_mark = tracer.mark()
+                t_attempt = t = tracer.now()
+                t_click = reroll.play(self.timer)
+                t = tracer.lap("move_click", t)
+                # 减少点击后延迟，但保留最小值以确保游戏响应；从点击发出时刻起算
+                self._wait_until(t_click + click_wait_ns)
+                t = tracer.lap("sleep", t)
+
+                inputs.key_down('alt')
+                t = tracer.lap("alt_down", t)
+                raw_rgb = self.capture.grab((x, y, w, h))
+                t = tracer.lap("capture", t)
+                inputs.key_up('alt')
+                t_captured = now_ns()
+                t = tracer.lap("alt_up", t)
+                self._check_cancel()
+
+                # 原始截图（BGR）用于标注和录制，灰度直接由 RGB 转换
+                raw_img_bgr = cv2.cvtColor(raw_rgb, cv2.COLOR_RGB2BGR)
+                screen_gray = preprocess_image(cv2.cvtColor(raw_rgb, cv2.COLOR_RGB2GRAY))
+                t = tracer.lap("preprocess", t)
+
+                # === 第1步：主词条匹配 ===
+                main_matched, matched_main_tpl, matched_main_path, match_loc, score = self.match_main_and_get_template(
+                    screen_gray, main_templates_with_path, main_thresh, attempt
+                )
+                t = tracer.lap("main_match", t)
+                self._debug(f"主词条匹配结果: {main_matched}")
+
+                # === 第2步：在右侧整行区域匹配T阶图标（只有主词条匹配成功才进行）===
+                tier_matched = False
+                max_val_tier = 0.0
+                search_x_start = search_y_start = 0
+                if main_matched:
+                    h_scr, w_scr = screen_gray.shape
+                    h_main, w_main = matched_main_tpl.shape
+                    x_main, y_main = match_loc
+
+                    search_x_start = x_main + w_main
+                    search_x_end = w_scr
+                    search_y_start = y_main
+                    search_y_end = y_main + h_main
+                    self._debug(f"T阶匹配区域: x={search_x_start}-{search_x_end}, y={search_y_start}-{search_y_end}, 模板={h_tier}x{w_tier}")
+
+                    if search_x_start < search_x_end and search_y_end <= h_scr:
+                        if h_tier <= (search_y_end - search_y_start) and w_tier <= (search_x_end - search_x_start):
+                            search_region = screen_gray[search_y_start:search_y_end, search_x_start:search_x_end]
+                            res_tier = cv2.matchTemplate(search_region, tier_template, cv2.TM_CCOEFF_NORMED)
+                            _, max_val_tier, _, _ = cv2.minMaxLoc(res_tier)
+                            self.log(f" 🔍 T阶图标匹配得分: {max_val_tier:.4f} | 阈值: {tier_thresh:.2f}")
+                            tier_matched = max_val_tier >= tier_thresh
+                        else:
+                            self.log(" ⚠️ T阶模板大于右侧可用区域")
+                    else:
+                        self.log(" ⚠️ 主词条右侧无有效搜索区域")
+                else:
+                    self._debug("主词条未匹配，跳过T阶匹配")
+                t = tracer.lap("tier_match", t)
+                decision = DECISION_SUCCESS if tier_matched else DECISION_MAIN_ONLY if main_matched else DECISION_MISS
+
+                # 录制原始截图（未标注）
+                if corpus_writer is not None:
+                    try:
+                        corpus_writer.append(
+                            raw_img_bgr, attempt=attempt, main_score=max(score, 0.0), tier_score=max_val_tier,
+                            decision=decision,
+                            template=os.path.basename(matched_main_path) if main_matched else None,
+                        )
+                    except Exception as e:
+                        self.log(f"⚠️ 语料录制失败，已停止录制: {e}")
+                        corpus_writer.close()
+                        corpus_writer = None
+                    t = tracer.lap("record", t)
+
+                if self.save_cache is not None:
+                    # 在图片上标记识别结果
+                    result_img = raw_img_bgr.copy()
+                    if main_matched:
+                        # 主词条位置画绿色矩形框和得分
+                        cv2.rectangle(result_img, match_loc,
+                                      (match_loc[0] + matched_main_tpl.shape[1], match_loc[1] + matched_main_tpl.shape[0]),
+                                      (0, 255, 0), 2)
+                        cv2.putText(result_img, f"Main: {score:.2f}",
+                                    (match_loc[0], match_loc[1] - 10),
+                                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+                        # T阶结果：成功用绿色，失败用红色
+                        color = (0, 255, 0) if tier_matched else (0, 0, 255)
+                        cv2.rectangle(result_img, (search_x_start, search_y_start),
+                                      (search_x_start + w_tier, search_y_start + h_tier),
+                                      color, 2)
+                        cv2.putText(result_img, f"Tier: {max_val_tier:.2f}",
+                                    (search_x_start, search_y_start - 10),
+                                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+                    t = tracer.lap("annotate", t)
+
+                    # 保存带识别结果的图片
+                    try:
+                        cache_path = self.save_cache(result_img, "equip_mods")
+                        self._debug(f"装备词条已缓存到: {cache_path}")
+                    except Exception as e:
+                        self._debug(f"缓存保存失败: {e}")
+                    t = tracer.lap("cache_write", t)
+
+                tracer.add("attempt", t_attempt, tracer.now())
+                if journal is not None:
+                    stages = tracer.since(trace_mark)
+                    journal.record_attempt(
+                        run_id, attempt,
+                        os.path.basename(matched_main_path) if main_matched else None,
+                        max(score, 0.0), max_val_tier, decision,
+                        latency_ms=stages.pop("attempt", None), stages=stages,
+                    )
+                if self.progress is not None:
+                    self.progress(attempt, max_attempts, decision)
+                if tier_matched:
+                    self.log(" ✅ 主词条 + T阶图标均匹配成功！洗练成功！")
+                    self.success = True
+                    break
+                else:
+                    self.log(" ⚠️ T阶图标未匹配，跳过本次结果")
+
+                # 截图后至少间隔 1ms；匹配耗时已超过时不再等待
+                self._wait_until(t_captured + 1_000_000)
+
+            result = "成功" if self.success else "已达上限"
+        except ReforgeCancelled:
+            self.log("\n⏸️ 洗练已中断（F12 / 停止按钮）。")
+            self.stopped = True
+            result = "已中断"
+        finally:
+            inputs.key_up('alt')
+            inputs.key_up('shift')
+            if corpus_writer is not None:
+                corpus_writer.close()
+            if journal is not None:
+                journal.end_run(run_id, result, self.attempt)
+
+        self.log(f"\n🏁 {result}！共 {self.attempt} 次。")
+        return result, self.attempt
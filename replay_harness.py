@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+离线回放 / 假游戏
+用录制的语料（frame_corpus）或合成的属性截图代替游戏画面，
+响应洗练循环的模拟点击：右键洗练石 + 按住 Shift + 左键装备 → 换一帧新的属性截图。
+无界面、无等待地跑满速 ReforgeEngine，统计每秒尝试次数和各阶段耗时。
+相同种子下结果完全可复现。
+
+用法：
+    python replay_harness.py --corpus reforge_corpus/355x170 --main a.png --tier t1.png
+    python replay_harness.py --synthetic --main a.png --main b.png --tier t1.png --seed 1
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from latency_trace import SpanTracer, write_chrome_trace
+from reforge_engine import ReforgeEngine
+
+FAKE_ORB_POS = (100, 100)
+FAKE_EQUIP_POS = (300, 300)
+
+
+class FakeGame:
+    """同时实现输入后端和截图后端的假游戏"""
+
+    def __init__(self, frames, orb_pos=FAKE_ORB_POS, equip_pos=FAKE_EQUIP_POS, seed=0):
+        """
+        :param frames: BGR 帧序列（列表、数组或 CorpusReader.frames），形状一致
+        :param seed: 决定每次洗练后展示哪一帧
+        """
+        if len(frames) == 0:
+            raise ValueError("没有可回放的帧")
+        self.frames = frames
+        self.orb_pos = tuple(orb_pos)
+        self.equip_pos = tuple(equip_pos)
+        self.rng = random.Random(seed)
+
+        self.pos = (0, 0)
+        self.held = set()
+        self.orb_armed = False
+        self.current = self.rng.randrange(len(frames))
+        self.history = [self.current]
+
+        self.rerolls = 0
+        self.misclicks = 0
+        self.grabs_without_alt = 0
+
+    @property
+    def frame_shape(self):
+        return self.frames[0].shape
+
+    # ---------- 输入后端 ----------
+    def move_to(self, x, y, duration=0.0):
+        self.pos = (x, y)
+
+    def click(self):
+        if self.pos != self.equip_pos or not self.orb_armed:
+            self.misclicks += 1
+            return
+        # 没按住 Shift 时洗练石只生效一次
+        if 'shift' not in self.held:
+            self.orb_armed = False
+        self.current = self.rng.randrange(len(self.frames))
+        self.history.append(self.current)
+        self.rerolls += 1
+
+    def right_click(self):
+        if self.pos == self.orb_pos:
+            self.orb_armed = True
+        else:
+            self.misclicks += 1
+
+    def key_down(self, key):
+        self.held.add(key)
+
+    def key_up(self, key):
+        self.held.discard(key)
+
+    def press(self, key):
+        pass
+
+    # ---------- 截图后端 ----------
+    def grab(self, region):
+        x, y, w, h = region
+        frame = self.frames[self.current]
+        if (h, w) != frame.shape[:2]:
+            raise ValueError(f"截图区域 {w}x{h} 与回放帧 {frame.shape[1]}x{frame.shape[0]} 不一致")
+        if 'alt' not in self.held:
+            self.grabs_without_alt += 1
+        return cv2.cvtColor(np.asarray(frame), cv2.COLOR_BGR2RGB)
+
+    def sequence_digest(self):
+        """已展示帧序列的摘要，用于确认同一种子下结果一致"""
+        return hashlib.sha1(np.asarray(self.history, dtype=np.int64).tobytes()).hexdigest()[:12]
+
+
+def synthetic_frames(main_template_paths, tier_template_path, count=200, main_rate=0.3,
+                     hit_rate=0.05, seed=0, shape=None):
+    """
+    合成属性截图：深色噪声背景 + 随机干扰文字行，按概率放入主词条模板，
+    主词条右侧再按概率放入T阶图标。
+    :return: (BGR 帧列表, 标签列表)；标签为 (主词条模板路径或 None, 是否有T阶图标)
+    """
+    mains = []
+    for path in main_template_paths:
+        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError(f"无法加载模板: {path}")
+        mains.append((path, img))
+    tier = cv2.imread(tier_template_path, cv2.IMREAD_COLOR)
+    if tier is None:
+        raise ValueError(f"无法加载模板: {tier_template_path}")
+
+    line_h = max(max(img.shape[0] for _, img in mains), tier.shape[0]) + 6
+    if shape is None:
+        width = max(img.shape[1] for _, img in mains) + tier.shape[1] + 60
+        shape = (line_h * 5, width, 3)
+    h, w = shape[:2]
+    rows = max(1, h // line_h)
+
+    rng = np.random.default_rng(seed)
+    alphabet = "abcdefghijklmnopqrstuvwxyz0123456789+%()-"
+    frames, labels = [], []
+    for _ in range(count):
+        frame = rng.integers(0, 40, size=(h, w, 3), dtype=np.uint8)
+        for r in range(rows):
+            text = "".join(rng.choice(list(alphabet), size=int(rng.integers(8, 20))))
+            cv2.putText(frame, text, (4, r * line_h + line_h - 6), cv2.FONT_HERSHEY_PLAIN,
+                        1.0, (150, 150, 150), 1)
+
+        main_label, has_tier = None, False
+        if rng.random() < main_rate:
+            path, img = mains[int(rng.integers(len(mains)))]
+            row = int(rng.integers(rows))
+            y0 = row * line_h + (line_h - img.shape[0]) // 2
+            x0 = int(rng.integers(0, max(1, w - img.shape[1] - tier.shape[1] - 10)))
+            # 清掉该行的干扰文字，再放入主词条
+            frame[row * line_h:(row + 1) * line_h, :] = rng.integers(0, 40, size=(line_h, w, 3), dtype=np.uint8)
+            frame[y0:y0 + img.shape[0], x0:x0 + img.shape[1]] = img
+            main_label = path
+            if rng.random() < hit_rate:
+                tx = x0 + img.shape[1] + int(rng.integers(4, max(5, w - x0 - img.shape[1] - tier.shape[1])))
+                ty = y0 + (img.shape[0] - tier.shape[0]) // 2
+                if tier.shape[0] <= img.shape[0] and tx + tier.shape[1] <= w:
+                    frame[ty:ty + tier.shape[0], tx:tx + tier.shape[1]] = tier
+                    has_tier = True
+        frames.append(frame)
+        labels.append((main_label, has_tier))
+    return frames, labels
+
+
+def run_headless(game, main_template_paths, tier_template_path, max_attempts=500,
+                 main_threshold=0.85, tier_threshold=0.90, save_cache=None, log=None, tracer=None,
+                 journal=None):
+    """
+    在假游戏上无等待地运行一次完整的洗练循环。
+    :param tracer: SpanTracer，None 时新建一个
+    :param journal: AttemptJournal，记录来源为 "replay"
+    :return: 结果字典（结果、尝试次数、耗时、每秒尝试次数、各阶段耗时统计、帧序列摘要）
+    """
+    if tracer is None:
+        tracer = SpanTracer("replay")
+    fh, fw = game.frame_shape[:2]
+    config = {
+        "REFORGE_ORB_POS": game.orb_pos,
+        "TARGET_EQUIP_POS": game.equip_pos,
+        "MOD_DISPLAY_REGION": (0, 0, fw, fh),
+        "MAIN_THRESHOLD": main_threshold,
+        "TIER_THRESHOLD": tier_threshold,
+        "MAX_ATTEMPTS": max_attempts,
+        "ORB_DELAY": 0.0,
+        "EQUIP_CLICK_DELAY": 0.0,
+        "ALT_SCREENSHOT_DELAY": 0.0,
+        "LOOP_RANDOM_MAX": 0.0,
+        "MAIN_TEMPLATE_PATHS": list(main_template_paths),
+        "TIER_TEMPLATE_PATH": tier_template_path,
+    }
+    engine = ReforgeEngine(
+        config, inputs=game, capture=game,
+        log=log or (lambda msg: None),
+        sleep=lambda seconds: None,
+        save_cache=save_cache,
+        tracer=tracer,
+        journal=journal,
+        journal_source="replay",
+    )
+    t0 = time.perf_counter()
+    result, attempts = engine.run()
+    elapsed = time.perf_counter() - t0
+    return {
+        "result": result,
+        "attempts": attempts,
+        "elapsed_s": elapsed,
+        "attempts_per_s": attempts / elapsed if elapsed > 0 else 0.0,
+        "stages": tracer.summary(),
+        "digest": game.sequence_digest(),
+        "misclicks": game.misclicks,
+        "grabs_without_alt": game.grabs_without_alt,
+    }
+
+
+def print_report(report):
+    print(f"🏁 {report['result']} | 尝试 {report['attempts']} 次 | 耗时 {report['elapsed_s']:.3f}s "
+          f"| {report['attempts_per_s']:.1f} 次/秒 | 序列摘要 {report['digest']}")
+    if report["misclicks"] or report["grabs_without_alt"]:
+        print(f"⚠️ 无效点击 {report['misclicks']} 次，未按 Alt 截图 {report['grabs_without_alt']} 次")
+    print(f"{'阶段':<12}{'次数':>8}{'平均ms':>10}{'p50ms':>10}{'p95ms':>10}{'p99ms':>10}")
+    for name, st in report["stages"].items():
+        print(f"{name:<12}{st['n']:>8}{st['mean_ms']:>10.3f}{st['p50_ms']:>10.3f}{st['p95_ms']:>10.3f}{st['p99_ms']:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="洗练循环离线回放 / 满速压测")
+    src = parser.add_mutually_exclusive_group(required=True)
+    src.add_argument("--corpus", help="frame_corpus 语料目录")
+    src.add_argument("--synthetic", action="store_true", help="使用合成帧")
+    parser.add_argument("--main", action="append", required=True, help="主词条模板（可多次）")
+    parser.add_argument("--tier", required=True, help="T阶图标模板")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--attempts", type=int, default=500)
+    parser.add_argument("--frames", type=int, default=200, help="合成帧数量")
+    parser.add_argument("--hit-rate", type=float, default=0.0, help="合成帧中主词条带T阶图标的概率（0 表示跑满次数）")
+    parser.add_argument("--main-threshold", type=float, default=0.85)
+    parser.add_argument("--tier-threshold", type=float, default=0.90)
+    parser.add_argument("--with-cache", action="store_true", help="包含标注和缓存写入阶段（写入临时目录）")
+    parser.add_argument("--trace-out", help="导出 Chrome trace JSON 的路径")
+    parser.add_argument("--journal", help="写入洗练记录的 SQLite 路径（来源标记为 replay）")
+    args = parser.parse_args()
+
+    if args.corpus:
+        from frame_corpus import CorpusReader
+        frames = CorpusReader(args.corpus).frames
+    else:
+        frames, _ = synthetic_frames(args.main, args.tier, count=args.frames,
+                                     hit_rate=args.hit_rate, seed=args.seed)
+
+    save_cache = None
+    if args.with_cache:
+        from cache_manager import CacheManager
+        manager = CacheManager(os.path.join(tempfile.mkdtemp(), "equipment_cache"))
+        save_cache = lambda image, prefix: manager.save(image, prefix=prefix)
+
+    journal = None
+    if args.journal:
+        from attempt_journal import AttemptJournal
+        journal = AttemptJournal(args.journal)
+
+    game = FakeGame(frames, seed=args.seed)
+    tracer = SpanTracer("replay")
+    report = run_headless(game, args.main, args.tier, max_attempts=args.attempts,
+                          main_threshold=args.main_threshold, tier_threshold=args.tier_threshold,
+                          save_cache=save_cache, tracer=tracer, journal=journal)
+    print_report(report)
+    if journal is not None:
+        journal.close()
+        print(f"📒 已写入洗练记录 {journal.written} 条（{journal.batches} 批）: {args.journal}")
+    if args.trace_out:
+        write_chrome_trace(args.trace_out, [tracer])
+        print(f"💾 已导出 Chrome trace: {args.trace_out}")
+
+
+if __name__ == "__main__":
+    main()
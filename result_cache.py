@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+内容寻址结果缓存（OCR 文本 / LLM 判断）
+两级：
+1. 图像键 → OCR 文本：截图缩小一半、灰度量化到 8 级后取 blake2b。
+   轻微的像素噪声和编码抖动落在同一量化级内；数字哪怕只差一个字形也会得到不同的键
+   （64 位 pHash 对“+27 / +28”这种差别不敏感，会把错误的 OCR 文本当成命中，这里不用）。
+2. 文本键 → 判断结果：归一化后的 OCR 文本（简繁、全角、空白统一）+ 预期描述 + 模型名取 blake2b。
+每级都是内存 LRU（OrderedDict）在前、SQLite 在后：内存未命中时查磁盘，命中后放回内存；
+磁盘按总字节数设上限，超出时按最近使用时间淘汰到上限的 90%。
+每个条目记录当初计算它的耗时，命中时累加为“节省的时间”。
+
+    cache = ResultCache("ocr")
+    text = cache.get(key)
+    if text is None:
+        text = ocr(...)
+        cache.put(key, text, cost=elapsed)
+    print(cache.format_stats())
+
+查看：python result_cache.py stats
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+import mod_parser
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "result_cache.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    ns      TEXT,
+    key     TEXT,
+    value   TEXT,      -- JSON
+    bytes   INTEGER,
+    cost    REAL,      -- 计算该结果用的秒数
+    used    REAL,      -- 最近一次写入 / 命中的时间
+    PRIMARY KEY (ns, key)
+);
+CREATE INDEX IF NOT EXISTS idx_entries_used ON entries(ns, used);
+"""
+
+
+def image_key(image):
+    """
+    截图 → 键。缩小一半（INTER_AREA）并量化到 8 级灰度后哈希，尺寸也计入键。
+    :param image: PIL Image 或 numpy 数组（RGB / BGR / 灰度均可，只用亮度）
+    """
+    arr = np.asarray(image)
+    if arr.ndim == 3:
+        arr = arr[:, :, :3].max(axis=2)
+    small = cv2.resize(arr.astype(np.uint8), (max(1, arr.shape[1] // 2), max(1, arr.shape[0] // 2)),
+                       interpolation=cv2.INTER_AREA)
+    h = hashlib.blake2b(np.ascontiguousarray(small >> 5).tobytes(), digest_size=16)
+    h.update(f"{arr.shape[0]}x{arr.shape[1]}".encode())
+    return h.hexdigest()
+
+
+def normalize_text(text):
+    """简繁、全角统一，合并空白，去掉空行"""
+    lines = (" ".join(line.split()) for line in mod_parser.normalize(text or "").splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def text_key(text, description, model):
+    parts = (normalize_text(text), " ".join((description or "").split()), model or "")
+    return hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, namespace, db_path=DEFAULT_DB, memory_entries=256, max_bytes=16 * 1024 * 1024):
+        """
+        :param namespace: 命名空间（"ocr" / "verdict"），共用一个数据库文件
+        :param db_path: SQLite 文件，None 表示只用内存
+        :param memory_entries: 内存 LRU 条目数
+        :param max_bytes: 磁盘上该命名空间的总字节上限
+        """
+        self.namespace = namespace
+        self.db_path = db_path
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()     # key -> (value, cost)
+        self._lock = threading.Lock()
+        self._conn = None
+        self.disk_bytes = 0
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.saved = 0.0
+        self.evicted = 0
+        if db_path is not None:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.executescript(_SCHEMA)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            row = self._conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM entries WHERE ns=?",
+                                     (namespace,)).fetchone()
+            self.disk_bytes = row[0]
+
+    def get(self, key):
+        """:return: 缓存的值，未命中为 None"""
+        with self._lock:
+            hit = self._memory.get(key)
+            if hit is not None:
+                self._memory.move_to_end(key)
+                self.hits_memory += 1
+                self.saved += hit[1]
+                return hit[0]
+            if self._conn is not None:
+                row = self._conn.execute("SELECT value, cost FROM entries WHERE ns=? AND key=?",
+                                         (self.namespace, key)).fetchone()
+                if row is not None:
+                    value, cost = json.loads(row[0]), row[1]
+                    self._conn.execute("UPDATE entries SET used=? WHERE ns=? AND key=?",
+                                       (time.time(), self.namespace, key))
+                    self._conn.commit()
+                    self._remember(key, value, cost)
+                    self.hits_disk += 1
+                    self.saved += cost
+                    return value
+            self.misses += 1
+            return None
+
+    def put(self, key, value, cost=0.0):
+        """
+        :param value: 可 JSON 序列化的值（None 不缓存）
+        :param cost: 计算该值用的秒数，命中时计入节省时间
+        """
+        if value is None:
+            return
+        with self._lock:
+            self._remember(key, value, cost)
+            if self._conn is None:
+                return
+            blob = json.dumps(value, ensure_ascii=False)
+            size = len(blob.encode("utf-8")) + len(key)
+            old = self._conn.execute("SELECT bytes FROM entries WHERE ns=? AND key=?",
+                                     (self.namespace, key)).fetchone()
+            self._conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                               (self.namespace, key, blob, size, cost, time.time()))
+            self.disk_bytes += size - (old[0] if old else 0)
+            if self.disk_bytes > self.max_bytes:
+                self._evict(keep=key)
+            self._conn.commit()
+
+    def _remember(self, key, value, cost):
+        self._memory[key] = (value, cost)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self, keep=None):
+        """按最近使用时间删到上限的 90%；keep（put 刚写入的键）始终保留，即使它本身就超过上限"""
+        target = self.max_bytes * 0.9
+        rows = self._conn.execute("SELECT key, bytes FROM entries WHERE ns=? ORDER BY used",
+                                  (self.namespace,)).fetchall()
+        doomed = []
+        for key, size in rows:
+            if self.disk_bytes <= target:
+                break
+            if key == keep:
+                continue
+            doomed.append((self.namespace, key))
+            self.disk_bytes -= size
+        self._conn.executemany("DELETE FROM entries WHERE ns=? AND key=?", doomed)
+        self.evicted += len(doomed)
+
+    def stats(self):
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+            "saved_s": self.saved,
+            "memory_entries": len(self._memory),
+            "disk_bytes": self.disk_bytes,
+            "evicted": self.evicted,
+        }
+
+    def format_stats(self):
+        st = self.stats()
+        return (f"🗃️ {self.namespace} 缓存: 命中 {st['hits_memory'] + st['hits_disk']}"
+                f"（内存 {st['hits_memory']} / 磁盘 {st['hits_disk']}）未命中 {st['misses']}，"
+                f"命中率 {st['hit_rate']:.0%}，节省 {st['saved_s']:.1f}s，"
+                f"磁盘 {st['disk_bytes'] / 1024:.0f}KB")
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="结果缓存")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_stats = sub.add_parser("stats", help="各命名空间的条目数、字节数和累计计算耗时")
+    p_stats.add_argument("--db", default=DEFAULT_DB)
+    p_clear = sub.add_parser("clear", help="清空一个命名空间")
+    p_clear.add_argument("namespace")
+    p_clear.add_argument("--db", default=DEFAULT_DB)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    conn.executescript(_SCHEMA)
+    if args.cmd == "stats":
+        rows = conn.execute("SELECT ns, COUNT(*), SUM(bytes), SUM(cost) FROM entries GROUP BY ns").fetchall()
+        if not rows:
+            print("缓存为空")
+        for ns, count, size, cost in rows:
+            print(f"{ns}: {count} 条，{size / 1024:.1f}KB，每轮全部命中可省 {cost:.1f}s")
+    else:
+        n = conn.execute("DELETE FROM entries WHERE ns=?", (args.namespace,)).rowcount
+        conn.commit()
+        print(f"已删除 {n} 条")
+    conn.close()
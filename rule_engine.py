@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""
+预期属性规则（编译一次，本地判断）
+规则写法：
+    投射物技能等級 >= 3 或 (火抗 >= 30 且 生命 >= 80)
+    projectile skill level >= +3 OR (fire res >= 30 AND life >= 80)
+    NOT 移速 AND 最大能量護盾 > 100
+    總元素抗性 >= 80
+- 属性名：mod_parser.STATS 的 key（空格等同下划线）、ALIASES 中的简称，或任何能被 mod_parser 识别的词缀短语
+- 比较：>= ≥ 大於等於 至少、<= ≤ 小於等於 至多、> 大於、< 小於、== = 等於、!= ≠；数字可带 + 和 %
+- 逻辑：AND / && / 且 / 並且，OR / || / 或 / 或者，NOT / ! / 非，括号
+- 只写属性名表示“有这个词缀”
+属性值：一条记录有多个数值（如“附加 3 至 67 傷害”）时取平均，同一属性出现多次时相加；
+没有出现的属性按 0 比较。PSEUDO 中的合计属性由多条词缀折算。
+固定值与百分比分开：本身是固定值的属性（不在 PERCENT_STATS 中），百分比词缀（“增加 10% 最大生命”）
+记在 <key>_percent 下，规则里数字带 % 时比较它（“生命 >= 10%”），不带时只比较固定值（“生命 >= 80”）。
+
+    rule = compile_rule("火抗 >= 30 且 生命 >= 80")
+    rule.matches(mod_parser.parse(ocr_text))
+
+自检：python rule_engine.py check
+试算：python rule_engine.py eval "投射物技能等級 >= 3" output_raw.txt
+"""
+
+import operator
+import re
+import sys
+import time
+
+import mod_parser
+
+# 简称 → 词缀 key（查找前先经 mod_parser.normalize，简体写法也能命中）
+ALIASES = {
+    "life": "maximum_life", "mana": "maximum_mana", "es": "maximum_energy_shield",
+    "fire_res": "fire_resistance", "cold_res": "cold_resistance", "lightning_res": "lightning_resistance",
+    "chaos_res": "chaos_resistance", "ele_res": "total_elemental_resistance",
+    "str": "strength", "dex": "dexterity", "int": "intelligence",
+    "ms": "movement_speed", "aps": "attack_speed",
+    "projectile_level": "projectile_skill_level", "spell_level": "spell_skill_level",
+    "生命": "maximum_life", "魔力": "maximum_mana", "能量護盾": "maximum_energy_shield",
+    "力量": "strength", "敏捷": "dexterity", "智慧": "intelligence",
+    "火抗": "fire_resistance", "冰抗": "cold_resistance", "電抗": "lightning_resistance", "混抗": "chaos_resistance",
+    "總元素抗性": "total_elemental_resistance", "元素抗性": "total_elemental_resistance",
+    "攻速": "attack_speed", "施法速度": "cast_speed", "移速": "movement_speed",
+    "投射物技能等級": "projectile_skill_level", "法術技能等級": "spell_skill_level",
+    "近戰技能等級": "melee_skill_level", "技能等級": "all_skill_level",
+}
+
+# 合计属性：{key: ((词缀 key, 系数), ...)}
+PSEUDO = {
+    "total_elemental_resistance": (("fire_resistance", 1), ("cold_resistance", 1), ("lightning_resistance", 1),
+                                   ("all_elemental_resistance", 3)),
+    "total_attributes": (("strength", 1), ("dexterity", 1), ("intelligence", 1), ("all_attributes", 3)),
+}
+
+# 本身以百分比计的属性；其余属性的百分比词缀单独记为 <key>_percent（见 Rule.totals）。
+# 这些属性没有固定值的写法，OCR 漏掉 % 时仍按百分比计
+PERCENT_STATS = {
+    "increased_physical_damage", "increased_spell_damage", "increased_elemental_damage",
+    "fire_resistance", "cold_resistance", "lightning_resistance", "chaos_resistance", "all_elemental_resistance",
+    "maximum_fire_resistance", "maximum_cold_resistance", "maximum_lightning_resistance",
+    "maximum_chaos_resistance", "maximum_all_elemental_resistance",
+    "attack_speed", "cast_speed", "critical_chance", "critical_multiplier", "movement_speed",
+    "life_leech", "mana_leech",
+}
+
+_OPS = [
+    (">=", operator.ge), ("≥", operator.ge), ("大於等於", operator.ge), ("大于等于", operator.ge), ("至少", operator.ge),
+    ("<=", operator.le), ("≤", operator.le), ("小於等於", operator.le), ("小于等于", operator.le), ("至多", operator.le),
+    ("==", operator.eq), ("!=", operator.ne), ("≠", operator.ne), ("等於", operator.eq), ("等于", operator.eq),
+    (">", operator.gt), ("大於", operator.gt), ("大于", operator.gt),
+    ("<", operator.lt), ("小於", operator.lt), ("小于", operator.lt), ("=", operator.eq),
+]
+_OP_FUNCS = dict(_OPS)
+_KEYWORDS = {"and": "AND", "&&": "AND", "&": "AND", "且": "AND", "並且": "AND", "并且": "AND",
+             "or": "OR", "||": "OR", "|": "OR", "或": "OR", "或者": "OR",
+             "not": "NOT", "!": "NOT", "非": "NOT"}
+
+_TOKEN = re.compile("|".join([
+    r"(?P<ws>\s+)",
+    r"(?P<paren>[()（）])",
+    r"(?P<op>" + "|".join(re.escape(op) for op, _ in sorted(_OPS, key=lambda o: -len(o[0]))) + ")",
+    r"(?P<kw>&&|\|\||[&|!]|並且|并且|或者|[且或非]|\b(?:and|or|not)\b)",
+    r"(?P<num>[+-]?\d+(?:\.\d+)?%?)",
+    r"(?P<word>[A-Za-z_][A-Za-z_0-9]*|[㐀-鿿])",
+]), re.IGNORECASE)
+
+
+class RuleError(ValueError):
+    """规则无法编译（语法错误或未知属性），调用方可回退到 LLM 判断"""
+
+
+def tokenize(source):
+    """:return: [(类型, 文本, 位置)]，类型为 ( ) OP AND OR NOT NUM WORD"""
+    tokens, pos = [], 0
+    while pos < len(source):
+        m = _TOKEN.match(source, pos)
+        if m is None:
+            raise RuleError(f"无法识别的字符 {source[pos]!r}（位置 {pos}）")
+        kind, text = m.lastgroup, m.group()
+        if kind == "paren":
+            tokens.append(("(" if text in "(（" else ")", text, pos))
+        elif kind == "op":
+            tokens.append(("OP", text, pos))
+        elif kind == "kw":
+            tokens.append((_KEYWORDS[text.lower()], text, pos))
+        elif kind == "num":
+            tokens.append(("NUM", text, pos))
+        elif kind == "word":
+            tokens.append(("WORD", text, pos))
+        pos = m.end()
+    return tokens
+
+
+def resolve_stat(name):
+    """属性名 → 词缀 key；识别不了时抛 RuleError"""
+    key = re.sub(r"\s+", "_", mod_parser.normalize(name).strip()).lower()
+    if key in PSEUDO or key in _STAT_KEYS:
+        return key
+    if key in ALIASES:
+        return ALIASES[key]
+    stat = mod_parser.DEFAULT_PARSER.parse_line(mod_parser.normalize(name))["stat"]
+    if stat is None:
+        raise RuleError(f"未知属性 {name!r}")
+    return stat
+
+
+_STAT_KEYS = {key for key, _ in mod_parser.STATS}
+
+
+class _Parser:
+    """递归下降：or → and → not → atom，每个节点直接编译成闭包 f(totals) -> bool"""
+
+    def __init__(self, source):
+        self.source = source
+        self.tokens = tokenize(source)
+        self.i = 0
+        self.stats = set()
+
+    def peek(self):
+        return self.tokens[self.i][0] if self.i < len(self.tokens) else None
+
+    def take(self, kind):
+        if self.peek() != kind:
+            where = self.tokens[self.i][2] if self.i < len(self.tokens) else len(self.source)
+            raise RuleError(f"位置 {where} 处应为 {kind}")
+        self.i += 1
+        return self.tokens[self.i - 1]
+
+    def parse(self):
+        if not self.tokens:
+            raise RuleError("规则为空")
+        pred = self.parse_or()
+        if self.i != len(self.tokens):
+            raise RuleError(f"位置 {self.tokens[self.i][2]} 处有多余内容 {self.tokens[self.i][1]!r}")
+        return pred
+
+    def parse_or(self):
+        parts = [self.parse_and()]
+        while self.peek() == "OR":
+            self.i += 1
+            parts.append(self.parse_and())
+        return parts[0] if len(parts) == 1 else (lambda t, ps=tuple(parts): any(p(t) for p in ps))
+
+    def parse_and(self):
+        parts = [self.parse_not()]
+        while self.peek() == "AND":
+            self.i += 1
+            parts.append(self.parse_not())
+        return parts[0] if len(parts) == 1 else (lambda t, ps=tuple(parts): all(p(t) for p in ps))
+
+    def parse_not(self):
+        if self.peek() == "NOT":
+            self.i += 1
+            inner = self.parse_not()
+            return lambda t: not inner(t)
+        return self.parse_atom()
+
+    def parse_atom(self):
+        if self.peek() == "(":
+            self.i += 1
+            pred = self.parse_or()
+            self.take(")")
+            return pred
+        words = []
+        while self.peek() == "WORD":
+            words.append(self.tokens[self.i][1])
+            self.i += 1
+        if not words:
+            self.take("WORD")
+        # 英文单词之间用空格连接，汉字直接拼接
+        name = ""
+        for w in words:
+            name += (" " if name and (w[0].isascii() or name[-1].isascii()) else "") + w
+        key = resolve_stat(name)
+        self.stats.add(key)
+        if self.peek() != "OP":
+            return lambda t: t.get(key, 0) != 0
+        op = _OP_FUNCS[self.take("OP")[1]]
+        number = self.take("NUM")[1]
+        if number.endswith("%") and key in _STAT_KEYS and key not in PERCENT_STATS:
+            key = f"{key}_percent"
+        number = float(number.rstrip("%"))
+        return lambda t: op(t.get(key, 0), number)
+
+
+class Rule:
+    def __init__(self, source):
+        """:raises RuleError: 语法错误或未知属性"""
+        self.source = source
+        parser = _Parser(source)
+        self.predicate = parser.parse()
+        self.stats = parser.stats
+
+    @staticmethod
+    def totals(records):
+        """
+        记录 → {词缀 key: 数值}（多个数值取平均，同一属性相加，并计算合计属性）；
+        固定值属性的百分比词缀记在 <key>_percent 下，不与固定值相加
+        """
+        totals = {}
+        for rec in records:
+            stat, values = rec["stat"], rec["values"]
+            if stat is None or not values:
+                continue
+            if rec["percent"] and stat not in PERCENT_STATS:
+                stat = f"{stat}_percent"
+            totals[stat] = totals.get(stat, 0) + sum(values) / len(values)
+        for key, parts in PSEUDO.items():
+            value = sum(totals.get(stat, 0) * k for stat, k in parts)
+            if value:
+                totals[key] = value
+        return totals
+
+    def matches(self, records):
+        return self.predicate(self.totals(records))
+
+    def __repr__(self):
+        return f"Rule({self.source!r})"
+
+
+_COMPILED = {}
+
+
+def compile_rule(source):
+    """编译并缓存；编译失败的规则也缓存其错误，避免每次重复解析"""
+    source = source.strip()
+    hit = _COMPILED.get(source)
+    if hit is None:
+        try:
+            hit = Rule(source)
+        except RuleError as e:
+            hit = e
+        _COMPILED[source] = hit
+    if isinstance(hit, RuleError):
+        raise hit
+    return hit
+
+
+# ==================== 内置自检 ====================
+_TOOLTIP = mod_parser.CORPUS[0][0]     # 闪电附加 3~67、物理附加 1~3、+27 力量
+_TOOLTIP_RES = "後綴 +38% 火焰抗性 2\n後綴 +45% 冰冷抗性 1\n前綴 +92 最大生命 3\n前綴 +3 所有投射物技能石等級"
+_TOOLTIP_LIFE = "前綴 +75 最大生命 3\n前綴 增加 10% 最大生命 2"
+
+# (规则, 装备文本, 期望结果)
+CASES = [
+    ("projectile skill level >= +3 OR (fire res >= 30 AND life >= 80)", _TOOLTIP_RES, True),
+    ("投射物技能等級 >= 3", _TOOLTIP_RES, True),
+    ("投射物技能等级 ≥ 4", _TOOLTIP_RES, False),
+    ("火抗 >= 30 且 生命 >= 100", _TOOLTIP_RES, False),
+    ("(火抗 >= 30 且 生命 >= 80) 或 移速", _TOOLTIP_RES, True),
+    ("總元素抗性 >= 80", _TOOLTIP_RES, True),
+    ("NOT 混抗 AND 冰冷抗性 > 40%", _TOOLTIP_RES, True),
+    ("str >= 25", _TOOLTIP, True),
+    ("力量 至少 28", _TOOLTIP, False),
+    ("added lightning attack >= 35", _TOOLTIP, True),
+    ("攻擊附加閃電傷害 且 點力量", _TOOLTIP, True),
+    ("not 生命", _TOOLTIP, True),
+    # 同一属性的固定值和百分比词缀不相加
+    ("生命 >= 80", _TOOLTIP_LIFE, False),
+    ("生命 >= 75 且 生命 >= 10%", _TOOLTIP_LIFE, True),
+    ("生命 >= 12%", _TOOLTIP_LIFE, False),
+    ("力量 >= 25", "+20 點力量\n增加 8% 點力量", False),
+    # 抗性上限不算作抗性
+    ("火抗 >= 30", "+3% 火焰抗性上限\n+28% 火焰抗性", False),
+    ("火焰抗性上限 >= 3 且 火抗 >= 28", "+3% 火焰抗性上限\n+28% 火焰抗性", True),
+]
+BAD_RULES = ["", "火抗 >=", "(火抗 >= 30", "火抗 >= 30 30", "完全不存在的屬性 >= 3", "我想要所有元素抗性大于等于8，并且有法术伤害词缀"]
+
+
+def self_check(verbose=True):
+    failures = 0
+    for source, text, expected in CASES:
+        try:
+            got = compile_rule(source).matches(mod_parser.parse(text))
+        except RuleError as e:
+            got = f"RuleError: {e}"
+        if got != expected:
+            failures += 1
+            if verbose:
+                print(f"❌ {source!r}: {got} ≠ {expected}")
+    for source in BAD_RULES:
+        try:
+            compile_rule(source)
+        except RuleError:
+            continue
+        failures += 1
+        if verbose:
+            print(f"❌ 应编译失败: {source!r}")
+    if verbose:
+        print(f"{'✅' if not failures else '⚠️'} 规则 {len(CASES) + len(BAD_RULES)} 条，失败 {failures} 条")
+    return failures
+
+
+def bench(rounds=5000):
+    """:return: (解析 + 判断 微秒, 仅判断 微秒)"""
+    rule = compile_rule(CASES[0][0])
+    t0 = time.perf_counter_ns()
+    for _ in range(rounds):
+        rule.matches(mod_parser.parse(_TOOLTIP_RES))
+    full = (time.perf_counter_ns() - t0) / rounds / 1000
+    records = mod_parser.parse(_TOOLTIP_RES)
+    t0 = time.perf_counter_ns()
+    for _ in range(rounds):
+        rule.matches(records)
+    return full, (time.perf_counter_ns() - t0) / rounds / 1000
+
+
+def main():
+    import argparse
+
+    ap = argparse.ArgumentParser(description="预期属性规则")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p_eval = sub.add_parser("eval", help="用规则判断 OCR 文本文件")
+    p_eval.add_argument("rule")
+    p_eval.add_argument("file")
+    sub.add_parser("check", help="内置自检 + 判断耗时")
+    args = ap.parse_args()
+
+    if args.cmd == "eval":
+        try:
+            rule = compile_rule(args.rule)
+        except RuleError as e:
+            print(f"❌ 规则无法编译: {e}")
+            sys.exit(2)
+        with open(args.file, encoding="utf-8") as f:
+            records = mod_parser.parse(f.read())
+        print(f"属性: {Rule.totals(records)}")
+        print(f"{'✅ 满足' if rule.matches(records) else '❌ 不满足'}")
+    else:
+        failures = self_check()
+        full, judge = bench()
+        print(f"⏱️ 解析 + 判断 {full:.1f}us，仅判断 {judge:.1f}us")
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+周期任务堆调度器
+每个任务有自己的周期和允许的抖动（tolerance）：第 k 次执行应落在 [due_k, due_k + tolerance] 内。
+调度器取所有任务中最早的 due + tolerance 作为最晚唤醒时间 D，实际睡到 D 之前最后一个 due，
+醒来后把 due 已到的任务一起执行——窗口重叠的任务合并到同一次唤醒，唤醒次数最少，
+而只有一个任务时仍准点执行。
+due 按绝对时间推进（due += period），执行早晚不会累积成周期漂移；落后超过一个周期时跳到最近的未来 due。
+任务数很少（十个以内），合并时直接扫描全部任务。
+
+    sched = Scheduler(DeadlineTimer("monitor"))
+    sched.add("sample:hp", 0.1, sample_hp)
+    sched.add("timer:hp", 5.0, drink_hp, tolerance=0.05)
+    while running:
+        sched.run_once()
+    print(sched.format_stats())
+
+演示（HP / MP 不同采样率 + 定时药 + 界面刷新，对比唤醒次数）：
+    python scheduler.py --seconds 5
+"""
+
+import heapq
+import itertools
+
+import numpy as np
+
+from deadline_timer import DeadlineTimer, now_ns
+from latency_trace import NULL_TRACER
+
+
+class Job:
+    def __init__(self, name, period, callback, tolerance, due_ns):
+        self.name = name
+        self.callback = callback
+        self.period_ns = int(period * 1e9)
+        self.tolerance_ns = int(tolerance * 1e9)
+        self.due_ns = due_ns
+        self.version = 0          # 重新排期后旧的堆条目作废
+        self.runs = 0
+        self.missed = 0
+        self.last_run_ns = None
+        self.intervals_ns = []    # 相邻两次执行的实际间隔
+        self.late_max_ns = 0
+
+    @property
+    def deadline_ns(self):
+        return self.due_ns + self.tolerance_ns
+
+    def stats(self):
+        """{requested_ms, achieved_ms, jitter_ms, late_max_ms, runs, missed}"""
+        iv = np.asarray(self.intervals_ns[-10000:], dtype=np.float64) / 1e6
+        return {
+            "requested_ms": self.period_ns / 1e6,
+            "achieved_ms": float(iv.mean()) if len(iv) else 0.0,
+            "jitter_ms": float(iv.std()) if len(iv) else 0.0,
+            "late_max_ms": self.late_max_ns / 1e6,
+            "runs": self.runs,
+            "missed": self.missed,
+        }
+
+
+class Scheduler:
+    def __init__(self, timer=None, tracer=None):
+        """
+        :param timer: deadline_timer.DeadlineTimer，负责睡眠 + 自旋
+        :param tracer: latency_trace.SpanTracer，每个任务记一个同名阶段
+        """
+        self.timer = DeadlineTimer("scheduler") if timer is None else timer
+        self.tracer = NULL_TRACER if tracer is None else tracer
+        self.jobs = {}
+        self._heap = []           # (deadline_ns, 序号, version, job)
+        self._seq = itertools.count()
+        self.wakeups = 0
+        self.runs = 0
+
+    def _push(self, job):
+        job.version += 1
+        heapq.heappush(self._heap, (job.deadline_ns, next(self._seq), job.version, job))
+
+    def add(self, name, period, callback, tolerance=None, run_now=False):
+        """
+        :param tolerance: 允许的迟到秒数，默认周期的 10%
+        :param run_now: True 时第一次立即执行，否则一个周期后
+        """
+        if name in self.jobs:
+            self.remove(name)
+        tolerance = period * 0.1 if tolerance is None else tolerance
+        now = now_ns()
+        job = Job(name, period, callback, tolerance, now if run_now else now + int(period * 1e9))
+        self.jobs[name] = job
+        self._push(job)
+        return job
+
+    def remove(self, name):
+        job = self.jobs.pop(name, None)
+        if job is not None:
+            job.version += 1
+
+    def set_period(self, name, period, tolerance=None):
+        """
+        从上一次 due 重新计算下一次 due；周期缩短后已过期的任务在下一次唤醒时立即执行。
+        周期改变后实际间隔重新统计，使“实际 vs 请求”对应当前周期。
+        """
+        job = self.jobs[name]
+        period_ns = int(period * 1e9)
+        tolerance_ns = int((period * 0.1 if tolerance is None else tolerance) * 1e9)
+        if period_ns == job.period_ns and tolerance_ns == job.tolerance_ns:
+            return
+        if period_ns != job.period_ns:
+            job.due_ns += period_ns - job.period_ns
+            job.period_ns = period_ns
+            job.intervals_ns = []
+            job.last_run_ns = None
+        job.tolerance_ns = tolerance_ns
+        self._push(job)
+
+    def next_wakeup_ns(self):
+        """最早截止时间之前最后一个 due；没有任务时返回 None"""
+        heap = self._heap
+        while heap and (heap[0][3].version != heap[0][2] or heap[0][3].name not in self.jobs):
+            heapq.heappop(heap)
+        if not heap:
+            return None
+        deadline = heap[0][0]
+        return max(job.due_ns for job in self.jobs.values() if job.due_ns <= deadline)
+
+    def run_once(self, cancel=None):
+        """
+        睡到下一次唤醒并执行所有 due 已到的任务。
+        :param cancel: threading.Event，置位时立即返回
+        :return: 本次执行的任务名列表（被取消时为 None）
+        """
+        wake = self.next_wakeup_ns()
+        if wake is None:
+            return []
+        if self.timer.wait_until(wake, cancel):
+            return None
+        now = now_ns()
+        self.wakeups += 1
+        due = sorted((job for job in self.jobs.values() if job.due_ns <= now), key=lambda j: j.due_ns)
+        for job in due:
+            self._run(job, now)
+        return [job.name for job in due]
+
+    def _run(self, job, now):
+        job.late_max_ns = max(job.late_max_ns, now - job.due_ns)
+        if job.last_run_ns is not None:
+            job.intervals_ns.append(now - job.last_run_ns)
+        job.last_run_ns = now
+        job.runs += 1
+        self.runs += 1
+        t0 = self.tracer.now()
+        try:
+            job.callback()
+        finally:
+            self.tracer.lap(job.name, t0)
+            # 回调里可能已删除或重新排期了自己
+            if self.jobs.get(job.name) is job:
+                job.due_ns += job.period_ns
+                behind = now_ns() - job.due_ns
+                if behind > job.period_ns:
+                    skipped = behind // job.period_ns
+                    job.due_ns += skipped * job.period_ns
+                    job.missed += int(skipped)
+                self._push(job)
+
+    def stats(self):
+        return {name: job.stats() for name, job in self.jobs.items()}
+
+    def format_lines(self):
+        """汇总一行 + 每个任务一行"""
+        merged = 1 - self.wakeups / self.runs if self.runs else 0.0
+        lines = [f"📅 调度: 唤醒 {self.wakeups} 次 / 执行 {self.runs} 次（合并 {merged:.0%}）"]
+        for name, st in self.stats().items():
+            text = (f"📅 {name} 请求 {st['requested_ms']:.1f}ms 实际 {st['achieved_ms']:.1f}ms"
+                    f"±{st['jitter_ms']:.2f} 最大迟到 {st['late_max_ms']:.2f}ms")
+            if st["missed"]:
+                text += f" 跳过 {st['missed']}"
+            lines.append(text)
+        return lines
+
+    def format_stats(self):
+        return "\n".join(self.format_lines())
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="周期任务调度演示：请求周期 vs 实际周期、唤醒合并")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    demo = [("sample:hp", 0.05, None), ("sample:mp", 0.2, None), ("timer:hp", 0.7, 0.05),
+            ("timer:mp", 1.3, 0.05), ("publish", 0.1, 0.05)]
+    sched = Scheduler(DeadlineTimer("demo"))
+    for name, period, tol in demo:
+        sched.add(name, period, lambda: None, tolerance=tol)
+    end = now_ns() + int(args.seconds * 1e9)
+    while now_ns() < end:
+        sched.run_once()
+    print(sched.format_stats())
+    print(sched.timer.format_stats())
+    naive = sum(int(args.seconds / period) for _, period, _ in demo)
+    print(f"各任务各自唤醒约需 {naive} 次，合并后 {sched.wakeups} 次")
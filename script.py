@@ -14,10 +14,21 @@ import time
 import logging
 import sys
 import os
-import base64
-import io
+import numpy as np
 from PIL import ImageGrab
 
+from deadline_timer import DeadlineTimer, now_ns
+import combined_judge
+import dashscope_client
+import glyph_ocr
+import judge_prompt
+import llm_verdict
+import mod_parser
+import ocr_payload
+import prefilter
+import result_cache
+import rule_engine
+
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -35,6 +46,8 @@ except ImportError as e:
 pyautogui.FAILSAFE = True
 # 设置默认的暂停时间，使操作更稳定
 pyautogui.PAUSE = 0.1
+# 操作间等待：粗睡眠 + 自旋到绝对截止时间
+ACTION_TIMER = DeadlineTimer("script")
 # ----------------------
 
 # ====================== API KEY 设置位置 ======================
@@ -50,36 +63,208 @@ dashscope.api_key = "" # <-- 示例，请替换
 # Linux/macOS: export DASHSCOPE_API_KEY=your_actual_key_here
 # =============================================================
 
+# ====================== API 客户端 ======================
+# "sdk": dashscope SDK 同步调用；"pooled": dashscope_client.py 连接池客户端（长连接、截止时间、对冲重试）
+DASHSCOPE_CLIENT = "sdk"
+# None 表示官方地址；离线压测时指向本地替身服务，如 "http://127.0.0.1:8765/api/v1"（见 mock_dashscope.py）
+DASHSCOPE_BASE_URL = None
+DASHSCOPE_TIMEOUT = 15.0  # 每次调用的截止时间（秒，仅 pooled）
+_client = {"pooled": None}
+# =====================================================
+
+# ====================== OCR 引擎 ======================
+# "dashscope": 远程 qwen-vl OCR
+# "glyph": 本地字形模板 OCR（glyph_ocr.py，需先收集字形库），识别不出文字时回退远程
+OCR_ENGINE = "dashscope"
+GLYPH_BANK_PATH = "glyph_bank.npz"
+# 远程 OCR 成功后用其结果收集字形，逐步积累本地字形库
+GLYPH_HARVEST = False
+# 远程 OCR 上传格式（见 ocr_payload.py）："png" 为原始彩色截图；"binary" 裁到文字行的白底黑字 1 位 PNG（最小）；
+# "gray" / "jpeg" 等为折中。模型端准确率未实测前保持 "png"；
+# 换格式前用 `python ocr_payload.py bench --pairs 录制目录 --url 实际地址` 比较各格式的 OCR 准确率
+OCR_PAYLOAD = "png"
+_glyph = {"ocr": None, "bank": None}
+# =====================================================
+
+# ====================== 属性判断 ======================
+# 预期描述能按 rule_engine.py 的规则语言编译时本地判断（微秒级），否则调用 LLM
+# False 时无法编译的预期描述直接判定为不满足
+RULE_LLM_FALLBACK = True
+# LLM 判断用流式调用：逐 token 读取，一看出“满足 / 不满足”就断开（见 llm_verdict.py）
+LLM_STREAM = True
+# 预期描述不是规则时，截图和预期一起发给多模态模型，一次往返同时拿回判断和文字（见 combined_judge.py）；
+# False 时先 OCR 再用文本模型判断（两次往返）。回复无法解析时回退两次往返
+COMBINED_JUDGE = False
+# LLM 判断提示词：True 为固定的系统提示词 + 解析后的词缀（输入 token 约少一半），False 为原来的长提示词 + 原始 OCR 文本。
+# 精简提示词与真实模型的判断一致率未实测前保持 False；先用 `python judge_prompt.py bench --url 实际地址` 比较
+LLM_COMPACT_PROMPT = False
+COMBINED_JUDGE_MODEL = 'qwen-vl-plus'
+# =====================================================
+
+# ====================== 结果缓存 ======================
+# 相同截图复用 OCR 文本，相同（文本, 预期, 模型）复用 LLM 判断；内存 LRU + SQLite（见 result_cache.py）
+RESULT_CACHE_ENABLED = True
+RESULT_CACHE_PATH = result_cache.DEFAULT_DB
+RESULT_CACHE_MAX_BYTES = 16 * 1024 * 1024
+_caches = {}
+# =====================================================
+
+# ====================== 本地预筛 ======================
+# 远程 OCR 之前先在本地排除明显不满足的结果（见 prefilter.py）：
+# 给了目标词缀截图模板时一个都没匹配上即排除；预期是规则时，面板上的词缀行都见过且不满足规则即排除
+PREFILTER_ENABLED = True
+PREFILTER_TEMPLATES = []          # 目标词缀截图路径，如 ["tpl_projectile.png"]（任一匹配即可）
+PREFILTER_THRESHOLD = 0.8
+PREFILTER_AUDIT_RATE = 0.05       # 被排除的结果按此比例照样提交远程，检查是否误排除
+_prefilter = {"obj": None, "desc": None}
+# =====================================================
+
 # ====================== 辅助函数 ======================
-def image_to_base64(image):
-    """将 PIL Image 对象转换为 Base64 编码字符串"""
-    buffered = io.BytesIO()
-    image.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
-    return img_str
-
-def extract_text_from_region(region):
+def glyph_ocr_text(screenshot):
+    """本地字形 OCR；字形库不存在或识别失败时返回 None"""
+    try:
+        if _glyph["ocr"] is None:
+            _glyph["ocr"] = glyph_ocr.GlyphOCR.from_file(GLYPH_BANK_PATH)
+        t0 = time.perf_counter()
+        text = _glyph["ocr"].recognize(np.asarray(screenshot.convert("RGB")))
+        logging.info(f"本地字形 OCR 完成，用时 {(time.perf_counter() - t0) * 1000:.1f}ms")
+        return text or None
+    except Exception as e:
+        logging.warning(f"本地字形 OCR 失败: {e}")
+        return None
+
+
+def harvest_glyphs(screenshot, text):
+    """用远程 OCR 结果收集字形并保存字形库"""
+    try:
+        if _glyph["bank"] is None:
+            _glyph["bank"] = glyph_ocr.GlyphBank.load(GLYPH_BANK_PATH)
+        n = glyph_ocr.harvest(_glyph["bank"], np.asarray(screenshot.convert("RGB")), text)
+        if n:
+            _glyph["bank"].save(GLYPH_BANK_PATH)
+            _glyph["ocr"] = None
+            logging.info(f"字形库新增 {n} 个样本（共 {len(_glyph['bank'])} 个字符）")
+    except Exception as e:
+        logging.warning(f"收集字形失败: {e}")
+
+
+def get_pooled_client():
+    if _client["pooled"] is None:
+        _client["pooled"] = dashscope_client.PooledClient(
+            api_key=dashscope.api_key or None, base_url=DASHSCOPE_BASE_URL, timeout=DASHSCOPE_TIMEOUT)
+    return _client["pooled"]
+
+
+def call_multimodal(model, messages):
+    """按 DASHSCOPE_CLIENT 选择客户端；两者的响应字段相同"""
+    if DASHSCOPE_CLIENT == "pooled":
+        return get_pooled_client().multimodal(model, messages)
+    return MultiModalConversation.call(model=model, messages=messages)
+
+
+def call_generation(model, prompt, **parameters):
+    if DASHSCOPE_CLIENT == "pooled":
+        return get_pooled_client().generation(model, prompt, **parameters)
+    return Generation.call(model=model, prompt=prompt, **parameters)
+
+
+def call_generation_stream(model, prompt, **parameters):
+    """流式文本生成，逐个返回增量响应（output.text 为新增部分）"""
+    if DASHSCOPE_CLIENT == "pooled":
+        return get_pooled_client().generation_stream(model, prompt, **parameters)
+    return Generation.call(model=model, prompt=prompt, stream=True, incremental_output=True, **parameters)
+
+
+def get_cache(namespace):
+    """按需打开结果缓存；关闭或打开失败时返回 None"""
+    if not RESULT_CACHE_ENABLED:
+        return None
+    if namespace not in _caches:
+        try:
+            _caches[namespace] = result_cache.ResultCache(namespace, RESULT_CACHE_PATH,
+                                                          max_bytes=RESULT_CACHE_MAX_BYTES)
+        except Exception as e:
+            logging.warning(f"打开结果缓存失败: {e}")
+            _caches[namespace] = None
+    return _caches[namespace]
+
+
+def log_cache_stats():
+    for cache in _caches.values():
+        if cache is not None:
+            logging.info(cache.format_stats())
+
+
+def get_prefilter(expected_description):
+    """按需创建本地预筛；关闭或既无模板又不是规则时返回 None"""
+    if not PREFILTER_ENABLED or not expected_description:
+        return None
+    if _prefilter["desc"] != expected_description:
+        try:
+            rule = rule_engine.compile_rule(expected_description)
+        except rule_engine.RuleError:
+            rule = None
+        try:
+            pf = prefilter.Prefilter.from_paths(PREFILTER_TEMPLATES, threshold=PREFILTER_THRESHOLD,
+                                                rule=rule, audit_rate=PREFILTER_AUDIT_RATE)
+        except Exception as e:
+            logging.warning(f"加载本地预筛失败: {e}")
+            pf = None
+        _prefilter["obj"] = pf if pf is not None and pf.enabled else None
+        _prefilter["desc"] = expected_description
+    return _prefilter["obj"]
+
+
+def log_prefilter_stats():
+    if _prefilter["obj"] is not None:
+        for line in _prefilter["obj"].format_lines():
+            logging.info(line)
+
+
+def extract_text_from_region(region, screenshot=None):
     """
-    使用 DashScope MultiModalConversation API 对指定区域进行 OCR。
+    对指定区域进行 OCR：OCR_ENGINE 为 "glyph" 时先用本地字形 OCR，否则（或本地失败时）
+    使用 DashScope MultiModalConversation API。
     :param region: tuple (left, top, width, height) 定义要截取的屏幕区域
+    :param screenshot: 已截取的该区域截图（如本地预筛用过的），None 时重新截取
     :return: string 提取出的文字，如果失败则返回 None
     """
     left, top, width, height = region
     try:
         # 1. 截取屏幕指定区域
-        screenshot = ImageGrab.grab(bbox=(left, top, left + width, top + height))
-        logging.debug(f"已截取区域: {region}")
-
-        # 2. 转换为 Base64
-        img_base64 = image_to_base64(screenshot)
-        logging.debug("图像已转换为 Base64")
+        if screenshot is None:
+            screenshot = ImageGrab.grab(bbox=(left, top, left + width, top + height))
+            logging.debug(f"已截取区域: {region}")
+
+        cache = get_cache("ocr")
+        key = result_cache.image_key(screenshot) if cache is not None else None
+        if cache is not None:
+            text = cache.get(key)
+            if text is not None:
+                logging.info("OCR 缓存命中（截图与之前相同）")
+                return text
+        t0 = time.perf_counter()
+
+        if OCR_ENGINE == "glyph":
+            text = glyph_ocr_text(screenshot)
+            if text:
+                logging.debug(f"OCR 结果: \n{text}")
+                if cache is not None:
+                    cache.put(key, text, cost=time.perf_counter() - t0)
+                return text
+            logging.warning("本地字形 OCR 未识别出文字，改用 DashScope OCR")
+
+        # 2. 裁剪、压缩并转换为 Base64 data URI
+        image_uri, payload = ocr_payload.data_uri(screenshot, OCR_PAYLOAD)
+        logging.info(f"OCR 上传 {OCR_PAYLOAD}: {payload['width']}x{payload['height']}，"
+                     f"{payload['b64_bytes'] / 1024:.1f}KB（编码 {payload['encode_ms']:.1f}ms）")
 
         # 3. 构造 DashScope 请求消息
         messages = [
             {
                 "role": "user",
                 "content": [
-                    {"image": f"data:image/png;base64,{img_base64}"},
+                    {"image": image_uri},
                     {"text": "请精确识别图片中的所有中文和英文文字，包括数字和符号。只输出识别出的文字内容，不要添加任何额外的说明或格式。"}
                 ]
             }
@@ -88,22 +273,20 @@ def extract_text_from_region(region):
         # 4. 调用 DashScope OCR API (使用 qwen-vl-plus 或 qwen-vl-max 通常精度更高)
         ocr_model = 'qwen-vl-plus' # 可根据需要更换为 'qwen-vl-max'
         logging.info(f"正在调用 DashScope OCR API ({ocr_model})...")
-        response = MultiModalConversation.call(model=ocr_model, messages=messages)
+        t_call = time.perf_counter()
+        response = call_multimodal(ocr_model, messages)
+        logging.info(f"OCR 调用用时 {(time.perf_counter() - t_call) * 1000:.0f}ms")
 
         # 5. 解析响应
         if response.status_code == 200:
-            text_content = response.output.choices[0]['message']['content']
-            # 如果返回的是列表（包含多个部分），则提取文本部分
-            if isinstance(text_content, list):
-                extracted_text = ""
-                for item in text_content:
-                    if item.get('text'):
-                        extracted_text += item['text'] + "\n"
-            else:
-                extracted_text = text_content
+            extracted_text = combined_judge.reply_text(response)
 
             logging.info("OCR 识别成功")
             logging.debug(f"OCR 结果: \n{extracted_text}")
+            if cache is not None and extracted_text.strip():
+                cache.put(key, extracted_text, cost=time.perf_counter() - t0)
+            if GLYPH_HARVEST:
+                harvest_glyphs(screenshot, extracted_text)
             return extracted_text
         else:
             logging.error(f"OCR API 调用失败: 状态码 {response.status_code}, 错误代码 {getattr(response, 'code', 'N/A')}, 信息: {getattr(response, 'message', 'N/A')}")
@@ -113,13 +296,108 @@ def extract_text_from_region(region):
         logging.error(f"OCR 过程中发生错误: {e}", exc_info=True)
         return None
 
+def use_combined_judge(expected_description):
+    """预期描述要交给 LLM（不是规则）且开启 COMBINED_JUDGE 时走图文一次判断"""
+    if not COMBINED_JUDGE or not expected_description or not RULE_LLM_FALLBACK:
+        return False
+    try:
+        rule_engine.compile_rule(expected_description)
+        return False
+    except rule_engine.RuleError:
+        return True
+
+
+def extract_and_judge(region, expected_description, screenshot=None):
+    """
+    图文一次判断：截图和预期描述一次发给多模态模型。
+    OCR 缓存命中或回复中没有判断时，判断结果返回 None，由调用方用 check_expected_stats 补上。
+    :return: (文字或 None, True / False / None)
+    """
+    left, top, width, height = region
+    try:
+        if screenshot is None:
+            screenshot = ImageGrab.grab(bbox=(left, top, left + width, top + height))
+        cache = get_cache("ocr")
+        key = result_cache.image_key(screenshot) if cache is not None else None
+        if cache is not None:
+            text = cache.get(key)
+            if text is not None:
+                logging.info("OCR 缓存命中（截图与之前相同），单独判断")
+                return text, None
+
+        image_uri, payload = ocr_payload.data_uri(screenshot, OCR_PAYLOAD)
+        logging.info(f"正在调用 DashScope 图文一次判断 ({COMBINED_JUDGE_MODEL})，上传 {OCR_PAYLOAD} "
+                     f"{payload['b64_bytes'] / 1024:.1f}KB...")
+        t0 = time.perf_counter()
+        response = call_multimodal(COMBINED_JUDGE_MODEL, combined_judge.build_messages(image_uri, expected_description))
+        elapsed = time.perf_counter() - t0
+        if response.status_code != 200:
+            logging.error(f"图文一次判断 API 调用失败: 状态码 {response.status_code}, 错误代码 {getattr(response, 'code', 'N/A')}, 信息: {getattr(response, 'message', 'N/A')}")
+            return None, None
+        verdict, text = combined_judge.parse_reply(combined_judge.reply_text(response))
+        logging.info(f"图文一次判断: {'无法解析' if verdict is None else ('满足' if verdict else '不满足')}，"
+                     f"用时 {elapsed * 1000:.0f}ms")
+        logging.debug(f"OCR 结果: \n{text}")
+        if cache is not None and text.strip():
+            cache.put(key, text, cost=elapsed)
+        if verdict is None:
+            logging.warning("图文一次判断的回复中没有判断结果，改用文本模型判断。")
+        return text or None, verdict
+    except Exception as e:
+        logging.error(f"图文一次判断时发生错误: {e}", exc_info=True)
+        return None, None
+
+
+def check_expected_stats(stats_text, expected_description, llm_model='qwen-turbo'):
+    """
+    判断 OCR 文本是否满足预期：预期描述是规则（见 rule_engine.py）时解析词缀后本地判断，
+    否则（RULE_LLM_FALLBACK 为 True 时）交给 check_expected_stats_with_llm。
+    :return: boolean, True 表示符合预期
+    """
+    if not expected_description:
+        logging.warning("检查属性时，预期描述为空。")
+        return True
+    try:
+        rule = rule_engine.compile_rule(expected_description)
+    except rule_engine.RuleError as e:
+        if not RULE_LLM_FALLBACK:
+            logging.error(f"预期描述无法编译为规则: {e}，判定为不满足。")
+            return False
+        logging.info(f"预期描述不是规则（{e}），改用 LLM 判断。")
+        cache = get_cache("verdict")
+        if cache is None:
+            return bool(check_expected_stats_with_llm(stats_text, expected_description, llm_model=llm_model))
+        # 两种提示词的判断分开缓存
+        key = result_cache.text_key(stats_text, expected_description,
+                                    f"{llm_model}|compact" if LLM_COMPACT_PROMPT else llm_model)
+        verdict = cache.get(key)
+        if verdict is not None:
+            logging.info(f"判断缓存命中: {'满足' if verdict else '不满足'}")
+            return verdict
+        t0 = time.perf_counter()
+        verdict = check_expected_stats_with_llm(stats_text, expected_description, llm_model=llm_model)
+        # 出错（None）不缓存，下次重新判断
+        cache.put(key, verdict, cost=time.perf_counter() - t0)
+        return bool(verdict)
+
+    if not stats_text:
+        logging.warning("检查属性时，输入的 OCR 文本为空。")
+        return False
+    t0 = time.perf_counter()
+    records = mod_parser.parse(stats_text)
+    is_match = rule.matches(records)
+    logging.info(f"规则判断: {'满足' if is_match else '不满足'}，用时 {(time.perf_counter() - t0) * 1e6:.0f}us")
+    logging.debug(f"词缀数值: {rule_engine.Rule.totals(records)}")
+    return is_match
+
+
 def check_expected_stats_with_llm(stats_text, expected_description, llm_model='qwen-turbo'):
     """
     使用 DashScope 文本模型判断 OCR 识别出的属性是否符合用户提供的自然语言预期描述。
     :param stats_text: string, OCR 识别出的所有属性文本
     :param expected_description: string, 用户用自然语言描述的预期属性 (例如："我想要所有元素抗性大于等于8，并且有法术伤害词缀")
     :param llm_model: string, 用于判断的 DashScope 文本模型名称 (例如 'qwen-turbo', 'qwen-plus', 'qwen-max')
-    :return: boolean, True 表示符合预期，False 表示不符合或判断出错
+    :return: True 表示符合预期，False 表示不符合，None 表示判断出错（调用方按不满足处理，不缓存）
     """
     if not stats_text:
         logging.warning("检查属性时，输入的 OCR 文本为空。")
@@ -129,42 +407,53 @@ def check_expected_stats_with_llm(stats_text, expected_description, llm_model='q
         return True # 如果没有预期，则认为满足
 
     try:
-        # 构造发送给 LLM 的提示词 (Prompt)
-        prompt = (
-            f"你是一位专业的《流放之路》(Path of Exile) 装备属性分析员。\n\n"
-            f"请仔细阅读以下信息并严格按照指令回答：\n\n"
-            f"**装备属性文本:**\n{stats_text}\n\n"
-            f"**用户预期描述:**\n{expected_description}\n\n"
-            f"请根据装备属性文本，判断该装备是否**完全满足**用户的预期描述。\n\n"
-            f"**判断规则:**\n"
-            f"- 必须满足预期描述中的**所有**明确要求。\n"
-            f"- 如果预期描述中有量化的要求（如“大于等于8”），必须严格遵守。\n"
-            f"- 如果预期描述中有定性的要求（如“有法术伤害词缀”），只要属性文本中能找到相关表述即可。\n"
-            f"- 如果有任何一项要求不满足，则判定为不满足。\n\n"
-            f"**你的回答只能是以下两种之一，且必须严格遵守格式：**\n"
-            f"- **满足**\n"
-            f"- **不满足**\n\n"
-            f"请开始你的判断："
-        )
-
-        logging.info(f"正在调用 DashScope 文本模型 ({llm_model}) 进行属性判断...")
-        logging.debug(f"发送给 LLM 的 Prompt:\n{prompt}")
+        # 构造发送给 LLM 的提示词：精简模式为系统提示词 + 词缀规范形式（见 judge_prompt.py）
+        if LLM_COMPACT_PROMPT:
+            prompt, extra = None, {"messages": judge_prompt.build_messages(stats_text, expected_description)}
+            prompt_text = judge_prompt.messages_text(extra["messages"])
+        else:
+            prompt, extra = judge_prompt.verbose_prompt(stats_text, expected_description), {}
+            prompt_text = prompt
+
+        logging.info(f"正在调用 DashScope 文本模型 ({llm_model}) 进行属性判断"
+                     f"（提示词约 {judge_prompt.estimate_tokens(prompt_text)} token）...")
+        logging.debug(f"发送给 LLM 的 Prompt:\n{prompt_text}")
+
+        if LLM_STREAM:
+            # 只留够“不满足”的 token，结果一确定就断开
+            t0 = time.perf_counter()
+            verdict, scanner, error = llm_verdict.stream_verdict(call_generation_stream(
+                llm_model, prompt, max_tokens=llm_verdict.VERDICT_MAX_TOKENS, temperature=0.0, top_p=0.9, seed=12345,
+                **extra))
+            if error is not None:
+                logging.error(f"LLM 判断 API 调用失败: 状态码 {error.status_code}, 错误代码 {getattr(error, 'code', 'N/A')}, 信息: {getattr(error, 'message', 'N/A')}")
+                return None
+            logging.info(f"LLM 判断结果: {scanner.text.strip()}（流式 {scanner.chunks} 段，"
+                         f"出结果用时 {(time.perf_counter() - t0) * 1000:.0f}ms）")
+            if verdict is None:
+                logging.warning(f"LLM 返回了无法解析的结果: '{scanner.text}'。默认判定为不满足。")
+                return None
+            logging.info("🎉 LLM 判断结果：装备属性符合预期！" if verdict else "😞 LLM 判断结果：装备属性不符合预期。")
+            return verdict
 
         # 调用 DashScope 文本生成 API
-        response = Generation.call(
-            model=llm_model,
-            prompt=prompt,
+        t0 = time.perf_counter()
+        response = call_generation(
+            llm_model,
+            prompt,
             # 可以设置一些参数来控制输出，例如：
             max_tokens=100, # 回复很短，限制 token 数
             temperature=0.0, # 设置为 0 使输出更确定性和一致
             top_p=0.9,
-            seed=12345 # 固定种子以增加可重复性
+            seed=12345, # 固定种子以增加可重复性
+            **extra
         )
 
         # 解析响应
         if response.status_code == 200:
             llm_output = response.output.text.strip()
-            logging.info(f"LLM 判断结果: {llm_output}")
+            logging.info(f"LLM 判断结果: {llm_output}（用时 {(time.perf_counter() - t0) * 1000:.0f}ms，"
+                         f"输入 {response.usage.get('input_tokens', '?')} token）")
             logging.debug(f"LLM 完整回复: {response}")
 
             # 严格匹配 LLM 的输出
@@ -176,14 +465,14 @@ def check_expected_stats_with_llm(stats_text, expected_description, llm_model='q
                  return False
             else:
                  logging.warning(f"LLM 返回了无法解析的结果: '{llm_output}'。默认判定为不满足。")
-                 return False
+                 return None
         else:
             logging.error(f"LLM 判断 API 调用失败: 状态码 {response.status_code}, 错误代码 {getattr(response, 'code', 'N/A')}, 信息: {getattr(response, 'message', 'N/A')}")
-            return False
+            return None
 
     except Exception as e:
         logging.error(f"使用 LLM 判断属性时发生错误: {e}", exc_info=True)
-        return False
+        return None
 
 
 def click_at_coordinates(x, y, button='left', clicks=1, interval=0.0, duration=0.0, tween=pyautogui.linear, log_action="点击"):
@@ -218,7 +507,7 @@ def process_item_and_equipment(item_coords, equipment_coords, delay_between_acti
     :param item_coords: 元组 (x, y)，表示物品图标的屏幕坐标 (将被右键点击)
     :param equipment_coords: 元组 (x, y)，表示装备图标的屏幕坐标 (将被左键点击)
     :param delay_between_actions: 两次点击之间的延迟（秒）
-    :param expected_description: string, 用户用自然语言描述的预期属性
+    :param expected_description: string, 预期属性规则（或自然语言描述，回退 LLM 判断）
     :param stats_panel_region: 用于 OCR 的属性面板区域 (left, top, width, height)
     :param llm_model_for_judgment: 用于判断属性是否满足的 LLM 模型名称
     :return: Boolean - 是否满足预期属性
@@ -235,11 +524,14 @@ def process_item_and_equipment(item_coords, equipment_coords, delay_between_acti
         log_action="右键点击物品坐标"
     )
 
+    # 从右键点击完成时刻起算，日志等处理不额外拉长间隔
+    action_deadline = now_ns() + int(delay_between_actions * 1e9)
+
     if not item_success:
         logging.error("流程中断：未能右键点击物品坐标。")
         return False
 
-    time.sleep(delay_between_actions)
+    ACTION_TIMER.wait_until(action_deadline)
 
     # 第二步：左键点击装备坐标
     equipment_success = click_at_coordinates(
@@ -248,27 +540,57 @@ def process_item_and_equipment(item_coords, equipment_coords, delay_between_acti
         log_action="左键点击装备坐标"
     )
 
+    panel_deadline = now_ns() + 100_000_000
+
     if not equipment_success:
         logging.error("流程中断：未能左键点击装备坐标。")
         return False
 
     # 等待属性面板出现
     logging.info("等待属性面板显示...")
-    time.sleep(0.1)
+    ACTION_TIMER.wait_until(panel_deadline)
 
     # 从属性面板区域提取文本
     if stats_panel_region is None:
         logging.error("错误：未指定属性面板区域 (stats_panel_region)。")
         return False
 
-    stats_text = extract_text_from_region(stats_panel_region)
+    screenshot = None
+    check = None
+    pf = get_prefilter(expected_description)
+    if pf is not None:
+        left, top, width, height = stats_panel_region
+        screenshot = ImageGrab.grab(bbox=(left, top, left + width, top + height))
+        t0 = time.perf_counter()
+        check = pf.check(np.asarray(screenshot.convert("RGB")))
+        logging.info(f"本地预筛: {'排除' if check['decision'] == 'reject' else '提交远程'}（{check['reason']}"
+                     f"{'，抽检' if check['audit'] else ''}），用时 {(time.perf_counter() - t0) * 1000:.1f}ms")
+        if check["decision"] == "reject":
+            pf.report(check)
+            logging.info("⏭️ 本地预筛排除，跳过远程 OCR 和判断，继续循环。")
+            return False
+
+    t_remote = time.perf_counter()
+    is_match = None
+    if use_combined_judge(expected_description):
+        stats_text, is_match = extract_and_judge(stats_panel_region, expected_description, screenshot)
+    else:
+        stats_text = extract_text_from_region(stats_panel_region, screenshot)
     if not stats_text:
          logging.warning("未能从属性面板区域提取到任何文本。")
+         if check is not None:
+             pf.report(check, cost=time.perf_counter() - t_remote)
          return False
 
-    # 使用 LLM 判断是否符合预期
+    # 按规则本地判断（无法编译时回退 LLM）
     if expected_description:
-        is_match = check_expected_stats_with_llm(stats_text, expected_description, llm_model=llm_model_for_judgment)
+        if is_match is None:
+            is_match = check_expected_stats(stats_text, expected_description, llm_model=llm_model_for_judgment)
+        if check is not None:
+            pf.learn(check["rows"], mod_parser.parse(stats_text))
+            if pf.report(check, cost=time.perf_counter() - t_remote, verdict=is_match):
+                logging.warning(f"⚠️ 本地预筛误排除：抽检结果满足预期（{check['reason']}），"
+                                f"请检查 PREFILTER_TEMPLATES / PREFILTER_THRESHOLD")
         if is_match:
             logging.info("🎉 装备属性符合预期！停止循环。")
             return True
@@ -305,12 +627,11 @@ def main():
     DELAY_BETWEEN_ACTIONS = 0.3 # 两次点击间的延迟
     DELAY_BETWEEN_CYCLES = 0.3 # 循环周期延迟
 
-    # === 定义预期的属性 (自然语言描述) ===
-    # 请用清晰、具体的中文描述你想要的属性
-    EXPECTED_DESCRIPTION = """
-    装备必须满足以下条件之一：
-    2. 出现投射物技能的等级+3
-    """ # <--- 请修改为你自己的预期描述
+    # === 定义预期的属性 ===
+    # 推荐写成规则（本地判断，见 rule_engine.py），例如：
+    #   "投射物技能等級 >= 3 或 (火抗 >= 30 且 生命 >= 80)"
+    # 也可以写自然语言描述，此时由 LLM 判断（RULE_LLM_FALLBACK 为 True 时）
+    EXPECTED_DESCRIPTION = "投射物技能等級 >= 3" # <--- 请修改为你自己的预期
 
     # 定义属性面板的 OCR 区域 (left, top, width, height) - 请务必修改这个值 !!!
     STATS_PANEL_REGION = (1915, 837, 355, 170) # <--- 请务必修改为实际区域 !!!
@@ -334,6 +655,15 @@ def main():
     else:
         logging.info("预期属性描述: 未设置 (跳过属性检查)")
     logging.info(f"OCR 区域: {STATS_PANEL_REGION}")
+    logging.info(f"OCR 引擎: {OCR_ENGINE}")
+    logging.info(f"本地预筛: {'开启' if PREFILTER_ENABLED else '关闭'}（模板 {len(PREFILTER_TEMPLATES)} 个，抽检 {PREFILTER_AUDIT_RATE:.0%}）")
+    if EXPECTED_DESCRIPTION:
+        try:
+            rule_engine.compile_rule(EXPECTED_DESCRIPTION)
+            logging.info("判断方式: 规则（本地判断）")
+        except rule_engine.RuleError as e:
+            mode = f"图文一次判断 ({COMBINED_JUDGE_MODEL})" if use_combined_judge(EXPECTED_DESCRIPTION) else "LLM"
+            logging.info(f"判断方式: {mode}（预期描述不是规则: {e}）")
     logging.info(f"用于判断的 LLM 模型: {LLM_MODEL_FOR_JUDGMENT}")
     logging.info("================================")
     print("请在 5 秒内切换到 PoE 游戏窗口...")
@@ -341,7 +671,11 @@ def main():
     # -----------------
 
     # --- API Key 检查 ---
-    if not dashscope.api_key or dashscope.api_key == "YOUR_ACTUAL_API_KEY_HERE":
+    if DASHSCOPE_BASE_URL is not None:
+        # SDK 也走同一地址（替身服务不校验 API Key）
+        dashscope.base_http_api_url = DASHSCOPE_BASE_URL
+        logging.info(f"DashScope 地址: {DASHSCOPE_BASE_URL}（客户端: {DASHSCOPE_CLIENT}）")
+    elif not dashscope.api_key or dashscope.api_key == "YOUR_ACTUAL_API_KEY_HERE":
         logging.critical("启动失败: 未找到有效的 API Key。请通过环境变量 DASHSCOPE_API_KEY 或在代码中设置 dashscope.api_key。")
         sys.exit(1)
     else:
@@ -386,6 +720,8 @@ def main():
                 else:
                     logging.info("本次循环未找到满足条件的装备。")
 
+                log_cache_stats()
+                log_prefilter_stats()
                 logging.info(f"--- 第 {cycle_count} 次循环结束 ---")
                 time.sleep(DELAY_BETWEEN_CYCLES)
 
@@ -399,6 +735,16 @@ def main():
     except Exception as e:
         logging.critical(f"程序运行时发生未处理的异常: {e}", exc_info=True)
         sys.exit(1)
+    finally:
+        logging.info(ACTION_TIMER.format_stats())
+        log_cache_stats()
+        log_prefilter_stats()
+        for cache in _caches.values():
+            if cache is not None:
+                cache.close()
+        if _client["pooled"] is not None:
+            logging.info(_client["pooled"].format_stats())
+            _client["pooled"].close()
 
 # ======================================================
 
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+离线阈值调优（MAIN_THRESHOLD / TIER_THRESHOLD）
+1. 对标注好的属性区域截图，每帧、每个主词条模板只算一次匹配得分（多进程并行）：
+   主词条得分 + 该模板最佳位置右侧整行的T阶图标得分，与 ReforgeEngine 的判定方式一致。
+2. 在阈值网格上向量化扫描整个数据集，得到每个模板的精确率 / 召回率 / ROC 曲线。
+3. 按 F-beta 最大给出每个模板推荐的主词条阈值和T阶阈值。
+
+标注文件（CSV，UTF-8）：
+    file,template,tier
+    shot_001.png,lightning.png,1
+    shot_002.png,,0
+file 相对标注文件所在目录；template 为主词条模板文件名（空表示没有任何目标主词条）；
+tier 为该行右侧是否有T阶图标。
+也可以直接用 frame_corpus 语料的帧，但标注必须另给人工标注的 CSV（file 写帧下标），只评估 CSV 中的帧——
+索引里的模板与判定是引擎按当前阈值自己做出的，拿它当真值调出来的阈值只会复现当前阈值。
+
+用法：
+    python threshold_tuner.py --labels labels.csv --main a.png --main b.png --tier t1.png --out tune_report
+    python threshold_tuner.py --corpus reforge_corpus/355x170 --corpus-labels frames.csv --main a.png --tier t1.png
+"""
+
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from reforge_engine import preprocess_image, load_and_preprocess_template
+
+DEFAULT_GRID = np.round(np.arange(0.50, 1.0001, 0.005), 3)
+
+# ==================== 得分计算（工作进程） ====================
+_worker = {}
+
+
+def _init_worker(main_template_paths, tier_template_path, corpus_dir):
+    cv2.setNumThreads(1)  # 进程级并行，避免 OpenCV 内部线程争用
+    _worker["mains"] = [load_and_preprocess_template(p) for p in main_template_paths]
+    _worker["tier"] = load_and_preprocess_template(tier_template_path)
+    _worker["frames"] = None
+    if corpus_dir:
+        from frame_corpus import CorpusReader
+        _worker["frames"] = CorpusReader(corpus_dir).frames
+
+
+def _load_frame(item):
+    if isinstance(item, str):
+        from cache_manager import load_cached_image
+        return load_cached_image(item)
+    return _worker["frames"][item]
+
+
+def score_frame(screen_gray, main_templates, tier_template):
+    """返回 (各模板主词条得分, 各模板最佳位置右侧的T阶得分)"""
+    n = len(main_templates)
+    main_scores = np.full(n, -1.0, dtype=np.float32)
+    tier_scores = np.full(n, -1.0, dtype=np.float32)
+    h_scr, w_scr = screen_gray.shape
+    h_tier, w_tier = tier_template.shape
+    for t, template in enumerate(main_templates):
+        h_main, w_main = template.shape
+        if h_main > h_scr or w_main > w_scr:
+            continue
+        res = cv2.matchTemplate(screen_gray, template, cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, (x_main, y_main) = cv2.minMaxLoc(res)
+        main_scores[t] = max_val
+        region = screen_gray[y_main:y_main + h_main, x_main + w_main:w_scr]
+        if region.shape[0] >= h_tier and region.shape[1] >= w_tier:
+            res_tier = cv2.matchTemplate(region, tier_template, cv2.TM_CCOEFF_NORMED)
+            tier_scores[t] = cv2.minMaxLoc(res_tier)[1]
+    return main_scores, tier_scores
+
+
+def _score_chunk(items):
+    mains, tier = _worker["mains"], _worker["tier"]
+    out_main = np.full((len(items), len(mains)), -1.0, dtype=np.float32)
+    out_tier = np.full((len(items), len(mains)), -1.0, dtype=np.float32)
+    for i, item in enumerate(items):
+        img = _load_frame(item)
+        if img is None:
+            continue
+        out_main[i], out_tier[i] = score_frame(preprocess_image(np.asarray(img)), mains, tier)
+    return out_main, out_tier
+
+
+def compute_scores(items, main_template_paths, tier_template_path, corpus_dir=None, workers=None, chunk=64):
+    """
+    并行计算所有帧的得分矩阵。
+    :param items: 图片路径列表，或语料帧下标列表（需传 corpus_dir）
+    :return: (main_scores[N, T], tier_scores[N, T])，无法计算的为 -1
+    """
+    chunks = [items[i:i + chunk] for i in range(0, len(items), chunk)]
+    init_args = (list(main_template_paths), tier_template_path, corpus_dir)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init_args) as pool:
+        results = list(pool.map(_score_chunk, chunks))
+    if not results:
+        n_t = len(main_template_paths)
+        return np.zeros((0, n_t), np.float32), np.zeros((0, n_t), np.float32)
+    return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+
+# ==================== 向量化阈值扫描 ====================
+def sweep(scores, positives, grid=DEFAULT_GRID, valid=None):
+    """
+    :param scores: [N, T] 得分
+    :param positives: [N, T] 布尔真值
+    :param valid: [N, T] 参与统计的样本掩码（默认全部）
+    :return: 字典，每项为 [G, T] 数组：tp/fp/fn/tn/precision/recall/fpr
+    """
+    scores = np.asarray(scores, dtype=np.float32)
+    positives = np.asarray(positives, dtype=bool)
+    if valid is None:
+        valid = np.ones_like(positives)
+    pos = positives & valid
+    neg = ~positives & valid
+    pred = scores[None, :, :] >= np.asarray(grid, dtype=np.float32)[:, None, None]  # [G, N, T]
+    tp = np.count_nonzero(pred & pos[None], axis=1)
+    fp = np.count_nonzero(pred & neg[None], axis=1)
+    fn = pos.sum(axis=0)[None, :] - tp
+    tn = neg.sum(axis=0)[None, :] - fp
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 1.0)
+        recall = np.where(tp + fn > 0, tp / (tp + fn), 0.0)
+        fpr = np.where(fp + tn > 0, fp / (fp + tn), 0.0)
+    return {"tp": tp, "fp": fp, "fn": fn, "tn": tn,
+            "precision": precision, "recall": recall, "fpr": fpr}
+
+
+def recommend(curves, grid=DEFAULT_GRID, beta=1.0):
+    """每个模板取 F-beta 最大的阈值；并列时取最大的阈值（更保守）"""
+    p, r = curves["precision"], curves["recall"]
+    b2 = beta * beta
+    with np.errstate(divide="ignore", invalid="ignore"):
+        f = np.where(b2 * p + r > 0, (1 + b2) * p * r / (b2 * p + r), 0.0)
+    g = f.shape[0]
+    best = g - 1 - np.argmax(f[::-1], axis=0)
+    cols = np.arange(f.shape[1])
+    return np.asarray(grid)[best], f[best, cols], p[best, cols], r[best, cols]
+
+
+def roc_auc(curves):
+    """各模板 ROC 曲线下面积（阈值网格上的梯形积分）"""
+    # 阈值升高时 FPR、TPR 都单调不增，倒序即为从 (0,0) 到 (1,1) 的曲线顺序
+    fpr, tpr = curves["fpr"][::-1], curves["recall"][::-1]
+    n_t = fpr.shape[1]
+    fpr_s = np.vstack([np.zeros((1, n_t)), fpr, np.ones((1, n_t))])
+    tpr_s = np.vstack([np.zeros((1, n_t)), tpr, np.ones((1, n_t))])
+    return np.sum(np.diff(fpr_s, axis=0) * (tpr_s[1:] + tpr_s[:-1]) / 2, axis=0)
+
+
+# ==================== 标注加载 ====================
+def load_labels_csv(path, template_names):
+    """读取标注 CSV，返回 (file 列表, 模板下标数组(-1 表示无), T阶标签数组)"""
+    name_to_id = {name: i for i, name in enumerate(template_names)}
+    base = os.path.dirname(os.path.abspath(path))
+    files, tpl, tier = [], [], []
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f):
+            name = (row.get("template") or "").strip()
+            if name and name not in name_to_id:
+                raise ValueError(f"标注中的模板 {name} 不在 --main 列表中")
+            files.append(row["file"].strip())
+            tpl.append(name_to_id[name] if name else -1)
+            tier.append(str(row.get("tier", "0")).strip() in ("1", "true", "True", "yes"))
+    return files, np.asarray(tpl, dtype=np.int32), np.asarray(tier, dtype=bool), base
+
+
+def load_corpus_labels(corpus_dir, template_names, labels_csv):
+    """
+    语料标注：人工标注的 CSV（file 为帧下标），只返回 CSV 中的帧。
+    不使用索引里的模板与判定——那是引擎自己的输出，用作真值是循环论证。
+    """
+    from frame_corpus import CorpusReader
+    if not labels_csv:
+        raise ValueError("语料调优需要人工标注的 CSV（--corpus-labels）：索引中的判定来自引擎本身，不能作为真值")
+    n = len(CorpusReader(corpus_dir))
+    files, tpl, tier, _ = load_labels_csv(labels_csv, template_names)
+    items = [int(f) for f in files]
+    bad = [i for i in items if not 0 <= i < n]
+    if bad:
+        raise ValueError(f"标注中的帧下标超出语料范围（共 {n} 帧）: {bad[:5]}")
+    return items, tpl, tier
+
+
+# ==================== 主流程 ====================
+def tune(items, label_tpl, label_tier, main_template_paths, tier_template_path,
+         corpus_dir=None, grid=DEFAULT_GRID, beta=1.0, workers=None):
+    names = [os.path.basename(p) for p in main_template_paths]
+    t0 = time.perf_counter()
+    main_scores, tier_scores = compute_scores(items, main_template_paths, tier_template_path,
+                                              corpus_dir=corpus_dir, workers=workers)
+    t_score = time.perf_counter() - t0
+
+    t1 = time.perf_counter()
+    n, n_t = main_scores.shape
+    main_pos = label_tpl[:, None] == np.arange(n_t)[None, :]
+    main_curves = sweep(main_scores, main_pos, grid)
+    main_thr, main_f, main_p, main_r = recommend(main_curves, grid, beta)
+    main_auc = roc_auc(main_curves)
+
+    # T阶只在该模板确实是目标主词条的帧上评估
+    tier_pos = main_pos & label_tier[:, None]
+    tier_curves = sweep(tier_scores, tier_pos, grid, valid=main_pos)
+    tier_thr, tier_f, tier_p, tier_r = recommend(tier_curves, grid, beta)
+    tier_auc = roc_auc(tier_curves)
+    t_sweep = time.perf_counter() - t1
+
+    report = {
+        "frames": int(n),
+        "score_seconds": t_score,
+        "sweep_seconds": t_sweep,
+        "beta": beta,
+        "templates": [],
+    }
+    for t, name in enumerate(names):
+        report["templates"].append({
+            "template": name,
+            "positives": int(main_pos[:, t].sum()),
+            "main_threshold": float(main_thr[t]), "main_f": float(main_f[t]),
+            "main_precision": float(main_p[t]), "main_recall": float(main_r[t]), "main_auc": float(main_auc[t]),
+            "tier_positives": int(tier_pos[:, t].sum()),
+            "tier_threshold": float(tier_thr[t]), "tier_f": float(tier_f[t]),
+            "tier_precision": float(tier_p[t]), "tier_recall": float(tier_r[t]), "tier_auc": float(tier_auc[t]),
+        })
+    return report, main_curves, tier_curves, names
+
+
+def write_outputs(out_prefix, report, main_curves, tier_curves, names, grid=DEFAULT_GRID):
+    """写出 JSON 报告和曲线 CSV（matplotlib 可用时另存 ROC/PR 图）"""
+    with open(out_prefix + ".json", "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    with open(out_prefix + "_curves.csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["stage", "template", "threshold", "precision", "recall", "fpr", "tp", "fp", "fn", "tn"])
+        for stage, curves in (("main", main_curves), ("tier", tier_curves)):
+            for t, name in enumerate(names):
+                for g, thr in enumerate(grid):
+                    writer.writerow([stage, name, f"{thr:.3f}",
+                                     f"{curves['precision'][g, t]:.4f}", f"{curves['recall'][g, t]:.4f}",
+                                     f"{curves['fpr'][g, t]:.4f}", int(curves['tp'][g, t]), int(curves['fp'][g, t]),
+                                     int(curves['fn'][g, t]), int(curves['tn'][g, t])])
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("⚠️ 未安装 matplotlib，跳过曲线图（pip install matplotlib）")
+        return
+    fig, axes = plt.subplots(2, 2, figsize=(10, 8))
+    for row, (stage, curves) in enumerate((("main", main_curves), ("tier", tier_curves))):
+        for t, name in enumerate(names):
+            axes[row][0].plot(curves["fpr"][:, t], curves["recall"][:, t], label=name)
+            axes[row][1].plot(curves["recall"][:, t], curves["precision"][:, t], label=name)
+        axes[row][0].set_title(f"{stage} ROC")
+        axes[row][0].set_xlabel("FPR")
+        axes[row][0].set_ylabel("TPR")
+        axes[row][1].set_title(f"{stage} PR")
+        axes[row][1].set_xlabel("recall")
+        axes[row][1].set_ylabel("precision")
+        axes[row][1].legend(fontsize=7)
+    fig.tight_layout()
+    fig.savefig(out_prefix + "_curves.png")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="主词条 / T阶阈值离线调优")
+    src = parser.add_mutually_exclusive_group(required=True)
+    src.add_argument("--labels", help="标注 CSV（file,template,tier）")
+    src.add_argument("--corpus", help="frame_corpus 语料目录")
+    parser.add_argument("--corpus-labels", help="语料的人工标注 CSV（file 为帧下标），--corpus 时必填")
+    parser.add_argument("--main", action="append", required=True, help="主词条模板（可多次）")
+    parser.add_argument("--tier", required=True, help="T阶图标模板")
+    parser.add_argument("--beta", type=float, default=1.0, help="F-beta 的 beta，>1 更看重召回（少错过好词条）")
+    parser.add_argument("--workers", type=int, default=None, help="进程数（默认 CPU 核数）")
+    parser.add_argument("--out", default="threshold_report", help="输出文件前缀")
+    args = parser.parse_args()
+    if args.corpus and not args.corpus_labels:
+        parser.error("--corpus 需要 --corpus-labels：语料索引中的判定来自引擎本身，不能作为调优的真值")
+
+    names = [os.path.basename(p) for p in args.main]
+    if args.labels:
+        files, label_tpl, label_tier, base = load_labels_csv(args.labels, names)
+        items = [f if os.path.isabs(f) else os.path.join(base, f) for f in files]
+        corpus_dir = None
+    else:
+        items, label_tpl, label_tier = load_corpus_labels(args.corpus, names, args.corpus_labels)
+        corpus_dir = args.corpus
+
+    report, main_curves, tier_curves, names = tune(
+        items, label_tpl, label_tier, args.main, args.tier,
+        corpus_dir=corpus_dir, beta=args.beta, workers=args.workers)
+    write_outputs(args.out, report, main_curves, tier_curves, names)
+
+    print(f"📊 {report['frames']} 帧 | 得分计算 {report['score_seconds']:.2f}s | 阈值扫描 {report['sweep_seconds'] * 1000:.1f}ms")
+    for t in report["templates"]:
+        print(f"  {t['template']}: 主词条阈值 {t['main_threshold']:.3f} (P={t['main_precision']:.3f} R={t['main_recall']:.3f} AUC={t['main_auc']:.3f})"
+              f" | T阶阈值 {t['tier_threshold']:.3f} (P={t['tier_precision']:.3f} R={t['tier_recall']:.3f} AUC={t['tier_auc']:.3f})")
+    print(f"💾 已保存 {args.out}.json / {args.out}_curves.csv")
+
+
+if __name__ == "__main__":
+    main()